@@ -1,7 +1,9 @@
+import copy
 import time
 import queue
 import threading
-from collections import deque
+from timeit import default_timer
+from collections import deque, defaultdict
 
 from model import BaseRobot
 from movement import Movement
@@ -43,11 +45,25 @@ class RobotControl(BaseRobot):
 
         # the AI function response set
         self.movement_funct = movement_funct
+        # message type -> response function of the movement,
+        # built by setup_movement
+        self._dispatch = dict()
+        self._default_response = None
+        self.setup_movement(movement_funct)
+
+        # Optional statistics over the processed messages.
+        self.message_stats = None
+
+        # Optional decoder for delta messages, see delta_protocol module.
+        self.delta_decoder = None
 
         # basic communication interfaces
         self._sensor_queue = queue.Queue()
         self.gun_interface = None
 
+        # Without own thread, every message is processed on arrival.
+        self.synchronous = False
+
         # Communication tools:
         # --------------------
         # auto-resync of the robot.
@@ -66,8 +82,16 @@ class RobotControl(BaseRobot):
     # AI supervision:
     # ===============
 
-    def run(self):
-        """Start the AI calculation thread."""
+    def run(self, threaded=True):
+        """Start the AI calculation thread.
+        If threaded is False, don't start a thread:
+        Every message will be processed immediately on arrival instead,
+        for example by a headless simulation.
+        """
+        if not threaded:
+            self.synchronous = True
+            return
+
         t = threading.Thread(target=self._thread_action,
                              args=(self._sensor_queue,))
         t.daemon = True
@@ -82,19 +106,30 @@ class RobotControl(BaseRobot):
                 time.sleep(0)
                 continue
 
-            # auto-resync example feature
-            # ADD: Here you can add more complex resyn behaviour.
-            if self.resync_flag and self.resync_check(signal):
-                continue
+            self.handle_signal(signal)
 
-            # use your BRAIN!
-            self.process_data(signal)
+    def handle_signal(self, signal):
+        """Process a single message sent by the server."""
 
-            # Example memory policy:
-            # right now, every ALERT-message gets memorized.
-            # ADD: Here you can add more complex memory policies.
-            if signal.message_type == SensorData.ALERT_STRING:
-                self.memorize(signal)
+        # reconstruct full messages from delta messages
+        if self.delta_decoder is not None:
+            signal = self.delta_decoder.decode(signal)
+            if signal is None:
+                return
+
+        # auto-resync example feature
+        # ADD: Here you can add more complex resyn behaviour.
+        if self.resync_flag and self.resync_check(signal):
+            return
+
+        # use your BRAIN!
+        self.process_data(signal)
+
+        # Example memory policy:
+        # right now, every ALERT-message gets memorized.
+        # ADD: Here you can add more complex memory policies.
+        if signal.message_type == SensorData.ALERT_STRING:
+            self.memorize(signal)
 
     def process_data(self, signal):
         """
@@ -103,17 +138,16 @@ class RobotControl(BaseRobot):
         Forward non-control data to the AI thread.
         """
 
-        dicc = {SensorData.POSITION_STRING: self.movement_funct.position,
-                SensorData.VISION_STRING: self.movement_funct.vision,
-                SensorData.ALERT_STRING: self.movement_funct.alert}
-
         t = signal.message_type
-        funct = self.movement_funct.default
+        funct = self._dispatch.get(t, self._default_response)
 
-        if t in dicc:
-            funct = dicc[t]
+        if self.message_stats is None:
+            self.a, self.a_alpha = funct(signal.data, self)
+            return
 
+        start = default_timer()
         self.a, self.a_alpha = funct(signal.data, self)
+        self.message_stats.record(t, default_timer() - start)
 
     # Data communication path to the server:
     # ======================================
@@ -125,7 +159,10 @@ class RobotControl(BaseRobot):
         if self.resync_flag:
             self.resync_data = data.time_stamp
 
-        self._sensor_queue.put(data)
+        if self.synchronous:
+            self.handle_signal(data)
+        else:
+            self._sensor_queue.put(data)
 
     # Control interface for the server:
     # ==========================================
@@ -140,11 +177,57 @@ class RobotControl(BaseRobot):
         self.destination = None
 
     def setup_movement(self, movement):
+        """Set the movement AI and look up its response functions
+        for every message type."""
         self.movement_funct = movement
 
+        default = movement.default
+        self._dispatch = {message_type: getattr(movement, name, default)
+                          for message_type, name
+                          in SensorData.RESPONSE_NAMES.items()}
+        self._default_response = default
+
+    def enable_message_stats(self, value=True):
+        """Count the processed messages and measure the time the AI
+        needs for them, per message type. See MessageStats."""
+        self.message_stats = MessageStats() if value else None
+
     def setup_gun_interface(self, gun_interface):
         self.gun_interface = gun_interface
 
+    def setup_delta_decoder(self, delta_decoder):
+        self.delta_decoder = delta_decoder
+
+    # State snapshots:
+    # ================
+
+    def snapshot(self):
+        """Return a copy of the AI's state.
+        This includes the state of the movement object.
+        Messages not yet processed by the AI thread are not included.
+        """
+        return dict(a=self.a, a_alpha=self.a_alpha,
+                    destination=copy.deepcopy(self.destination),
+                    memory=copy.deepcopy(list(self.memory)),
+                    resync_flag=self.resync_flag,
+                    resync_data=self.resync_data,
+                    movement=copy.deepcopy(self.movement_funct))
+
+    def restore(self, state):
+        """Set the AI's state to a state returned by snapshot.
+        Unprocessed messages are dropped."""
+        self.clear_input()
+        if self.delta_decoder is not None:
+            self.delta_decoder.reset()
+
+        self.a = state['a']
+        self.a_alpha = state['a_alpha']
+        self.destination = copy.deepcopy(state['destination'])
+        self.memory = deque(copy.deepcopy(state['memory']))
+        self.resync_flag = state['resync_flag']
+        self.resync_data = state['resync_data']
+        self.setup_movement(copy.deepcopy(state['movement']))
+
     # Gun management interface for the AI:
     # ====================================
 
@@ -154,6 +237,13 @@ class RobotControl(BaseRobot):
             return self.gun_interface.is_reloading()
         return False
 
+    def reload_remaining_ticks(self):
+        """Return the number of server ticks until the gun can fire again,
+        0 if it is ready."""
+        if self.gun_interface:
+            return self.gun_interface.reload_remaining_ticks()
+        return 0
+
     def is_shooting(self):
         """Return True if robot will already shoot at the next server tick."""
         if self.gun_interface:
@@ -196,10 +286,42 @@ class SensorData:
     POSITION_STRING = 'position'
     VISION_STRING = 'vision'
     ALERT_STRING = 'alert'
+    ENCODED_VISION_STRING = 'encoded_vision'
     IGNORE_STRING = 'ignore'
+    # Delta messages are turned into full messages by the RobotControl.
+    VISION_DELTA_STRING = 'vision_delta'
+    POSITION_DELTA_STRING = 'position_delta'
+
+    # Names of the movement's response functions for the message types.
+    # Other message types are answered by the default function.
+    # ADD: Here you can add the response of a new message type!
+    RESPONSE_NAMES = {POSITION_STRING: 'position',
+                      VISION_STRING: 'vision',
+                      ALERT_STRING: 'alert',
+                      ENCODED_VISION_STRING: 'encoded_vision'}
 
     def __init__(self, message_type: str, data, time_stamp):
 
         self.message_type = message_type
         self.data = data
         self.time_stamp = time_stamp
+
+
+class MessageStats:
+    """Counts processed messages and the time spent on them
+    per message type."""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def record(self, message_type, seconds):
+        self.counts[message_type] += 1
+        self.times[message_type] += seconds
+
+    def summary(self):
+        """Return (message type, count, total seconds, mean seconds)
+        for every message type, most expensive first."""
+        rows = [(t, self.counts[t], self.times[t],
+                 self.times[t] / self.counts[t]) for t in self.counts]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
@@ -0,0 +1,203 @@
+import os
+import asyncio
+
+from remote_control import (RemoteControl, RemoteServer, SOCKET_PATH,
+                            HEADER, HELLO_FRAME, WELCOME_FRAME,
+                            REJECT_FRAME, SENSOR_FRAME, ACTION_FRAME,
+                            encode_welcome)
+from simulation import Simulation
+import utils
+
+# ==================================
+# Async Server
+# ==================================
+#
+# In this file, you will find the asyncio mode of the headless server:
+# The tick loop, the timers of the game, the connections of remote AIs
+# and listeners like spectator streams run on one event loop
+# in one thread, instead of one thread per AI, timer and connection.
+# Ticks are scheduled against absolute deadlines of the loop's clock,
+# so waiting times don't add up to a drift.
+# The AIs of local robots calculate their responses in place.
+#
+# Usage (from the game folder):
+#   python -m headless --asyncio --ticks 2000
+#
+# CHANGE HERE:
+# - tick scheduling
+# - handling of slow AI connections
+# - services running on the event loop
+
+
+async def read_frame(reader):
+    """Read the next frame from a stream. Return (frame type, payload),
+    None if the stream is closed."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+        length, frame_type = HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return frame_type, payload
+
+
+def write_frame(writer, frame_type, payload=b''):
+    writer.write(HEADER.pack(len(payload), frame_type) + payload)
+
+
+class StreamConnection:
+    """Stream to a remote AI, see RemoteControl.attach_stream.
+    Messages are dropped while the AI reads slower than the server
+    writes, instead of buffering them without limit."""
+
+    BUFFER_LIMIT = 64 * 1024
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.dropped = 0
+
+    def send(self, payload):
+        transport = self.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > StreamConnection.BUFFER_LIMIT:
+            self.dropped += 1
+            return
+        write_frame(self.writer, SENSOR_FRAME, payload)
+
+    def close(self):
+        # pending messages are outdated anyway
+        self.writer.transport.abort()
+
+
+class AsyncServer:
+    """Runs a simulation in real time on an asyncio event loop
+    and serves its remote AIs.
+    Callables in tick_listeners are called with the simulation
+    after every tick. Services, like the spectator stream,
+    are started and closed together with the server."""
+
+    # If the loop is late by more ticks, it stops catching up.
+    MAX_LAG_TICKS = 5
+
+    def __init__(self, simulation, remote_socket=SOCKET_PATH):
+        self.simulation = simulation
+        self.remote_socket = remote_socket
+        self.tick_listeners = []
+        self.services = []
+
+        controls = [robot.robot_control for robot in simulation.robots]
+        self.remote = RemoteServer(remote_socket, simulation.robot_names,
+                                   controls)
+
+        # coroutines of the connected AIs
+        self._connections = set()
+
+        # number of ticks calculated, and calculated too late
+        self.ticks = 0
+        self.late_ticks = 0
+
+    def add_service(self, service):
+        """Add a service with the coroutines start() and close()
+        and the tick listener on_tick(simulation)."""
+        self.services.append(service)
+        self.tick_listeners.append(service.on_tick)
+
+    async def serve(self, ticks=None):
+        """Run the given number of ticks, forever if None."""
+        loop = asyncio.get_running_loop()
+        utils.set_timer_loop(loop)
+        self.simulation.start(threaded=False, remote_socket=None)
+
+        server = None
+        if any(isinstance(c, RemoteControl) for c in self.remote.controls):
+            if os.path.exists(self.remote_socket):
+                os.unlink(self.remote_socket)
+            server = await asyncio.start_unix_server(self._serve_ai,
+                                                     self.remote_socket)
+        try:
+            for service in self.services:
+                await service.start()
+            await self.tick_loop(ticks)
+        finally:
+            for service in self.services:
+                await service.close()
+            if server:
+                server.close()
+                if os.path.exists(self.remote_socket):
+                    os.unlink(self.remote_socket)
+            for control in self.remote.controls:
+                if isinstance(control, RemoteControl):
+                    control.detach()
+            # let the connections notice the closed streams
+            if self._connections:
+                await asyncio.wait(self._connections, timeout=1)
+            self.simulation.close()
+            utils.set_timer_loop(None)
+
+    async def tick_loop(self, ticks=None):
+        loop = asyncio.get_running_loop()
+        spt = Simulation.SECONDS_PER_TICK
+
+        deadline = loop.time()
+        while ticks is None or self.ticks < ticks:
+            self.simulation.step()
+            for listener in self.tick_listeners:
+                listener(self.simulation)
+            self.ticks += 1
+
+            deadline += spt
+            delay = deadline - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                if -delay > AsyncServer.MAX_LAG_TICKS * spt:
+                    deadline = loop.time()
+            # always give the connections a chance to run
+            await asyncio.sleep(max(delay, 0))
+
+    async def _serve_ai(self, reader, writer):
+        """Coroutine of one remote AI connection."""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            await self._handle_ai(reader, writer)
+        finally:
+            self._connections.discard(task)
+
+    async def _handle_ai(self, reader, writer):
+        frame = await read_frame(reader)
+        if frame is None or frame[0] != HELLO_FRAME:
+            writer.close()
+            return
+
+        index, control, reason = self.remote.find_control(frame[1])
+        if reason:
+            write_frame(writer, REJECT_FRAME, reason.encode('utf-8'))
+            writer.close()
+            return
+
+        write_frame(writer, WELCOME_FRAME,
+                    encode_welcome(control, index, self.remote.robot_names))
+        stream = StreamConnection(writer)
+        control.attach_stream(stream)
+
+        try:
+            while control.stream is stream:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                frame_type, payload = frame
+                if frame_type == ACTION_FRAME:
+                    control.handle_action(payload)
+        finally:
+            control.detach(stream)
+
+
+def run(simulation, ticks=None, remote_socket=SOCKET_PATH, services=()):
+    """Run the simulation on a new event loop.
+    Return the AsyncServer for its statistics."""
+    server = AsyncServer(simulation, remote_socket)
+    for service in services:
+        server.add_service(service)
+    asyncio.run(server.serve(ticks))
+    return server
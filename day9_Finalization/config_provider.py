@@ -1,12 +1,16 @@
 import os
+import pickle
+import hashlib
 import functools
 import configparser
 
-from PyQt5.QtCore import QPoint
+import numpy as np
 
 from model import BaseRobot, DataRobot
 from robogun import RoboGun
 from ai_control import RobotControl
+from delta_protocol import DeltaEncoder, DeltaDecoder
+from remote_control import RemoteControl
 from player_control import PlayerControl, ControlScheme
 import movement
 import utils
@@ -29,6 +33,9 @@ import utils
 #   - known values for complex parameters:
 #     For example: If you add a new movement,
 #     add it to the scope of the config reader!
+# - Cache of compiled configs:
+#   The level and the validated robot options are stored on disk,
+#   so matches started from the same config files skip the parsing.
 
 
 # Static configuration values:
@@ -51,6 +58,11 @@ CONFIG_FOLDER = 'configs'
 ROBOT_CONFIG = 'robots.ini'
 MAP_CONFIG = 'map.ini'
 
+# Compiled configs, see ConfigReader.compile.
+# Change the version, if the content of compiled configs changes.
+COMPILED_CONFIG_FOLDER = os.path.join(CONFIG_FOLDER, 'compiled')
+COMPILED_CONFIG_VERSION = 2
+
 # Parameters for the ConfigReader:
 # ================================
 
@@ -96,6 +108,10 @@ ROBOT_FALLBACK = {'radius': 3,
                   'alpha': 0,
                   'movement': 'Movement',
                   'alert_flag': True,
+                  'alert_period': 10,
+                  'alert_k_nearest': 0,
+                  'delta_messages': False,
+                  'remote_ai': False,
                   'gun': False,
                   'gun_bullet_speed': 12,
                   'gun_reload_speed': 1,
@@ -131,13 +147,24 @@ movement = {ROBOT_FALLBACK['movement']}
 # If True, set alert_flag automatically, if False, deny for all robots.
 # Set the value for a robot explicitly to override a flag defined this way.
 alert_flag = {ROBOT_FALLBACK['alert_flag']}
+# Number of ticks between two alert messages.
+alert_period = {ROBOT_FALLBACK['alert_period']}
+# Only tell the robot about its targets and the k nearest robots.
+# 0 means all robots.
+alert_k_nearest = {ROBOT_FALLBACK['alert_k_nearest']}
+# Send only changes of vision and position messages to the AI.
+delta_messages = {ROBOT_FALLBACK['delta_messages']}
+# Let an AI process connect over a socket instead of using the movement,
+# see remote_client module. The movement still decides about the alert
+# and encoded vision messages. Delta messages are not sent to remote AIs.
+remote_ai = {ROBOT_FALLBACK['remote_ai']}
 
 # Default robot doesn't have a gun, yet defines default values for gun.
 gun = {ROBOT_FALLBACK['gun']}
 gun_bullet_speed = {ROBOT_FALLBACK['gun_bullet_speed']}
 gun_reload_speed = {ROBOT_FALLBACK['gun_reload_speed']}
 # ADD: Add config option for gun_type here.
-# Available gun options: trigun
+# Available gun options: hitscan, spread, trigun
 gun_options = {ROBOT_FALLBACK['gun_options']}
 
 # Default robot doesn't have a player_control, yet defines default values.
@@ -296,14 +323,12 @@ class ConfigReader:
 
         return self.obstacle_array
 
-    def read_robots(self):
-
-        ConfigReader.ensure_configs_folder()
-
-        path = os.path.join(CONFIG_FOLDER, ROBOT_CONFIG)
-        if not os.path.exists(path):
-            ConfigReader.create_robot_config(path)
+    def read_robots(self, path=None):
+        """Read the robot config from path.
+        By default, use the robot config in the configs folder
+        and create it, if it doesn't exist yet."""
 
+        path = ConfigReader.robot_config_path(path)
         self.config.read(path)
 
         sect = self.config.sections()
@@ -320,10 +345,17 @@ class ConfigReader:
         if read_first:
             self.read_robots()
 
+        return ConfigReader.build_robots(self.compile_robots())
+
+    def compile_robots(self):
+        """Validate the options of the robots in the config.
+        Return a robot spec for each robot to create: plain data holding
+        the final values of its options, see build_robots.
+        Robots with invalid spawn positions are left out."""
         if not self.sections:
             return []
 
-        robo_list = []
+        specs = []
 
         for robot_name in self.sections:
 
@@ -335,108 +367,225 @@ class ConfigReader:
             if not position or self.spawn_position_invalid(radius, position):
                 continue
 
+            spec = dict(name=robot_name, radius=radius, position=position)
+
             # validate body parameters
-            a_max = self.cast_with_fallback(
+            spec['a_max'] = self.cast_with_fallback(
                 robot_name, 'a_max', float, Validators.validate_gr_eq_zero)
-            a_alpha_max = self.cast_with_fallback(
+            spec['a_alpha_max'] = self.cast_with_fallback(
                 robot_name, 'a_alpha_max', float,
                 Validators.validate_gr_eq_zero)
-            v_max = self.cast_with_fallback(
+            spec['v_max'] = self.cast_with_fallback(
                 robot_name, 'v_max', float, Validators.validate_gr_eq_zero)
-            v_alpha_max = self.cast_with_fallback(
+            spec['v_alpha_max'] = self.cast_with_fallback(
                 robot_name, 'v_alpha_max', float,
                 Validators.validate_gr_eq_zero)
-            fov_angle = self.cast_with_fallback(
+            spec['fov_angle'] = self.cast_with_fallback(
                 robot_name, 'fov_angle', float, Validators.validate_fov_angle)
-            max_life = self.cast_with_fallback(
+            spec['max_life'] = self.cast_with_fallback(
                 robot_name, 'max_life', int, Validators.validate_greater_zero)
-            respawn_timer = self.cast_with_fallback(
+            spec['respawn_timer'] = self.cast_with_fallback(
                 robot_name, 'respawn_timer', float,
                 Validators.validate_gr_eq_zero)
-            immunity_timer = self.cast_with_fallback(
+            spec['immunity_timer'] = self.cast_with_fallback(
                 robot_name, 'immunity_timer', float,
                 Validators.validate_gr_eq_zero)
-            auto_resync = self.cast_with_fallback(
+            spec['auto_resync'] = self.cast_with_fallback(
                 robot_name, 'auto_resync', ini_bool, Validators.cast_only)
 
+            # validate alert parameters
+            spec['alert_period'] = self.cast_with_fallback(
+                robot_name, 'alert_period', int,
+                Validators.validate_greater_zero)
+            spec['alert_k_nearest'] = self.cast_with_fallback(
+                robot_name, 'alert_k_nearest', int,
+                Validators.validate_gr_eq_zero)
+            spec['delta_messages'] = self.cast_with_fallback(
+                robot_name, 'delta_messages', ini_bool, Validators.cast_only)
+            spec['remote_ai'] = self.cast_with_fallback(
+                robot_name, 'remote_ai', ini_bool, Validators.cast_only)
+
             # validate additional position parameter
-            alpha = self.cast_with_fallback(
+            spec['alpha'] = self.cast_with_fallback(
                 robot_name, 'alpha', lambda s: float(s) % 360,
                 Validators.cast_only)
 
             # validate gun parameters
-            gun_exists = self.cast_with_fallback(
+            spec['gun'] = self.cast_with_fallback(
                 robot_name, 'gun', ini_bool, Validators.cast_only)
-            gun_bullet_speed = self.cast_with_fallback(
+            spec['gun_bullet_speed'] = self.cast_with_fallback(
                 robot_name, 'gun_bullet_speed', float,
                 Validators.validate_greater_zero)
-            gun_reload_speed = self.cast_with_fallback(
+            spec['gun_reload_speed'] = self.cast_with_fallback(
                 robot_name, 'gun_reload_speed', float,
                 Validators.validate_gr_eq_zero)
-            gun_options = self.assemble_gun_options(robot_name)
+            spec['gun_options'] = self.assemble_gun_options(robot_name)
 
             # validate player control parameters
-            player_control_exists = self.cast_with_fallback(
+            spec['player_control'] = self.cast_with_fallback(
                 robot_name, 'player_control', ini_bool, Validators.cast_only)
-            invasive_controls = self.cast_with_fallback(
+            spec['invasive_controls'] = self.cast_with_fallback(
                 robot_name, 'invasive_controls', ini_bool,
                 Validators.cast_only)
-            invasive_controls_turn_rate = self.cast_with_fallback(
+            spec['invasive_controls_turn_rate'] = self.cast_with_fallback(
                 robot_name, 'invasive_controls_turn_rate', float,
                 Validators.validate_gr_eq_zero)
             # key bindings
-            keys_string = self.cast_with_fallback(
+            spec['keys'] = self.cast_with_fallback(
                 robot_name, 'keys', lambda x: x, Validators.validate_keys)
-            keys = getattr(ControlScheme, keys_string)
 
-            # Finally create the robot:
-            # -------------------------
+            specs.append(spec)
+            self.robo_name_space.append(robot_name)
+
+        # after all robots are known, we can validate the movements
+        for spec in specs:
+            movement_name, option_list = self.assemble_movement(spec['name'])
+            spec['movement'] = (movement_name, option_list)
+            spec['alert_flag'] = self.assemble_alert_flag(spec['name'])
+
+        return specs
+
+    @staticmethod
+    def build_robots(specs):
+        """Create the robots described by robot specs,
+        as returned by compile_robots."""
+        robo_list = []
+        go_dictionary = RoboGun.available_gun_options()
+
+        for spec in specs:
             # first create the robot's body
-            base_robot = BaseRobot(radius, a_max, a_alpha_max,
-                                   v_max, v_alpha_max,
-                                   fov_angle, max_life,
-                                   respawn_timer, immunity_timer)
+            base_robot = BaseRobot(spec['radius'], spec['a_max'],
+                                   spec['a_alpha_max'], spec['v_max'],
+                                   spec['v_alpha_max'], spec['fov_angle'],
+                                   spec['max_life'], spec['respawn_timer'],
+                                   spec['immunity_timer'])
 
             # then create the AI controller
-            robot_control = RobotControl(base_robot)
+            remote_ai = spec['remote_ai']
+            if remote_ai:
+                robot_control = RemoteControl(base_robot)
+            else:
+                robot_control = RobotControl(base_robot)
 
             # with this, create the data representation
             data_robot = DataRobot(base_robot, robot_control)
+            data_robot.setup_alert(spec['alert_period'],
+                                   spec['alert_k_nearest'])
+            if spec['delta_messages'] and not remote_ai:
+                data_robot.setup_delta_protocol(DeltaEncoder(),
+                                                DeltaDecoder())
 
             # create and add the defined gun object
-            gun_object = RoboGun(gun_bullet_speed, gun_reload_speed)
-            for decorator in gun_options:
-                gun_object = decorator(gun_object)
+            gun_object = RoboGun(spec['gun_bullet_speed'],
+                                 spec['gun_reload_speed'])
+            for option in spec['gun_options']:
+                gun_object = go_dictionary[option](gun_object)
 
-            if gun_exists:
-                data_robot.setup_gun(gun_object)
+            if spec['gun']:
+                data_robot.setup_gun(gun_object, SECONDS_PER_TICK)
 
             # create and add the defined player control instance
-            player_control_inst = PlayerControl(data_robot, keys,
-                                                invasive_controls,
-                                                invasive_controls_turn_rate)
+            keys = getattr(ControlScheme, spec['keys'])
+            player_control_inst = PlayerControl(
+                data_robot, keys, spec['invasive_controls'],
+                spec['invasive_controls_turn_rate'])
 
-            if player_control_exists:
+            if spec['player_control']:
                 data_robot.setup_player_control(player_control_inst)
 
             # place the robot at the right position
-            pos = (position[0], position[1], alpha, 0, 0)
-            data_robot.place_robot(*pos)
+            x, y = spec['position']
+            data_robot.place_robot(x, y, spec['alpha'], 0, 0)
 
             # add the robot to the list
             robo_list.append(data_robot)
-            self.robo_name_space.append(robot_name)
 
-        # after all robots are created, we can validate and add the movements
-        for robot_name, robot in zip(self.robo_name_space, robo_list):
-            robo_movement = self.assemble_movement(robot_name)
+        # after all robots are created, we can add the movements
+        for spec, robot in zip(specs, robo_list):
+            movement_name, option_list = spec['movement']
+            robo_movement = getattr(movement, movement_name)(*option_list)
             robot.setup_movement(robo_movement)
+            robot.set_encoded_vision_flag(robo_movement.RECEIVE_ENCODED_VISION)
+            robot.alert_targets = robo_movement.alert_targets()
 
-        # now set the alert flags
-        self.set_alert_flags(robo_list)
+            # now set the alert flags
+            # the auto value is read from the movement class here,
+            # not while compiling, so that cached specs follow the code
+            if spec['alert_flag'] == 'auto':
+                robot.set_alert_flag(robo_movement.RECEIVE_ALERT)
+            elif spec['alert_flag'] is not None:
+                robot.set_alert_flag(spec['alert_flag'])
 
         return robo_list
 
+    def compile(self, level_name, robot_path=None):
+        """Return the level and the robot specs of the config files
+        as plain data: dict(level=obstacle array, robots=robot specs).
+        Compiled configs are cached in COMPILED_CONFIG_FOLDER,
+        keyed by the hashes of the files, and only compiled again,
+        when the files change."""
+        level_path = os.path.join(CONFIG_FOLDER, level_name)
+        robot_path = ConfigReader.robot_config_path(robot_path)
+        key = ConfigReader.compiled_key(level_path, robot_path)
+        cache_path = os.path.join(COMPILED_CONFIG_FOLDER, key + '.pickle')
+
+        try:
+            with open(cache_path, 'rb') as f:
+                compiled = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            compiled = None
+
+        if compiled:
+            self.obstacle_array = compiled['level']
+            self.robo_name_space = [spec['name']
+                                    for spec in compiled['robots']]
+            return compiled
+
+        self.read_level(level_name)
+        self.read_robots(robot_path)
+        compiled = dict(level=self.obstacle_array,
+                        robots=self.compile_robots())
+
+        # Write a temporary file first, since parallel matches
+        # may read the cache at the same time.
+        try:
+            os.makedirs(COMPILED_CONFIG_FOLDER, exist_ok=True)
+            temp_path = f'{cache_path}.{os.getpid()}'
+            with open(temp_path, 'wb') as f:
+                pickle.dump(compiled, f)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            # without cache, the configs are compiled every time
+            pass
+
+        return compiled
+
+    @staticmethod
+    def compiled_key(level_path, robot_path):
+        """Hash of everything a compiled config depends on:
+        the config files, the known values of the config reader
+        and the options of the movement classes."""
+        known_values = (COMPILED_CONFIG_VERSION, FIELD_SIZE, TILE_SIZE,
+                        MAX_ROBOT_COUNT, sorted(ROBOT_FALLBACK.items()),
+                        sorted(AVAILABLE_MOVEMENTS),
+                        [getattr(movement, name).OPTIONS
+                         for name in sorted(AVAILABLE_MOVEMENTS)
+                         if hasattr(movement, name)],
+                        sorted(AVAILABLE_KEY_BINDINGS),
+                        list(RoboGun.available_gun_options()))
+        key = hashlib.sha256(repr(known_values).encode('utf-8'))
+
+        for path in (level_path, robot_path):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # missing levels fall back to the example level
+                data = b''
+            key.update(hashlib.sha256(data).digest())
+
+        return key.hexdigest()
+
     def cast_with_fallback(self, section, option, type_, validation):
         section_val = self.config[section].get(option, None)
         default_val = self.config[ConfigReader.DEFAULT_SECTION].get(
@@ -496,23 +645,25 @@ class ConfigReader:
     def spawn_position_invalid(self, radius, position_tuple):
         """A spawn position is valid, if the robot defined by radius
         and position_tuple doesn't overlap with in parsed obstacle_array."""
-        center = QPoint(*position_tuple)
+        tiles = utils.generate_obstacle_list(self.obstacle_array, TILE_COUNT)
+        if not len(tiles):
+            return False
+
+        # one TILE_SIZE x TILE_SIZE rectangle for every obstacle tile
+        rects = np.empty((len(tiles), 4))
+        rects[:, :2] = tiles * TILE_SIZE
+        rects[:, 2:] = TILE_SIZE
 
-        for x in range(TILE_COUNT):
-            for y in range(TILE_COUNT):
-                if self.obstacle_array[x][y]:
-                    rect = QPoint(x * TILE_SIZE, y * TILE_SIZE)
-                    if utils.check_collision_circle_rect(center, radius, rect,
-                                                         TILE_SIZE, TILE_SIZE):
-                        return True
+        x, y = position_tuple
+        collisions = utils.check_collision_circle_rects(x, y, radius, rects)
 
-        return False
+        return bool(collisions.any())
 
     def assemble_gun_options(self, section):
         """Parse gun options string based on RoboGun.available_gun_options().
+        Return the names of the options in the order to apply them.
         We expect the fallback to exist and to be valid."""
         go_dictionary = RoboGun.available_gun_options()
-        go_valid = set(go_dictionary.keys())
 
         section_val = self.config[section].get('gun_options', None)
         if section_val is not None:
@@ -520,10 +671,12 @@ class ConfigReader:
                 return tuple()
 
             section_val_set = set(split_string_list(section_val))
-            valid_list_items = tuple(go_valid.intersection(section_val_set))
+            # keep the order of the available options
+            valid_list_items = tuple(i for i in go_dictionary
+                                     if i in section_val_set)
 
             if valid_list_items:
-                return tuple(go_dictionary[i] for i in valid_list_items)
+                return valid_list_items
 
         default_sect = self.config[ConfigReader.DEFAULT_SECTION]
         default_val = default_sect.get('gun_options', None)
@@ -532,22 +685,24 @@ class ConfigReader:
                 return tuple()
 
             default_val_set = set(split_string_list(default_val))
-            valid_list_items = tuple(go_valid.intersection(default_val_set))
+            valid_list_items = tuple(i for i in go_dictionary
+                                     if i in default_val_set)
 
             if valid_list_items:
-                return tuple(go_dictionary[i] for i in valid_list_items)
+                return valid_list_items
 
         fallback_val = tuple()
         fallback_string = self.fallback.get('gun_options', None)
         if fallback_string:
             fallback_list = split_string_list(fallback_string)
-            fallback_val = tuple(go_dictionary[i] for i in fallback_list)
+            fallback_val = tuple(i for i in go_dictionary
+                                 if i in fallback_list)
 
         return fallback_val
 
     def assemble_movement(self, section):
         """Parse movement string and movement options
-        into movement class instance.
+        into the name of the movement class and its arguments.
         Available movements are based on AVAILABLE_MOVEMENTS set.
         Options are validated based on OPTIONS parameter defined in movement.
         """
@@ -562,7 +717,7 @@ class ConfigReader:
                 options_valid, option_list = self.assemble_movement_options(
                     movement_class.OPTIONS, movement_option_list)
                 if options_valid:
-                    return movement_class(*option_list)
+                    return movement_name, option_list
 
         default_sect = self.config[ConfigReader.DEFAULT_SECTION]
         default_val = default_sect.get('movement', None)
@@ -575,7 +730,7 @@ class ConfigReader:
                 options_valid, option_list = self.assemble_movement_options(
                     movement_class.OPTIONS, movement_option_list)
                 if options_valid:
-                    return movement_class(*option_list)
+                    return movement_name, option_list
 
         # Fallback value must exist and be valid.
         fallback_string = self.fallback.get('movement', None)
@@ -586,7 +741,7 @@ class ConfigReader:
         _, parsed_option_list = self.assemble_movement_options(
             fallback_class.OPTIONS, fallback_option_list)
 
-        return fallback_class(*parsed_option_list)
+        return fallback_name, parsed_option_list
 
     def assemble_movement_options(self, movement_class_list, user_option_list):
         """Parse list of input movement option strings
@@ -626,31 +781,43 @@ class ConfigReader:
             return (True, self.robo_name_space.index(value))
         return False, None
 
-    def set_alert_flags(self, robo_list):
-        """Set alert flags for robots in robo_list based on config
-        and auto vals given by movement class."""
-
-        fallback_val = self.fallback.get('alert_flag', None)
+    def assemble_alert_flag(self, section):
+        """Determine the alert flag of the robot in section.
+        Return 'auto', if the flag is given by its movement class,
+        and None, if the robot keeps its default flag."""
+        section_val = self.config[section].getboolean('alert_flag', None)
+        if section_val is not None:
+            return section_val
 
         default_sect = self.config[ConfigReader.DEFAULT_SECTION]
         flag_auto = default_sect.getboolean('alert_flag', None)
         if flag_auto is None:
-            flag_auto = fallback_val
-
-        for robo_name, robot in zip(self.robo_name_space, robo_list):
-            section_val = self.config[robo_name].getboolean('alert_flag', None)
-            if section_val is None:
-                if flag_auto:
-                    robot.set_alert_flag(
-                        robot.robot_control.movement_funct.RECEIVE_ALERT)
-            else:
-                robot.set_alert_flag(section_val)
+            flag_auto = self.fallback.get('alert_flag', None)
+
+        if flag_auto:
+            return 'auto'
+        return None
 
     @staticmethod
     def ensure_configs_folder():
         if not os.path.isdir(CONFIG_FOLDER):
             os.mkdir(CONFIG_FOLDER)
 
+    @staticmethod
+    def robot_config_path(path=None):
+        """Return path, by default the robot config in the configs folder,
+        which is created, if it doesn't exist yet."""
+        if path is None:
+            ConfigReader.ensure_configs_folder()
+
+            path = os.path.join(CONFIG_FOLDER, ROBOT_CONFIG)
+            if not os.path.exists(path):
+                ConfigReader.create_robot_config(path)
+        elif not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+        return path
+
     @staticmethod
     def create_robot_config(path):
         with open(path, 'w') as f:
@@ -0,0 +1,238 @@
+import numpy as np
+
+from ai_control import SensorData
+import utils
+
+# ==================================
+# Delta Protocol
+# ==================================
+#
+# In this file, you will find the optional delta protocol for
+# vision and position messages:
+# Instead of the full data, the server only sends the changes relative
+# to the last tick the AI acknowledged, for example the wall tiles
+# that entered or left the field of view.
+# The DeltaEncoder of a robot unit creates these messages on the server.
+# The DeltaDecoder in the RobotControl reconstructs the full messages
+# from them, so movement AIs don't notice the protocol.
+# After reconstruction of a tick, the decoder acknowledges it.
+# If the decoder misses the state a delta refers to,
+# it asks for a full message by resetting its acknowledgement.
+#
+# Message data:
+#   vision delta:   (base tick or None, viewer position,
+#                    added tile indices, added tiles, their center points,
+#                    their types, removed tile indices,
+#                    {robot index: robot entry})
+#   position delta: (base tick or None, {field index: value})
+# A base tick of None marks a full message.
+#
+# CHANGE HERE:
+# - content of delta messages
+# - length of the server's history
+
+# channels of the protocol, one per message type
+VISION = SensorData.VISION_STRING
+POSITION = SensorData.POSITION_STRING
+
+
+class DeltaEncoder:
+    """Server side of the delta protocol for one robot unit.
+    Remembers the data sent in the last ticks,
+    to build deltas relative to the tick the AI acknowledged."""
+
+    # Number of ticks to remember.
+    # If the AI lags behind further, it gets full messages.
+    HISTORY_LENGTH = 64
+
+    def __init__(self):
+        self.history = {VISION: dict(), POSITION: dict()}
+
+    def reset(self):
+        for history in self.history.values():
+            history.clear()
+
+    def _base(self, channel, ack):
+        """Return the tick and remembered data the delta refers to.
+        Forget older ticks."""
+        history = self.history[channel]
+        for tick in [t for t in history if ack is None or t < ack]:
+            del history[tick]
+
+        while len(history) >= DeltaEncoder.HISTORY_LENGTH:
+            del history[min(history)]
+
+        if ack in history:
+            return ack, history[ack]
+        return None, None
+
+    def encode_vision(self, simulation, robot, robot_data, ack):
+        """Create the vision delta message of robot.
+        robot_data is the result of Simulation.calculate_vision_robots,
+        ack the last tick acknowledged by the AI."""
+        points = simulation.obstacle_points
+        point = (robot.x, robot.y)
+        diffs, _ = utils.calculate_angles(points, point,
+                                          robot.alpha, robot.fov_angle)
+        visible = diffs <= 0
+
+        base, base_data = self._base(VISION, ack)
+        if base is None:
+            base_visible = np.zeros_like(visible)
+            robot_changes = dict(enumerate(robot_data))
+        else:
+            base_visible, base_robots = base_data
+            robot_changes = {index: entry
+                             for index, entry in enumerate(robot_data)
+                             if entry != base_robots[index]}
+
+        added = np.flatnonzero(visible & ~base_visible)
+        removed = np.flatnonzero(base_visible & ~visible)
+
+        tiles = simulation.obstacle_list[added]
+        centers = points[added]
+        types = [simulation.obstacleArray[x][y] for x, y in tiles.tolist()]
+
+        tick = simulation.time_stamp
+        self.history[VISION][tick] = (visible, list(robot_data))
+
+        data = (base, point, added, tiles, centers, types, removed,
+                robot_changes)
+        return SensorData(SensorData.VISION_DELTA_STRING, data, tick)
+
+    def encode_position(self, simulation, robot, ack):
+        """Create the position delta message of robot."""
+        position = (robot.x, robot.y, robot.alpha, robot.v, robot.v_alpha)
+
+        base, base_position = self._base(POSITION, ack)
+        if base is None:
+            changes = dict(enumerate(position))
+        else:
+            changes = {index: value
+                       for index, (value, old) in enumerate(
+                           zip(position, base_position))
+                       if value != old}
+
+        tick = simulation.time_stamp
+        self.history[POSITION][tick] = position
+
+        data = (base, changes)
+        return SensorData(SensorData.POSITION_DELTA_STRING, data, tick)
+
+
+class DeltaDecoder:
+    """AI side of the delta protocol.
+    Reconstructs full messages and acknowledges the ticks."""
+
+    def __init__(self):
+        # last reconstructed tick per channel, None asks for full data
+        self.acks = {VISION: None, POSITION: None}
+        # reconstructed states per channel and tick
+        self.states = {VISION: dict(), POSITION: dict()}
+        # board data of the last vision message, reused if nothing changed
+        self._board_cache = None
+
+    def reset(self):
+        for channel in self.acks:
+            self.acks[channel] = None
+            self.states[channel].clear()
+        self._board_cache = None
+
+    def decode(self, signal):
+        """Return the full message for a delta message,
+        None if it can't be reconstructed."""
+        if signal.message_type == SensorData.VISION_DELTA_STRING:
+            return self.decode_vision(signal)
+        if signal.message_type == SensorData.POSITION_DELTA_STRING:
+            return self.decode_position(signal)
+        return signal
+
+    def _base_state(self, channel, base):
+        """Return the state a delta refers to.
+        Forget all states before it."""
+        states = self.states[channel]
+        if base not in states:
+            # missing state: ask for a full message
+            self.acks[channel] = None
+            return None
+
+        for tick in [t for t in states if t < base]:
+            del states[tick]
+        return states[base]
+
+    def _store(self, channel, tick, state):
+        self.states[channel][tick] = state
+        self.acks[channel] = tick
+
+    def decode_vision(self, signal):
+        (base, point, added, tiles, centers, types, removed,
+         robot_changes) = signal.data
+
+        if base is None:
+            visible = dict()
+            robots = [robot_changes[index]
+                      for index in range(len(robot_changes))]
+        else:
+            state = self._base_state(VISION, base)
+            if state is None:
+                return None
+            visible, robots = state
+            visible = dict(visible)
+            robots = list(robots)
+            for index, entry in robot_changes.items():
+                robots[index] = entry
+
+        for index in removed.tolist():
+            del visible[index]
+        for index, tile, center, tile_type in zip(added.tolist(), tiles,
+                                                  centers, types):
+            visible[index] = (tile, center, tile_type)
+
+        self._store(VISION, signal.time_stamp, (visible, robots))
+
+        # The board data only changes with the viewer position
+        # or with the tiles seen.
+        cache = self._board_cache
+        unchanged = (cache is not None and cache[0] == point and
+                     base is not None and not len(added) and
+                     not len(removed))
+        if unchanged:
+            board_data = cache[1]
+        else:
+            board_data = DeltaDecoder.board_data(visible, point)
+            self._board_cache = (point, board_data)
+
+        return SensorData(SensorData.VISION_STRING, (board_data, robots),
+                          signal.time_stamp)
+
+    @staticmethod
+    def board_data(visible, point):
+        """Build the board data of a vision message:
+        tuples of (tile, type, distance) in the order of the server."""
+        if not visible:
+            return []
+
+        entries = [visible[index] for index in sorted(visible)]
+        vectors = np.array([entry[1] for entry in entries]) - point
+        distances = np.linalg.norm(vectors, axis=1)
+
+        return [(tile, tile_type, dist) for (tile, _, tile_type), dist
+                in zip(entries, distances)]
+
+    def decode_position(self, signal):
+        base, changes = signal.data
+
+        if base is None:
+            position = tuple(changes[index] for index in range(len(changes)))
+        else:
+            state = self._base_state(POSITION, base)
+            if state is None:
+                return None
+            position = list(state)
+            for index, value in changes.items():
+                position[index] = value
+            position = tuple(position)
+
+        self._store(POSITION, signal.time_stamp, position)
+        return SensorData(SensorData.POSITION_STRING, position,
+                          signal.time_stamp)
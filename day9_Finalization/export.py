@@ -0,0 +1,190 @@
+import os
+import sys
+import random
+import argparse
+from timeit import default_timer
+
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtWidgets import QApplication
+
+from replay import ReplayReader, ReplayPlayer
+from server import BoardPainter
+from simulation import Simulation, Frame, interpolate_frames
+import config_provider
+
+# ==================================
+# Export
+# ==================================
+#
+# In this file, you will find the offscreen export of matches into
+# video frames, for example for highlight reels:
+# A replay log or a headless simulation is painted with the paint
+# functions of the board into images at a fixed frame rate,
+# as fast as possible. Between two ticks, the frames are interpolated.
+# Without display, Qt's offscreen platform is used.
+#
+# Usage (from the game folder):
+#   python -m export --replay match.sbr --output frames/%05d.png
+#   python -m export --ticks 2000 --output - |
+#       ffmpeg -f rawvideo -pix_fmt bgra -s 1000x1000 -r 30 -i - match.mp4
+# Raw frames are written as 32 bit BGRA pixels.
+#
+# CHANGE HERE:
+# - command line options
+# - output formats
+
+
+FIELD_SIZE = config_provider.FIELD_SIZE
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m export',
+        description='Render a replay or a headless match into video frames.')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='replay log to render, '
+                             'else a headless match is simulated')
+    parser.add_argument('--start', type=int, default=0, metavar='TICK',
+                        help='first tick of a replay to render')
+    parser.add_argument('--end', type=int, default=None, metavar='TICK',
+                        help='last tick of a replay to render')
+    parser.add_argument('--ticks', type=int, default=1000,
+                        help='number of ticks of a headless match')
+    parser.add_argument('--level', default='level1.txt',
+                        help='level file of a headless match')
+    parser.add_argument('--robots', metavar='INI',
+                        help='robot config of a headless match')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of the random number generator '
+                             'for a headless match')
+    parser.add_argument('--fps', type=float, default=30,
+                        help='frames per second of game time')
+    parser.add_argument('--output', default='frame_%05d.png',
+                        help="file name pattern of the images, "
+                             "or '-' for raw frames on stdout")
+    return parser.parse_args(argv)
+
+
+class ReplaySource:
+    """Frames of a replay log."""
+
+    def __init__(self, path):
+        self.player = ReplayPlayer(ReplayReader(path))
+        self.obstacle_array = self.player.obstacle_array
+        self.first_tick = self.player.reader.first_tick
+        self.last_tick = self.player.reader.last_tick
+
+        # frames of the last ticks, seeking backwards is expensive
+        self._frames = dict()
+
+    def frame(self, tick):
+        frame = self._frames.get(tick)
+        if frame is None:
+            self.player.seek(tick)
+            frame = Frame(tick, self.player.robots, self.player.bullets)
+            self._frames = {t: f for t, f in self._frames.items()
+                            if t >= tick - 1}
+            self._frames[tick] = frame
+        return frame
+
+
+class SimulationSource:
+    """Frames of a headless match, calculated while rendering.
+    Ticks must be requested in ascending order."""
+
+    def __init__(self, level, robot_config, ticks):
+        self.simulation = Simulation(level, robot_config)
+        self.simulation.start(threaded=False)
+        self.obstacle_array = self.simulation.obstacleArray
+        self.first_tick = 0
+        self.last_tick = ticks - 1
+
+        # number of ticks calculated, and frames of the last two ticks
+        self._ticks = 0
+        self._frames = dict()
+
+    def frame(self, tick):
+        while self._ticks <= tick:
+            self.simulation.step()
+            self._frames[self._ticks] = self.simulation.create_frame()
+            self._frames.pop(self._ticks - 2, None)
+            self._ticks += 1
+        return self._frames[tick]
+
+
+class FrameExporter(BoardPainter):
+    """Paints frames of a source into a QImage."""
+
+    def __init__(self, source):
+        self.source = source
+        self.obstacleArray = source.obstacle_array
+        self.init_textures()
+        self.image = QImage(FIELD_SIZE, FIELD_SIZE, QImage.Format_ARGB32)
+
+    def render(self, position):
+        """Paint the board at position, given in (fractions of) ticks."""
+        source = self.source
+        tick = int(position)
+        previous = source.frame(tick)
+        current = source.frame(min(tick + 1, source.last_tick))
+        robots, bullets = interpolate_frames(previous, current,
+                                             position - tick)
+
+        qp = QPainter(self.image)
+        self.paint_frame(qp, robots, bullets)
+        qp.end()
+        return self.image
+
+    def positions(self, first, last, fps):
+        """Positions of all frames from tick first to tick last."""
+        ticks_per_frame = 1 / (fps * Simulation.SECONDS_PER_TICK)
+        count = int((last - first) / ticks_per_frame) + 1
+        return [first + index * ticks_per_frame for index in range(count)]
+
+
+def write_raw(image, stream):
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    stream.write(bytes(bits))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # no display needed
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication(sys.argv[:1])
+
+    if args.replay:
+        source = ReplaySource(args.replay)
+        first = max(args.start, source.first_tick)
+        last = source.last_tick
+        if args.end is not None:
+            last = min(args.end, last)
+    else:
+        if args.seed is not None:
+            random.seed(args.seed)
+        source = SimulationSource(args.level, args.robots, args.ticks)
+        first, last = source.first_tick, source.last_tick
+
+    exporter = FrameExporter(source)
+    positions = exporter.positions(first, last, args.fps)
+    raw = args.output == '-'
+
+    start = default_timer()
+    for index, position in enumerate(positions):
+        image = exporter.render(position)
+        if raw:
+            write_raw(image, sys.stdout.buffer)
+        elif not image.save(args.output % index):
+            print(f'could not write {args.output % index}', file=sys.stderr)
+            return 1
+    elapsed = default_timer() - start
+
+    print(f'{len(positions)} frames in {elapsed:.1f}s', file=sys.stderr)
+    app.quit()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
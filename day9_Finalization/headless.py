@@ -0,0 +1,128 @@
+import sys
+import time
+import argparse
+from timeit import default_timer
+
+from simulation import Simulation
+from remote_control import SOCKET_PATH
+import async_server
+import spectator
+
+# ==================================
+# Headless
+# ==================================
+#
+# In this file, you will find the command line entry for headless runs
+# of the game without any window, for example for batch jobs or benchmarks.
+# Since the simulation modules don't import PyQt5,
+# neither startup time nor the installation of PyQt5 are needed.
+#
+# Usage (from the game folder):
+#   python -m headless --ticks 2000
+#
+# CHANGE HERE:
+# - command line options
+# - output of headless runs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m headless',
+        description='Run the SpaceBaseRobots simulation without a window.')
+    parser.add_argument('--ticks', type=int, default=1000,
+                        help='number of server ticks to simulate')
+    parser.add_argument('--level', default='level1.txt',
+                        help='level file in the configs folder')
+    parser.add_argument('--realtime', action='store_true',
+                        help='keep the tick rate of the game '
+                             'instead of running as fast as possible')
+    parser.add_argument('--threaded', action='store_true',
+                        help='run each AI in its own thread like the game '
+                             'instead of calculating its responses in place')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record the match into a replay log')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='run in real time with the tick loop, timers '
+                             'and remote AIs on one asyncio event loop')
+    parser.add_argument('--spectate', metavar='[HOST:]PORT',
+                        help='with --asyncio, stream the match to '
+                             'spectators, see python -m server --spectate')
+    parser.add_argument('--remote-socket', default=SOCKET_PATH,
+                        metavar='PATH',
+                        help='socket for robots with remote AI, '
+                             'best combined with --realtime')
+    parser.add_argument('--profile-ai', action='store_true',
+                        help='print message counts and AI response times '
+                             'per message type')
+    return parser.parse_args(argv)
+
+
+def run(simulation, ticks, realtime=False):
+    """Perform the given amount of ticks on the simulation.
+    Return the elapsed wall clock time in seconds."""
+    spt = Simulation.SECONDS_PER_TICK
+
+    start = default_timer()
+    for tick in range(ticks):
+        simulation.step()
+
+        if realtime:
+            # sleep until the next tick is due
+            delay = start + (tick + 1) * spt - default_timer()
+            if delay > 0:
+                time.sleep(delay)
+
+    return default_timer() - start
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    simulation = Simulation(args.level)
+    if not args.asyncio:
+        simulation.start(threaded=args.threaded,
+                         remote_socket=args.remote_socket)
+    if args.profile_ai:
+        for robot in simulation.robots:
+            robot.robot_control.enable_message_stats()
+    if args.record:
+        simulation.start_recording(args.record)
+
+    if args.asyncio:
+        start = default_timer()
+        services = []
+        if args.spectate:
+            host, port = spectator.parse_address(args.spectate)
+            services.append(spectator.SpectatorServer(simulation, host, port))
+        server = async_server.run(simulation, args.ticks, args.remote_socket,
+                                  services)
+        elapsed = default_timer() - start
+        print(f'{server.late_ticks} ticks calculated too late')
+    else:
+        elapsed = run(simulation, args.ticks, args.realtime)
+        simulation.close()
+
+    tps = args.ticks / elapsed if elapsed else float('inf')
+    print(f'{args.ticks} ticks in {elapsed:.3f}s ({tps:.1f} ticks/s)')
+    for index, robot in enumerate(simulation.robots):
+        print(f'robot {index}: x={robot.x:.1f} y={robot.y:.1f} '
+              f'alpha={robot.alpha:.1f} life={robot.life} '
+              f'dead={robot.dead}')
+
+    if args.profile_ai:
+        for index, robot in enumerate(simulation.robots):
+            stats = robot.robot_control.message_stats
+            name = type(robot.robot_control.movement_funct).__name__
+            print(f'robot {index} ({name}):')
+            if not stats.counts:
+                print('  no messages processed')
+            for message_type, count, total, mean in stats.summary():
+                print(f'  {message_type:16} {count:6d} messages '
+                      f'{total * 1000:9.2f} ms total '
+                      f'{mean * 1e6:8.1f} us each')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
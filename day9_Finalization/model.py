@@ -1,6 +1,8 @@
+import itertools
+
 import utils
 from player_control import PlayerControl, ControlScheme
-from robogun import GunInterface
+from robogun import GunInterface, Projectile, HitScan
 
 # ==================================
 # Model
@@ -73,11 +75,31 @@ class DataRobot(BaseRobot):
         self.immune = False
         self.life = self.max_life
 
+        # Match statistics.
+        self.kills = 0
+        self.deaths = 0
+
+        # Remaining seconds of simulated time until respawn / end of immunity.
+        # These timers are advanced by the server each tick.
+        self.respawn_countdown = 0
+        self.immunity_countdown = 0
+
         # Optional gun object.
         self.gun = None
 
         # Only some robots should receive an alert message.
         self.alert_flag = False
+        # Alert messages are sent every alert_period ticks.
+        self.alert_period = 10
+        # If greater zero, alert messages only contain the robot itself,
+        # the alert_targets and the alert_k_nearest nearest robots.
+        self.alert_k_nearest = 0
+        self.alert_targets = []
+        # Only robots asking for it receive the encoded vision message.
+        self.encoded_vision_flag = False
+
+        # Optional delta protocol for vision and position messages.
+        self.delta_encoder = None
 
         # Access management system:
         # self.player_input_enabled = True         # currently inactive
@@ -100,19 +122,37 @@ class DataRobot(BaseRobot):
     def set_alert_flag(self, value=True):
         self.alert_flag = value
 
+    def setup_alert(self, period=10, k_nearest=0):
+        self.alert_period = period
+        self.alert_k_nearest = k_nearest
+
+    def setup_delta_protocol(self, delta_encoder, delta_decoder):
+        """Send vision and position messages as deltas.
+        See delta_protocol module."""
+        self.delta_encoder = delta_encoder
+        self.robot_control.setup_delta_decoder(delta_decoder)
+
+    def delta_ack(self, channel):
+        """Last tick of the channel acknowledged by the AI."""
+        return self.robot_control.delta_decoder.acks[channel]
+
+    def set_encoded_vision_flag(self, value=True):
+        self.encoded_vision_flag = value
+
     def set_resync_flag(self, value=True):
         self.robot_control.set_resync_flag(value)
 
     # optional setups
-    def setup_gun(self, gun):
+    def setup_gun(self, gun, seconds_per_tick):
         """Add a gun object to the robot unit.
         Setup gun access for AI-control and optional player control.
+        The AI counts reloads in ticks of seconds_per_tick.
         """
         # Gain control over new gun object.
         self.gun = gun
 
         # Add interface for AI.
-        gun_interface = GunInterface(gun)
+        gun_interface = GunInterface(gun, seconds_per_tick)
         self.robot_control.setup_gun_interface(gun_interface)
 
         # Add interface for player.
@@ -138,9 +178,9 @@ class DataRobot(BaseRobot):
     # Interface for AI_Control:
     # =========================
 
-    def start(self):
+    def start(self, threaded=True):
         """Tell the AI control to initiate calculations."""
-        self.robot_control.run()
+        self.robot_control.run(threaded)
 
     def send_sensor_data(self, data):
         """Send selected data to the AI control, if enabled."""
@@ -172,34 +212,40 @@ class DataRobot(BaseRobot):
     def perform_shoot_action(self):
         """
         Server asks for shoot action data of this robot unit.
-        Will return a valid bullet, if the robot is shooting.
-        Else returns False.
+        Will return a list of the shots fired, bullets and hit-scan rays,
+        empty if the robot isn't shooting.
         """
 
-        maybe_bullet = False
+        shots = []
 
         # don't shoot, if gun is disabled or doesn't exist.
         if not self.gun or not self.gun_enabled:
-            return maybe_bullet
+            return shots
 
-        # get gun data to create bullet.
-        maybe_data = self.gun.trigger_fire()
-        if maybe_data:
-            angle = self.alpha
+        # get gun data to create bullets and rays.
+        for payload in self.gun.trigger_fire():
+            angle = self.alpha + payload.angle
 
-            # prevent bullets from spawning inside of the robot.
+            # prevent shots from starting inside of the robot.
             angle_vector = utils.vector_from_angle(angle)
             robot_center = (self.x, self.y)
-            bullet_start = robot_center + (self.radius + 1) * angle_vector
-
-            # prevent bullets from standing still while moving backwards
-            speed = max(0, self.v) + maybe_data
-
-            # create bullet
-            maybe_bullet = Bullet(position=bullet_start,
-                                  speed=speed,
-                                  direction=angle)
-        return maybe_bullet
+            start = robot_center + (self.radius + 1) * angle_vector
+
+            if isinstance(payload, Projectile):
+                # prevent bullets from standing still while moving backwards
+                speed = max(0, self.v) + payload.speed
+
+                # create bullet
+                shots.append(Bullet(position=start,
+                                    speed=speed,
+                                    direction=angle,
+                                    owner=self))
+            elif isinstance(payload, HitScan):
+                shots.append(Ray(position=start,
+                                 direction=angle,
+                                 range=payload.range,
+                                 owner=self))
+        return shots
 
     # robot movement
     def place_robot(self, x, y, alpha, v, v_alpha):
@@ -243,26 +289,91 @@ class DataRobot(BaseRobot):
 
         self.place_robot(*position)
 
+    # State snapshots:
+    # ================
+
+    def snapshot(self):
+        """Return the current state of the robot unit as plain data,
+        including its controllers and gun."""
+        state = dict(x=self.x, y=self.y, alpha=self.alpha,
+                     v=self.v, v_alpha=self.v_alpha,
+                     life=self.life, dead=self.dead, immune=self.immune,
+                     respawn=self.respawn_countdown,
+                     immunity=self.immunity_countdown,
+                     kills=self.kills, deaths=self.deaths,
+                     alert_flag=self.alert_flag,
+                     player_control_active=self.player_control_active,
+                     player_output_enabled=self.player_output_enabled,
+                     robot_input_enabled=self.robot_input_enabled,
+                     robot_output_enabled=self.robot_output_enabled,
+                     gun_enabled=self.gun_enabled,
+                     robot_control=self.robot_control.snapshot(),
+                     player_control=None,
+                     gun=None)
+
+        if self.player_control:
+            state['player_control'] = self.player_control.snapshot()
+        if self.gun:
+            state['gun'] = self.gun.snapshot()
+
+        return state
+
+    def restore(self, state):
+        """Set the state of the robot unit to a state returned by snapshot.
+        The robot unit must have the same controllers and gun as the unit,
+        the snapshot was taken from."""
+        self.place_robot(state['x'], state['y'], state['alpha'],
+                         state['v'], state['v_alpha'])
+
+        self.life = state['life']
+        self.dead = state['dead']
+        self.immune = state['immune']
+        self.respawn_countdown = state['respawn']
+        self.immunity_countdown = state['immunity']
+        self.kills = state['kills']
+        self.deaths = state['deaths']
+
+        self.alert_flag = state['alert_flag']
+
+        self.player_control_active = state['player_control_active']
+        self.player_output_enabled = state['player_output_enabled']
+        self.robot_input_enabled = state['robot_input_enabled']
+        self.robot_output_enabled = state['robot_output_enabled']
+        self.gun_enabled = state['gun_enabled']
+
+        self.robot_control.restore(state['robot_control'])
+        if self.delta_encoder:
+            self.delta_encoder.reset()
+        if self.player_control:
+            self.player_control.restore(state['player_control'])
+        if self.gun:
+            self.gun.restore(state['gun'])
+
     # Damage and respawn system:
     # ==========================
 
     def deal_damage(self, damage=1):
         """Called by server if damage is dealt to the robot unit.
-        If robot looses all of its life, destroy it."""
+        If robot looses all of its life, destroy it.
+        Return True, if the robot unit got destroyed."""
 
         # we don't deal damage to dead or immune units
         if self.immune or self.dead:
-            return
+            return False
 
         self.life = max(0, self.life - damage)
         if self.life <= 0:
             self.get_destroyed()
+            return True
+
+        return False
 
     def get_destroyed(self):
         """Gets called, if robot looses all of its life.
         Enter dead-state and initiate respawn.
         """
         self.dead = True
+        self.deaths += 1
 
         self.v = 0
         self.v_alpha = 0
@@ -271,10 +382,7 @@ class DataRobot(BaseRobot):
         self.disable_player_control()
         self.disable_gun()
 
-        def respawn():
-            self.respawn()
-
-        utils.execute_after(self.respawn_timer, respawn)
+        self.respawn_countdown = self.respawn_timer
 
     def respawn(self):
         """Respawn the robot unit at different location.
@@ -295,10 +403,26 @@ class DataRobot(BaseRobot):
 
         self.dead = False
 
-        def disable_immunity():
-            self.immune = False
+        self.immunity_countdown = self.immunity_timer
+
+    def update_timers(self, seconds_per_tick):
+        """Called by the server each tick to advance the respawn
+        and immunity timers and the gun's reload by the duration of one tick.
+        A timer expires at the tick closest to its set time."""
+        threshold = seconds_per_tick / 2
+
+        if self.gun:
+            self.gun.update_timers(seconds_per_tick)
+
+        if self.dead:
+            self.respawn_countdown -= seconds_per_tick
+            if self.respawn_countdown < threshold:
+                self.respawn()
 
-        utils.execute_after(self.immunity_timer, disable_immunity)
+        elif self.immune:
+            self.immunity_countdown -= seconds_per_tick
+            if self.immunity_countdown < threshold:
+                self.immune = False
 
     # Player control interface:
     # =========================
@@ -422,7 +546,25 @@ class DataRobot(BaseRobot):
 class Bullet:
     """Data container class for bullet representation."""
 
-    def __init__(self, position, speed, direction):
+    # Source of unique bullet ids, for example to identify bullets in replays.
+    _ids = itertools.count()
+
+    def __init__(self, position, speed, direction, owner=None):
+        self.id = next(Bullet._ids)
         self.position = position
         self.speed = speed
         self.direction = direction
+        # The robot unit that fired the bullet.
+        self.owner = owner
+
+
+class Ray:
+    """Data container class for hit-scan shots.
+    Unlike bullets, rays are resolved in the tick they are fired."""
+
+    def __init__(self, position, direction, range, owner=None):
+        self.position = position
+        self.direction = direction
+        self.range = range
+        # The robot unit that fired the ray.
+        self.owner = owner
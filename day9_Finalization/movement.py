@@ -1,6 +1,8 @@
 import random
 import math
 
+import numpy as np
+
 # ==================================
 # Movement
 # ==================================
@@ -19,6 +21,14 @@ import math
 # Name of the target option for the config parser.
 TARGET_OPTION_STRING = 'target'
 
+# Codes for relative directions, as returned by calculate_direction:
+# the sign of the cross product.
+LEFT = -1
+NONE = 0
+RIGHT = 1
+# Older AIs use strings for the directions.
+DIRECTION_CODES = {'left': LEFT, 'none': NONE, 'right': RIGHT}
+
 
 class Movement:
     """Implement different movement responses."""
@@ -26,6 +36,9 @@ class Movement:
     # Default movement does not need to receive alert messages.
     # Movement AIs that want to receive alert messages override this.
     RECEIVE_ALERT = False
+    # Movement AIs that want to receive the vision as float32 array
+    # of fixed size (see vision_encoder module) override this.
+    RECEIVE_ENCODED_VISION = False
     # Default movement has no additional construction parameters.
     # Movements with additional constructor parameters add these parameters
     # in their respective list in the right order for the config parser.
@@ -37,12 +50,22 @@ class Movement:
     def position(self, data, robot):
         return 0, 0
 
+    def alert_targets(self):
+        """Indices of the robots, that must be part of every alert
+        message for this AI, even if they are far away."""
+        if TARGET_OPTION_STRING in self.OPTIONS:
+            return [self.target]
+        return []
+
     def vision(self, data, robot):
         return robot.a, robot.a_alpha
 
     def alert(self, data, robot):
         return robot.a, robot.a_alpha
 
+    def encoded_vision(self, data, robot):
+        return robot.a, robot.a_alpha
+
 
 class RandomMovement(Movement):
     """Sets a and alpha to random values."""
@@ -591,18 +614,19 @@ def calculate_angle_between_vectors(obj_position, x, y, v, alpha):
 
 
 def calculate_direction(main_vector, second_vector):
-    """Calculates in which relative direction the second vector points."""
+    """Calculates in which relative direction the second vector points.
+    Returns one of the direction codes LEFT, NONE, RIGHT."""
 
     cross_product = calc_cross_product(
         (main_vector[0], main_vector[1]),
         (second_vector[0], second_vector[1]))
 
     if cross_product > 0:
-        direction = "right"
+        direction = RIGHT
     elif cross_product < 0:
-        direction = "left"
-    elif cross_product == 0:
-        direction = "none"
+        direction = LEFT
+    else:
+        direction = NONE
     return direction
 
 
@@ -659,18 +683,20 @@ def set_delta_alpha(obj_type, distance, threshold,
                     obj_angle, turn_direction, v_alpha):
     """Set delta_alpha based on obstacle type and distance."""
 
+    turn_direction = DIRECTION_CODES.get(turn_direction, turn_direction)
+
     absolute_delta_alpha = 10
     if obj_type == "wall":
-        if distance <= threshold and turn_direction == "right":
+        if distance <= threshold and turn_direction == RIGHT:
             delta_alpha = absolute_delta_alpha
-        elif distance <= threshold and turn_direction == "left":
+        elif distance <= threshold and turn_direction == LEFT:
             delta_alpha = - absolute_delta_alpha
         else:
             delta_alpha = 0
     if obj_type == "robot":
-        if distance <= threshold and turn_direction == "right":
+        if distance <= threshold and turn_direction == RIGHT:
             delta_alpha = (180 - abs(obj_angle))
-        elif distance <= threshold and turn_direction == "left":
+        elif distance <= threshold and turn_direction == LEFT:
             delta_alpha = - (180 - abs(obj_angle))
         else:
             delta_alpha = 0
@@ -682,30 +708,34 @@ def set_run_delta_alpha(obj_type, distance, threshold, obj_angle,
                         threat_angle, threat_turn_direction):
     """Set delta_alpha based on obstacle and threat."""
 
+    turn_direction = DIRECTION_CODES.get(turn_direction, turn_direction)
+    threat_turn_direction = DIRECTION_CODES.get(threat_turn_direction,
+                                                threat_turn_direction)
+
     absolute_delta_alpha = 20
     if obj_type == "wall":
-        if distance <= threshold and turn_direction == "right":
+        if distance <= threshold and turn_direction == RIGHT:
             delta_alpha = absolute_delta_alpha
-        elif distance <= threshold and turn_direction == "left":
+        elif distance <= threshold and turn_direction == LEFT:
             delta_alpha = - absolute_delta_alpha
-        elif distance <= threshold and turn_direction == "none":
+        elif distance <= threshold and turn_direction == NONE:
             delta_alpha = 0
 
     if obj_type == "robot":
-        if distance <= threshold and turn_direction == "right":
+        if distance <= threshold and turn_direction == RIGHT:
             delta_alpha = (180 - abs(obj_angle))
-        elif distance <= threshold and turn_direction == "left":
+        elif distance <= threshold and turn_direction == LEFT:
             delta_alpha = - (180 - abs(obj_angle))
-        elif distance <= threshold and turn_direction == "none":
+        elif distance <= threshold and turn_direction == NONE:
             delta_alpha = 0
 
     smoothifier = (180 - threat_angle)/180
     if distance > threshold:
-        if threat_turn_direction == "right":
+        if threat_turn_direction == RIGHT:
             delta_alpha = 20 * smoothifier
-        elif threat_turn_direction == "left":
+        elif threat_turn_direction == LEFT:
             delta_alpha = - 20 * smoothifier
-        elif threat_turn_direction == "none":
+        elif threat_turn_direction == NONE:
             delta_alpha = 0
 
     return delta_alpha
@@ -714,11 +744,13 @@ def set_run_delta_alpha(obj_type, distance, threshold, obj_angle,
 def set_angle_sign(angle, direction):
     """Gives a sign to the angle based on turning direction."""
 
-    if direction == "right":
+    direction = DIRECTION_CODES.get(direction, direction)
+
+    if direction == RIGHT:
         signed_angle = angle
-    elif direction == "left":
+    elif direction == LEFT:
         signed_angle = - angle
-    elif direction == "none":
+    elif direction == NONE:
         signed_angle = angle
     return signed_angle
 
@@ -726,20 +758,22 @@ def set_angle_sign(angle, direction):
 def set_angle_acceleration(direction, delta_alpha, v_alpha, robot):
     """Setting a_alpha values."""
 
+    direction = DIRECTION_CODES.get(direction, direction)
+
     a_alpha_max = robot.a_alpha_max
-    if direction == "right":
+    if direction == RIGHT:
         if delta_alpha >= a_alpha_max + v_alpha:
             a_alpha = a_alpha_max
         elif delta_alpha < a_alpha_max + v_alpha:
             a_alpha = delta_alpha - v_alpha
 
-    elif direction == "left":
+    elif direction == LEFT:
         if abs(delta_alpha) >= abs(a_alpha_max - v_alpha):
             a_alpha = - a_alpha_max
         elif abs(delta_alpha) < abs(a_alpha_max - v_alpha):
             a_alpha = -(abs(delta_alpha)) + abs(v_alpha)
 
-    elif direction == "none":
+    elif direction == NONE:
         a_alpha = 0.01
 
     return a_alpha
@@ -795,6 +829,11 @@ def prime_object(array_tuple):
 def prime_robot(array):
     """Identifies the most significant robot of a robot array."""
 
+    # alert messages with interest management map indices to positions,
+    # starting with the robot itself
+    if isinstance(array, dict):
+        array = list(array.values())
+
     distance_array = []
     robot_x = array[0][0]
     robot_y = array[0][1]
@@ -921,3 +960,192 @@ def calculate_inaccuracy(position, coordinates, alpha, vel):
     # calculate inaccuracy
     inaccuracy = math.sin(target_radian) * opp_abs
     return inaccuracy
+
+
+# Batched helper functions:
+# =========================
+# numpy versions of the helper functions above.
+# They calculate the values for many targets at once, for example all
+# objects seen, or for many robots at once, see
+# VectorEnv.destination_actions. Arguments broadcast like numpy arrays:
+# points and vectors are arrays of shape (..., 2),
+# all other values are scalars or arrays of shape (...).
+# Directions are returned as direction codes.
+#
+# The built-in AIs keep the scalar helpers: each AI handles one robot,
+# and numpy's per-call overhead outweighs the batching. Measured per
+# call, scalar vs. batched, on vision messages of a running level:
+# - prime_object over 99 to 400 tiles seen: 5-20us vs. 13-22us,
+#   the distances have to be taken out of the message tuples first
+# - prime_robot over 4 robots: 3us vs. 17us
+# - calculate_threshold: 0.6us vs. 16us
+# - calculate_inaccuracy: 2us vs. 37us
+
+def calculate_distances(point, points):
+    """Batched calculate_distance between point and points."""
+    diff = np.asarray(points, dtype=float) - point
+    return np.sqrt(diff[..., 0] ** 2 + diff[..., 1] ** 2)
+
+
+def calculate_vectors(magnitudes, angles):
+    """Batched calculate_vector."""
+    radians = np.asarray(angles) / 180 * math.pi
+    return np.stack((magnitudes * np.sin(radians),
+                     -(magnitudes * np.cos(radians))), axis=-1)
+
+
+def calculate_angles_between_vectors(obj_positions, x, y, v, alpha):
+    """Batched calculate_angle_between_vectors."""
+    obj_positions = np.asarray(obj_positions, dtype=float)
+    object_x = obj_positions[..., 0] - x
+    object_y = obj_positions[..., 1] - y
+
+    velocity_vectors = calculate_vectors(v, alpha)
+    velocity_x = velocity_vectors[..., 0]
+    velocity_y = velocity_vectors[..., 1]
+
+    vector_multiplication = velocity_x * object_x + velocity_y * object_y
+    magnitude_multiplication = (
+        np.sqrt(velocity_x ** 2 + velocity_y ** 2) *
+        np.sqrt(object_x ** 2 + object_y ** 2))
+
+    # the angle is 0 if one of the vectors has no length
+    valid = magnitude_multiplication != 0
+    ratio = np.divide(vector_multiplication, magnitude_multiplication,
+                      out=np.ones_like(magnitude_multiplication),
+                      where=valid)
+    obj_alpha = np.arccos(np.clip(ratio, -1, 1))
+
+    return (obj_alpha * 180 / math.pi) % 360
+
+
+def calculate_directions(main_vectors, second_vectors):
+    """Batched calculate_direction. Returns an array of direction codes."""
+    main_vectors = np.asarray(main_vectors, dtype=float)
+    second_vectors = np.asarray(second_vectors, dtype=float)
+    cross_products = (main_vectors[..., 0] * second_vectors[..., 1] -
+                      main_vectors[..., 1] * second_vectors[..., 0])
+    return np.sign(cross_products).astype(int)
+
+
+def calculate_destination_alphas(vec1, vec2):
+    """Batched calculate_destination_alpha."""
+    vec1 = np.asarray(vec1, dtype=float)
+    vec2 = np.asarray(vec2, dtype=float)
+    vector_multiplication = (vec1[..., 0] * vec2[..., 0] +
+                             vec1[..., 1] * vec2[..., 1])
+    magnitude_multiplication = (
+        np.sqrt(vec1[..., 0] ** 2 + vec1[..., 1] ** 2) *
+        np.sqrt(vec2[..., 0] ** 2 + vec2[..., 1] ** 2))
+
+    ratio = np.divide(vector_multiplication, magnitude_multiplication,
+                      out=np.ones_like(magnitude_multiplication),
+                      where=magnitude_multiplication != 0)
+    valid = (ratio > -1) & (ratio < 1)
+    destination_alpha = np.where(
+        valid, np.arccos(np.where(valid, ratio, 0)) - 0.01, 0)
+    return (destination_alpha * 180 / math.pi) % 360
+
+
+def set_angle_accelerations(directions, delta_alpha, v_alpha, a_alpha_max):
+    """Batched set_angle_acceleration, directions are direction codes."""
+    directions = np.asarray(directions)
+    delta_alpha = np.asarray(delta_alpha, dtype=float)
+    v_alpha = np.asarray(v_alpha, dtype=float)
+
+    right = np.where(delta_alpha >= a_alpha_max + v_alpha,
+                     a_alpha_max, delta_alpha - v_alpha)
+    left = np.where(np.abs(delta_alpha) >= np.abs(a_alpha_max - v_alpha),
+                    -a_alpha_max, -np.abs(delta_alpha) + np.abs(v_alpha))
+
+    return np.select((directions == RIGHT, directions == LEFT),
+                     (right, left), 0.01)
+
+
+def destination_actions(x, y, alpha, v, v_alpha, destinations, a_alpha_max,
+                        v_max=15):
+    """Batched position_destination_robot: a and a_alpha to move
+    many robots towards their destinations at once."""
+    v = np.where(np.asarray(v) == 0, 0.00001, v)
+
+    velocity_vectors = calculate_vectors(v, alpha)
+    destination_vectors = np.asarray(destinations, dtype=float)
+    destination_vectors = destination_vectors - np.stack((x, y), axis=-1)
+
+    destination_alpha_degree = calculate_destination_alphas(
+        velocity_vectors, destination_vectors)
+
+    directions = calculate_directions(velocity_vectors, destination_vectors)
+    delta_alpha = np.where(directions == LEFT, -destination_alpha_degree,
+                           destination_alpha_degree)
+
+    a = np.where(v < v_max, 1, 0)
+    a_alpha = set_angle_accelerations(directions, delta_alpha, v_alpha,
+                                      a_alpha_max)
+    return a, a_alpha
+
+
+def calculate_thresholds(is_wall, v_alpha, v_max, radius, a_alpha_max):
+    """Batched calculate_threshold.
+    is_wall is True for walls and False for robots."""
+    is_wall = np.asarray(is_wall, dtype=bool)
+
+    delta_alpha = np.where(is_wall, 90, 180)
+    obj_r = np.where(is_wall, math.sqrt(2) * 10, 50 + np.asarray(v_max))
+
+    delta_alpha_per_unit = np.abs(np.asarray(a_alpha_max) / v_max)
+    turn_distance = (delta_alpha + np.abs(v_alpha)) * delta_alpha_per_unit
+    threshold = turn_distance + 2 * np.asarray(radius) + obj_r
+    # post processing
+    return threshold / 1.5
+
+
+def nearest_index(distances):
+    """Index of the smallest positive distance, None if there is none."""
+    distances = np.where(distances > 0, distances, np.inf)
+    if not len(distances):
+        return None
+    index = int(np.argmin(distances))
+    if distances[index] == np.inf:
+        return None
+    return index
+
+
+def prime_objects(obstacle_distances, robot_distances):
+    """Batched core of prime_object: Find the most significant object
+    from the distances of all obstacles and robots seen.
+    Distances of 0 or less are ignored, like robots not seen.
+    Returns (0, index) for an obstacle and (1, index) for a robot.
+    Obstacles win ties. If there is no object at all, return (0, 0)."""
+    type_of_obj, index_of_obj = 0, 0
+    significance = math.inf
+
+    index = nearest_index(np.asarray(obstacle_distances, dtype=float))
+    if index is not None:
+        index_of_obj = index
+        significance = obstacle_distances[index]
+
+    index = nearest_index(np.asarray(robot_distances, dtype=float))
+    if index is not None and robot_distances[index] < significance:
+        type_of_obj, index_of_obj = 1, index
+
+    return type_of_obj, index_of_obj
+
+
+def calculate_inaccuracies(positions, coordinates, alpha, vel):
+    """Batched calculate_inaccuracy."""
+    positions = np.asarray(positions, dtype=float)
+    coordinates = np.asarray(coordinates, dtype=float)
+    robot_radian = np.asarray(alpha) / 180 * math.pi
+
+    angle = calculate_angles_between_vectors(
+        coordinates, positions[..., 0], positions[..., 1], vel, alpha)
+    target_radian = (angle % 360) / 180 * math.pi
+
+    distance = calculate_distances(positions, coordinates)
+
+    a = np.sin(target_radian) * distance
+    b = np.sin(robot_radian) * distance
+    opp_abs = np.sqrt(a ** 2 + b ** 2)
+
+    return np.sin(target_radian) * opp_abs
@@ -1,7 +1,5 @@
 import math
 
-from PyQt5.QtCore import Qt
-
 import utils
 
 # ==================================
@@ -18,6 +16,42 @@ import utils
 # - responses to key presses
 
 
+class Qt:
+    """
+    Qt-free namespace of the key codes used by the key bindings.
+    The values equal the ones of PyQt5.QtCore.Qt.Key,
+    so they match the key codes of Qt key events.
+    This way, the key bindings can be used without importing PyQt5.
+    """
+    # ADD: If you need another key for a new key binding,
+    # add its Qt key code here.
+    Key_0 = 0x30
+    Key_4 = 0x34
+    Key_5 = 0x35
+    Key_6 = 0x36
+    Key_8 = 0x38
+    Key_A = 0x41
+    Key_D = 0x44
+    Key_I = 0x49
+    Key_J = 0x4a
+    Key_K = 0x4b
+    Key_L = 0x4c
+    Key_M = 0x4d
+    Key_P = 0x50
+    Key_R = 0x52
+    Key_S = 0x53
+    Key_W = 0x57
+    Key_Space = 0x20
+    Key_Plus = 0x2b
+    Key_Period = 0x2e
+    Key_Return = 0x01000004
+    Key_End = 0x01000011
+    Key_Left = 0x01000012
+    Key_Up = 0x01000013
+    Key_Right = 0x01000014
+    Key_Down = 0x01000015
+
+
 class PlayerControl:
     """
     Allow a player to take control over a robot.
@@ -145,6 +179,22 @@ class PlayerControl:
         """Call this when changing or initiating the gun object."""
         self.gun = gun
 
+    # state snapshots:
+    # ================
+    def snapshot(self):
+        """Return the current key states and output values as plain data."""
+        return dict(a=self.a, a_alpha=self.a_alpha,
+                    acc_state=self.acc_state,
+                    acc_rev_state=self.acc_rev_state,
+                    left_state=self.left_state,
+                    right_state=self.right_state,
+                    allow_toggle_autopilot=self.allow_toggle_autopilot)
+
+    def restore(self, state):
+        """Set the state to a state returned by snapshot."""
+        for name, value in state.items():
+            setattr(self, name, value)
+
     # key input handler:
     # ==================
     def calculate_key_action(self, key, state):
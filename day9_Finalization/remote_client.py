@@ -0,0 +1,190 @@
+import sys
+import socket
+import argparse
+
+from ai_control import RobotControl
+from config_provider import AVAILABLE_MOVEMENTS, split_string_list
+import remote_control
+import movement
+
+# ==================================
+# Remote Client
+# ==================================
+#
+# In this file, you will find the AI process of a robot unit
+# with the remote_ai option:
+# It connects to the server's socket, see remote_control module,
+# and runs one of the movement AIs on the received messages.
+# After every message, the current acceleration values and
+# fire requests are sent back to the server.
+# Clients in other languages only need to implement the frames
+# described in the remote_control module.
+#
+# Usage (from the game folder, while the game is running):
+#   python -m remote_client robo2 --movement "ChaseMovement, robo1"
+#
+# CHANGE HERE:
+# - command line options
+# - answer policy of the client
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m remote_client',
+        description='Run the AI of a robot unit in its own process.')
+    parser.add_argument('robot',
+                        help='name of the robot section in the config')
+    parser.add_argument('--movement', default='Movement',
+                        help='movement AI and its options, '
+                             'written like in the robot config')
+    parser.add_argument('--socket', default=remote_control.SOCKET_PATH,
+                        help='path of the server socket')
+    return parser.parse_args(argv)
+
+
+class RemoteGunInterface:
+    """Gun interface of the AI process.
+    Mirrors the gun state sent with every message
+    and collects fire requests for the next action frame."""
+
+    def __init__(self):
+        self.reloading = False
+        self.preparing = False
+        self.reload_ticks = 0
+        self.fire = False
+
+    def update(self, reloading, preparing, reload_ticks):
+        self.reloading = reloading
+        self.preparing = preparing or self.fire
+        self.reload_ticks = reload_ticks
+
+    def is_reloading(self):
+        return self.reloading
+
+    def reload_remaining_ticks(self):
+        return self.reload_ticks
+
+    def is_preparing(self):
+        return self.preparing
+
+    def prepare_fire(self):
+        if not self.reloading:
+            self.fire = True
+            self.preparing = True
+
+    def take_fire(self):
+        """Return whether the AI wants to shoot and reset the request."""
+        fire = self.fire
+        self.fire = False
+        return fire
+
+
+def create_movement(movement_string, robot_names):
+    """Create the movement AI from a string like the robot config's
+    movement option. Raise ValueError if it is invalid."""
+    movement_list = split_string_list(movement_string)
+    name, options = movement_list[0], movement_list[1:]
+    if name not in AVAILABLE_MOVEMENTS:
+        raise ValueError(f'unknown movement: {name}')
+
+    movement_class = getattr(movement, name)
+    if len(options) < len(movement_class.OPTIONS):
+        raise ValueError(f'{name} needs the options {movement_class.OPTIONS}')
+
+    args = []
+    for value, option in zip(options, movement_class.OPTIONS):
+        # ADD: When you add a new movement option, parse it here.
+        if option == movement.TARGET_OPTION_STRING:
+            if value not in robot_names:
+                raise ValueError(f'unknown target robot: {value}')
+            args.append(robot_names.index(value))
+
+    return movement_class(*args)
+
+
+class RemoteAIClient:
+    """Connection of an AI process to the server."""
+
+    def __init__(self, path, robot_name):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(path)
+        remote_control.send_frame(self.connection,
+                                  remote_control.HELLO_FRAME,
+                                  robot_name.encode('utf-8'))
+
+        frame = remote_control.read_frame(self.connection)
+        if frame is None:
+            raise ConnectionError('connection closed by the server')
+        frame_type, payload = frame
+        if frame_type == remote_control.REJECT_FRAME:
+            raise ConnectionError(payload.decode('utf-8'))
+
+        (self.base_robot, self.index,
+         self.robot_names) = remote_control.decode_welcome(payload)
+
+        self.gun_interface = RemoteGunInterface()
+        self.robot_control = None
+
+    def setup_movement(self, movement_funct):
+        """Create the AI control of the robot with the given movement."""
+        control = RobotControl(self.base_robot, movement_funct)
+        control.setup_gun_interface(self.gun_interface)
+        control.run(threaded=False)
+        self.robot_control = control
+
+    def run(self):
+        """Answer messages until the server closes the connection."""
+        control = self.robot_control
+        gun = self.gun_interface
+
+        while True:
+            frame = remote_control.read_frame(self.connection)
+            if frame is None:
+                return
+            frame_type, payload = frame
+            if frame_type != remote_control.SENSOR_FRAME:
+                continue
+
+            signal, reloading, preparing, reload_ticks = \
+                remote_control.decode_sensor_data(payload)
+            gun.update(reloading, preparing, reload_ticks)
+            control.receive_sensor_data(signal)
+
+            action = remote_control.ACTION.pack(
+                signal.time_stamp, control.a, control.a_alpha,
+                gun.take_fire())
+            remote_control.send_frame(self.connection,
+                                      remote_control.ACTION_FRAME, action)
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    try:
+        client = RemoteAIClient(args.socket, args.robot)
+    except OSError as e:
+        print(f'connection failed: {e}', file=sys.stderr)
+        return 1
+
+    try:
+        client.setup_movement(create_movement(args.movement,
+                                              client.robot_names))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        client.close()
+        return 1
+
+    try:
+        client.run()
+    except OSError:
+        pass
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
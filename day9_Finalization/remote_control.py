@@ -0,0 +1,444 @@
+import os
+import queue
+import socket
+import struct
+import threading
+
+import numpy as np
+
+from ai_control import RobotControl, SensorData
+from model import BaseRobot
+
+# ==================================
+# Remote Control
+# ==================================
+#
+# In this file, you will find the server side of remote AIs:
+# The AI of a robot unit with the remote_ai option runs in a separate
+# process, see remote_client module, and connects to the server
+# over a Unix domain socket.
+# Messages and actions are exchanged as compact binary frames
+# instead of Python objects, so AIs may be written in other languages.
+# A slow or crashing AI process can neither block the server
+# nor take the server's GIL.
+#
+# Frame: header '<IB' (payload length, frame type) followed by the payload.
+# All numbers are little endian.
+#   HELLO    client -> server   robot name (utf-8)
+#   WELCOME  server -> client   9 doubles: body parameters of BaseRobot,
+#                               '<H' robot index,
+#                               names of all robots (utf-8, '\n'-separated)
+#   REJECT   server -> client   reason (utf-8)
+#   SENSOR   server -> client   '<BiBBI' (message code, tick, gun reloading,
+#                               gun preparing, ticks until the gun is
+#                               reloaded), followed by the message body
+#   ACTION   client -> server   '<iddB' (tick, a, a_alpha, fire)
+#
+# Message bodies:
+#   position        5 doubles: x, y, alpha, v, v_alpha
+#   vision          '<HH' (tile count, robot count),
+#                   tiles as TILE_DTYPE, robots as ROBOT_DTYPE
+#   alert           '<BH' (1 if only robots of interest, robot count),
+#                   robots as ALERT_DTYPE
+#   encoded vision  float32 array
+#
+# CHANGE HERE:
+# - frame types and content of the message bodies
+# - behaviour of slow or disconnected AIs
+
+# default path of the socket, relative to the game folder
+SOCKET_PATH = 'spacebase_ai.sock'
+
+HEADER = struct.Struct('<IB')
+WELCOME = struct.Struct('<9dH')
+SENSOR = struct.Struct('<BiBBI')
+ACTION = struct.Struct('<iddB')
+POSITION = struct.Struct('<5d')
+VISION = struct.Struct('<HH')
+ALERT = struct.Struct('<BH')
+
+# frame types
+HELLO_FRAME = 1
+WELCOME_FRAME = 2
+REJECT_FRAME = 3
+SENSOR_FRAME = 4
+ACTION_FRAME = 5
+
+# message codes
+MESSAGE_CODES = {SensorData.POSITION_STRING: 1,
+                 SensorData.VISION_STRING: 2,
+                 SensorData.ALERT_STRING: 3,
+                 SensorData.ENCODED_VISION_STRING: 4}
+MESSAGE_TYPES = {code: t for t, code in MESSAGE_CODES.items()}
+
+TILE_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4'), ('type', '<i4'),
+                       ('dist', '<f8')])
+ROBOT_DTYPE = np.dtype([('seen', 'u1'), ('x', '<f8'), ('y', '<f8'),
+                        ('dist', '<f8')])
+ALERT_DTYPE = np.dtype([('index', '<u2'), ('x', '<f8'), ('y', '<f8')])
+
+BODY_KEYS = ('radius', 'a_max', 'a_alpha_max', 'v_max', 'v_alpha_max',
+             'fov_angle', 'max_life', 'respawn_timer', 'immunity_timer')
+
+
+# Frames:
+# =======
+
+def send_frame(connection, frame_type, payload=b''):
+    connection.sendall(HEADER.pack(len(payload), frame_type) + payload)
+
+
+def read_frame(connection):
+    """Read the next frame. Return (frame type, payload),
+    None if the connection is closed."""
+    header = _read_exactly(connection, HEADER.size)
+    if header is None:
+        return None
+    length, frame_type = HEADER.unpack(header)
+    payload = _read_exactly(connection, length)
+    if payload is None:
+        return None
+    return frame_type, payload
+
+
+def _read_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def encode_welcome(base_robot, index, robot_names):
+    body = [getattr(base_robot, key) for key in BODY_KEYS]
+    return (WELCOME.pack(*body, index) +
+            '\n'.join(robot_names).encode('utf-8'))
+
+
+def decode_welcome(payload):
+    """Return (base robot, robot index, robot names)."""
+    *body, index = WELCOME.unpack_from(payload)
+    body = dict(zip(BODY_KEYS, body))
+    body['max_life'] = int(body['max_life'])
+    names = payload[WELCOME.size:].decode('utf-8').split('\n')
+    return BaseRobot(**body), index, names
+
+
+# Messages:
+# =========
+
+def encode_sensor_data(signal, reloading=False, preparing=False,
+                       reload_ticks=0):
+    """Encode a message into the payload of a SENSOR frame.
+    Return None for message types without binary format."""
+    code = MESSAGE_CODES.get(signal.message_type)
+    if code is None:
+        return None
+
+    head = SENSOR.pack(code, signal.time_stamp, reloading, preparing,
+                       reload_ticks)
+    t = signal.message_type
+
+    if t == SensorData.POSITION_STRING:
+        return head + POSITION.pack(*signal.data)
+
+    if t == SensorData.VISION_STRING:
+        board_data, robot_data = signal.data
+        tiles = np.zeros(len(board_data), dtype=TILE_DTYPE)
+        if board_data:
+            positions, types, dists = zip(*board_data)
+            positions = np.array(positions).reshape(-1, 2)
+            tiles['x'], tiles['y'] = positions[:, 0], positions[:, 1]
+            tiles['type'] = types
+            tiles['dist'] = dists
+        robots = np.zeros(len(robot_data), dtype=ROBOT_DTYPE)
+        for entry, seen in zip(robots, robot_data):
+            if seen:
+                (x, y), dist = seen
+                entry['seen'], entry['x'], entry['y'] = 1, x, y
+                entry['dist'] = dist
+        return (head + VISION.pack(len(tiles), len(robots)) +
+                tiles.tobytes() + robots.tobytes())
+
+    if t == SensorData.ALERT_STRING:
+        data = signal.data
+        interest = isinstance(data, dict)
+        items = data.items() if interest else enumerate(data)
+        robots = np.array([(index, x, y) for index, (x, y) in items],
+                          dtype=ALERT_DTYPE)
+        return head + ALERT.pack(interest, len(robots)) + robots.tobytes()
+
+    # encoded vision
+    data = np.asarray(signal.data, dtype='<f4')
+    return head + data.tobytes()
+
+
+def decode_sensor_data(payload):
+    """Decode the payload of a SENSOR frame.
+    Return (message, gun reloading, gun preparing, reload ticks)."""
+    code, tick, reloading, preparing, reload_ticks = \
+        SENSOR.unpack_from(payload)
+    t = MESSAGE_TYPES[code]
+    offset = SENSOR.size
+
+    if t == SensorData.POSITION_STRING:
+        data = POSITION.unpack_from(payload, offset)
+
+    elif t == SensorData.VISION_STRING:
+        tile_count, robot_count = VISION.unpack_from(payload, offset)
+        offset += VISION.size
+        tiles = np.frombuffer(payload, TILE_DTYPE, tile_count, offset)
+        offset += tiles.nbytes
+        robots = np.frombuffer(payload, ROBOT_DTYPE, robot_count, offset)
+
+        positions = np.stack((tiles['x'], tiles['y']), axis=1)
+        board_data = list(zip(positions, tiles['type'].tolist(),
+                              tiles['dist'].tolist()))
+        robot_data = [((x, y), dist) if seen else False
+                      for seen, x, y, dist in robots.tolist()]
+        data = (board_data, robot_data)
+
+    elif t == SensorData.ALERT_STRING:
+        interest, count = ALERT.unpack_from(payload, offset)
+        robots = np.frombuffer(payload, ALERT_DTYPE, count,
+                               offset + ALERT.size)
+        if interest:
+            data = {index: (x, y) for index, x, y in robots.tolist()}
+        else:
+            data = [(x, y) for _, x, y in robots.tolist()]
+
+    else:
+        data = np.frombuffer(payload, '<f4', offset=offset).copy()
+
+    return (SensorData(t, data, tick), bool(reloading), bool(preparing),
+            reload_ticks)
+
+
+# Server side:
+# ============
+
+class RemoteControl(RobotControl):
+    """AI control of a robot unit whose AI runs in another process.
+    Messages are encoded by the server thread and sent by a sender thread.
+    A receiver thread sets the acceleration values and fires the gun
+    on every action frame of the AI.
+    If the AI falls behind, the oldest messages are dropped.
+    Without connection, messages are dropped and the values stay 0.
+    """
+
+    SEND_QUEUE_SIZE = 32
+
+    def __init__(self, base_robot: BaseRobot):
+        super().__init__(base_robot)
+
+        # socket of the AI process, served by threads
+        self.connection = None
+        # or stream of the AI process, served by an event loop,
+        # see async_server module
+        self.stream = None
+        # tick of the last action received
+        self.action_tick = None
+        self._send_queue = queue.Queue(RemoteControl.SEND_QUEUE_SIZE)
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self.connection is not None or self.stream is not None
+
+    def run(self, threaded=True):
+        """The AI runs in its own process.
+        Sender and receiver threads are started per connection."""
+        pass
+
+    def receive_sensor_data(self, data):
+        if not self.connected:
+            return
+
+        payload = encode_sensor_data(data, self.is_reloading(),
+                                     self.is_shooting(),
+                                     self.reload_remaining_ticks())
+        if payload is None:
+            return
+
+        if self.stream is not None:
+            self.stream.send(payload)
+            return
+
+        try:
+            self._send_queue.put_nowait(payload)
+        except queue.Full:
+            # The AI is too slow: drop the oldest message.
+            try:
+                self._send_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._send_queue.put_nowait(payload)
+
+    def handle_action(self, payload):
+        """Apply the payload of an ACTION frame."""
+        tick, a, a_alpha, fire = ACTION.unpack(payload)
+        self.action_tick = tick
+        self.a, self.a_alpha = a, a_alpha
+        if fire:
+            self.shoot()
+
+    def clear_input(self):
+        self._send_queue.queue.clear()
+
+    def attach(self, connection):
+        """Use the socket of an AI process from now on."""
+        with self._lock:
+            self.clear_input()
+            self.clear_values()
+            self.connection = connection
+
+        for loop in (self._send_loop, self._receive_loop):
+            t = threading.Thread(target=loop, args=(connection,))
+            t.daemon = True
+            t.start()
+
+    def attach_stream(self, stream):
+        """Use the stream of an AI process from now on.
+        The stream is an object with the methods send(payload)
+        and close(). Action frames must be passed to handle_action."""
+        with self._lock:
+            self.clear_values()
+            self.stream = stream
+
+    def detach(self, connection=None):
+        """Close the connection or stream,
+        if it is still the given one."""
+        with self._lock:
+            if connection is not None and connection is not self.connection \
+                    and connection is not self.stream:
+                return
+            if self.connection is not None:
+                # wakes up the receiver thread
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self.connection.close()
+            if self.stream is not None:
+                self.stream.close()
+            self.connection = None
+            self.stream = None
+            self.action_tick = None
+            self.clear_input()
+            self.clear_values()
+
+    def _send_loop(self, connection):
+        while connection is self.connection:
+            try:
+                payload = self._send_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                send_frame(connection, SENSOR_FRAME, payload)
+            except OSError:
+                self.detach(connection)
+
+    def _receive_loop(self, connection):
+        while True:
+            try:
+                frame = read_frame(connection)
+            except OSError:
+                frame = None
+            if frame is None:
+                self.detach(connection)
+                return
+
+            frame_type, payload = frame
+            if frame_type != ACTION_FRAME or connection is not self.connection:
+                continue
+            self.handle_action(payload)
+
+
+class RemoteServer:
+    """Accepts the connections of AI processes on a Unix domain socket.
+    An AI process introduces itself with the name of its robot's
+    config section and gets the robot's body parameters in return.
+    controls is the list of AI controls of all robots in server order."""
+
+    def __init__(self, path, robot_names, controls):
+        self.path = path
+        self.robot_names = list(robot_names)
+        self.controls = list(controls)
+        self._socket = None
+
+    def start(self):
+        # remove the socket file of an earlier run
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen()
+
+        t = threading.Thread(target=self._accept_loop, args=(self._socket,))
+        t.daemon = True
+        t.start()
+
+    def close(self):
+        """Stop accepting AIs and close all connections."""
+        if self._socket is None:
+            return
+        self._socket.close()
+        self._socket = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        for control in self.controls:
+            if isinstance(control, RemoteControl):
+                control.detach()
+
+    def find_control(self, hello):
+        """Look up the AI control for the payload of a HELLO frame.
+        Return (robot index, control, None) if the AI may connect,
+        else (None, None, reason)."""
+        name = hello.decode('utf-8', errors='replace')
+        if name not in self.robot_names:
+            return None, None, f'unknown robot: {name}'
+
+        index = self.robot_names.index(name)
+        control = self.controls[index]
+        if not isinstance(control, RemoteControl):
+            return None, None, f'robot {name} has no remote AI'
+        if control.connected:
+            return None, None, f'robot {name} is already connected'
+        return index, control, None
+
+    def _accept_loop(self, server_socket):
+        while True:
+            try:
+                connection, _ = server_socket.accept()
+            except OSError:
+                # socket closed
+                return
+            t = threading.Thread(target=self._handshake, args=(connection,))
+            t.daemon = True
+            t.start()
+
+    def _handshake(self, connection):
+        try:
+            frame = read_frame(connection)
+            if frame is None or frame[0] != HELLO_FRAME:
+                connection.close()
+                return
+
+            index, control, reason = self.find_control(frame[1])
+            if reason:
+                send_frame(connection, REJECT_FRAME, reason.encode('utf-8'))
+                connection.close()
+                return
+
+            send_frame(connection, WELCOME_FRAME,
+                       encode_welcome(control, index, self.robot_names))
+        except OSError:
+            connection.close()
+            return
+
+        control.attach(connection)
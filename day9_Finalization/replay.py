@@ -0,0 +1,506 @@
+import zlib
+import json
+import bisect
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+import utils
+
+# ==================================
+# Replay
+# ==================================
+#
+# In this file, you will find the recording and replaying of matches.
+# The ReplayRecorder writes the state of a simulation into an append-only,
+# compressed, columnar binary log:
+# per tick robot states, bullet spawns and despawns as well as key events.
+# Every KEYFRAME_INTERVAL ticks, it adds a keyframe of the full world state.
+# The ReplayPlayer reads such a log and reconstructs the board state
+# tick by tick without running any AI.
+# To seek to any tick, it starts at the closest preceding keyframe.
+#
+# Log layout:
+# - header: magic, version, robot count, static robot data
+# - records: record type, payload length, zlib compressed payload
+#   - level record: the obstacle array of the board
+#   - chunk records: columns of robot states and event tables
+#     for CHUNK_TICKS consecutive ticks
+#   - keyframe records: world state of the simulation as json
+#   - index record: positions of all chunk and keyframe records
+# - footer: position of the index record
+# Logs without index (for example after a crash) are scanned instead.
+#
+# CHANGE HERE:
+# - recorded robot values and events
+# - layout of the replay log
+# - reconstruction of board states from the log
+
+
+MAGIC = b'SBRR'
+VERSION = 1
+
+HEADER_FORMAT = '<4sHH'
+ROBOT_FORMAT = '<fh'
+RECORD_FORMAT = '<BI'
+
+FOOTER_FORMAT = '<Q4s'
+FOOTER_MAGIC = b'SBRI'
+
+RECORD_LEVEL = 1
+RECORD_CHUNK = 2
+RECORD_KEYFRAME = 3
+RECORD_INDEX = 4
+
+# Float columns of the robot states, each stored as one block per chunk.
+ROBOT_COLUMNS = ('x', 'y', 'alpha', 'v', 'v_alpha')
+
+# Bits of the flags column.
+FLAG_DEAD = 1
+FLAG_IMMUNE = 2
+
+SPAWN_DTYPE = np.dtype([('tick', '<u4'), ('id', '<u4'),
+                        ('x', '<f4'), ('y', '<f4'),
+                        ('speed', '<f4'), ('direction', '<f4')])
+DESPAWN_DTYPE = np.dtype([('tick', '<u4'), ('id', '<u4')])
+KEY_DTYPE = np.dtype([('tick', '<u4'), ('key', '<u4'), ('pressed', 'u1')])
+
+CHUNK_INDEX_DTYPE = np.dtype([('first', '<u4'), ('last', '<u4'),
+                              ('offset', '<u8'), ('length', '<u4')])
+KEYFRAME_INDEX_DTYPE = np.dtype([('tick', '<u4'),
+                                 ('offset', '<u8'), ('length', '<u4')])
+
+# Immutable views on the recorded states.
+# They provide the attributes needed to paint robots and bullets.
+RobotFrame = namedtuple('RobotFrame', ['x', 'y', 'alpha', 'v', 'v_alpha',
+                                       'life', 'dead', 'immune',
+                                       'radius', 'max_life'])
+BulletFrame = namedtuple('BulletFrame', ['id', 'position'])
+
+
+class ReplayRecorder:
+    """Records a running simulation into a replay log.
+    Values are buffered in lists and written as one compressed chunk
+    every CHUNK_TICKS ticks, so recording a tick only appends values.
+    """
+
+    CHUNK_TICKS = 256
+    KEYFRAME_INTERVAL = 256
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, path, robots, obstacle_array,
+                 keyframe_interval=KEYFRAME_INTERVAL):
+        self.robot_count = len(robots)
+        self.keyframe_interval = keyframe_interval
+
+        # Index of written records.
+        self._chunk_index = []
+        self._keyframe_index = []
+
+        self._file = open(path, 'wb')
+
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.robot_count)
+        robot_data = b''.join(struct.pack(ROBOT_FORMAT, r.radius, r.max_life)
+                              for r in robots)
+        self._file.write(header + robot_data)
+
+        level = np.asarray(obstacle_array, dtype=np.uint8)
+        self._write_record(RECORD_LEVEL,
+                           struct.pack('<H', len(level)) + level.tobytes())
+
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self._ticks = []
+        self._columns = [[] for _ in ROBOT_COLUMNS]
+        self._life = []
+        self._flags = []
+
+        self._spawns = []
+        self._despawns = []
+        self._keys = []
+
+    # Recording interface for the simulation:
+    # =======================================
+
+    def record_tick(self, tick, robots):
+        """Append the state of all robots at the end of a tick."""
+        self._ticks.append(tick)
+
+        x, y, alpha, v, v_alpha = self._columns
+        for robot in robots:
+            x.append(robot.x)
+            y.append(robot.y)
+            alpha.append(robot.alpha)
+            v.append(robot.v)
+            v_alpha.append(robot.v_alpha)
+            self._life.append(robot.life)
+            self._flags.append(robot.dead * FLAG_DEAD +
+                               robot.immune * FLAG_IMMUNE)
+
+        if len(self._ticks) >= ReplayRecorder.CHUNK_TICKS:
+            self.flush()
+
+    def record_bullet_spawn(self, tick, bullet):
+        self._spawns.append((tick, bullet.id,
+                             bullet.position[0], bullet.position[1],
+                             bullet.speed, bullet.direction))
+
+    def record_bullet_despawn(self, tick, bullet):
+        self._despawns.append((tick, bullet.id))
+
+    def record_key_event(self, tick, key, pressed):
+        self._keys.append((tick, key, pressed))
+
+    def keyframe_due(self, tick):
+        return tick % self.keyframe_interval == 0
+
+    def record_keyframe(self, tick, world_state):
+        """Write a keyframe of the world state at the end of tick.
+        The world state must be json serializable."""
+        payload = json.dumps(world_state, separators=(',', ':')).encode()
+        offset, length = self._write_record(RECORD_KEYFRAME, payload)
+        self._keyframe_index.append((tick, offset, length))
+
+    def flush(self):
+        """Write all buffered ticks as a chunk to the log."""
+        if not self._ticks:
+            return
+
+        parts = [struct.pack('<I', len(self._ticks)),
+                 np.array(self._ticks, dtype='<u4').tobytes()]
+
+        # Store each column in one block for better compression.
+        # The values of a tick are stored in order of the robots.
+        for column in self._columns:
+            parts.append(np.array(column, dtype='<f4').tobytes())
+        parts.append(np.array(self._life, dtype='<i2').tobytes())
+        parts.append(np.array(self._flags, dtype='u1').tobytes())
+
+        for table, dtype in ((self._spawns, SPAWN_DTYPE),
+                             (self._despawns, DESPAWN_DTYPE),
+                             (self._keys, KEY_DTYPE)):
+            parts.append(struct.pack('<I', len(table)))
+            parts.append(np.array(table, dtype=dtype).tobytes())
+
+        offset, length = self._write_record(RECORD_CHUNK, b''.join(parts))
+        self._chunk_index.append((self._ticks[0], self._ticks[-1],
+                                  offset, length))
+        self._file.flush()
+
+        self._reset_buffers()
+
+    def close(self):
+        """Write remaining ticks and the index."""
+        self.flush()
+
+        chunks = np.array(self._chunk_index, dtype=CHUNK_INDEX_DTYPE)
+        keyframes = np.array(self._keyframe_index, dtype=KEYFRAME_INDEX_DTYPE)
+        payload = b''.join((struct.pack('<II', len(chunks), len(keyframes)),
+                            chunks.tobytes(), keyframes.tobytes()))
+
+        index_start = self._file.tell()
+        self._write_record(RECORD_INDEX, payload)
+        self._file.write(struct.pack(FOOTER_FORMAT, index_start, FOOTER_MAGIC))
+
+        self._file.close()
+
+    def _write_record(self, record_type, payload):
+        """Write a record and return offset and length of its payload."""
+        data = zlib.compress(payload, ReplayRecorder.COMPRESSION_LEVEL)
+        self._file.write(struct.pack(RECORD_FORMAT, record_type, len(data)))
+        offset = self._file.tell()
+        self._file.write(data)
+        return offset, len(data)
+
+
+class ReplayChunk:
+    """Decoded content of a chunk record."""
+
+    def __init__(self, payload, robot_count):
+        offset = 0
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(payload, dtype=dtype,
+                                  count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        tick_count, = struct.unpack_from('<I', payload, offset)
+        offset += 4
+        self.ticks = take('<u4', tick_count)
+
+        shape = (tick_count, robot_count)
+        size = tick_count * robot_count
+        self.columns = [take('<f4', size).reshape(shape)
+                        for _ in ROBOT_COLUMNS]
+        self.life = take('<i2', size).reshape(shape)
+        self.flags = take('u1', size).reshape(shape)
+
+        tables = []
+        for dtype in (SPAWN_DTYPE, DESPAWN_DTYPE, KEY_DTYPE):
+            count, = struct.unpack_from('<I', payload, offset)
+            offset += 4
+            tables.append(take(dtype, count))
+        self.spawns, self.despawns, self.keys = tables
+
+        self.first_tick = int(self.ticks[0])
+        self.last_tick = int(self.ticks[-1])
+
+    def robot_frames(self, tick, radii, max_lifes):
+        row = tick - self.first_tick
+        x, y, alpha, v, v_alpha = (c[row].tolist() for c in self.columns)
+        life = self.life[row].tolist()
+        flags = self.flags[row].tolist()
+
+        return tuple(RobotFrame(*values,
+                                dead=bool(f & FLAG_DEAD),
+                                immune=bool(f & FLAG_IMMUNE),
+                                radius=rad, max_life=ml)
+                     for *values, f, rad, ml in zip(x, y, alpha, v, v_alpha,
+                                                    life, flags,
+                                                    radii, max_lifes))
+
+
+class ReplayReader:
+    """Random access to the records of a replay log.
+    Chunks and keyframes are only read and decompressed on demand."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+
+        header_size = struct.calcsize(HEADER_FORMAT)
+        magic, version, self.robot_count = struct.unpack(
+            HEADER_FORMAT, self._file.read(header_size))
+        if magic != MAGIC:
+            raise ValueError(f'"{path}" is not a replay file!')
+        if version != VERSION:
+            raise ValueError(f'Unsupported replay version {version}!')
+
+        self.radii = []
+        self.max_lifes = []
+        robot_size = struct.calcsize(ROBOT_FORMAT)
+        for _ in range(self.robot_count):
+            radius, max_life = struct.unpack(ROBOT_FORMAT,
+                                             self._file.read(robot_size))
+            self.radii.append(radius)
+            self.max_lifes.append(max_life)
+
+        self.obstacle_array = None
+        # Lists of (first tick, last tick, payload offset, payload length)
+        # and (tick, payload offset, payload length), ordered by tick.
+        self.chunks = []
+        self.keyframes = []
+
+        self._scan_records(self._file.tell())
+        self._chunk_starts = [c[0] for c in self.chunks]
+        self._keyframe_ticks = [k[0] for k in self.keyframes]
+
+        self._cached_chunk = None
+
+    def _scan_records(self, offset):
+        """Read the level and the index of chunks and keyframes.
+        Use the index record, if the log was closed properly,
+        else read the tick ranges of all chunks."""
+        f = self._file
+        record_size = struct.calcsize(RECORD_FORMAT)
+        footer_size = struct.calcsize(FOOTER_FORMAT)
+
+        f.seek(0, 2)
+        size = f.tell()
+
+        index_start = None
+        if size - footer_size >= offset:
+            f.seek(size - footer_size)
+            start, magic = struct.unpack(FOOTER_FORMAT, f.read(footer_size))
+            if magic == FOOTER_MAGIC:
+                index_start = start
+                size = start
+
+        while offset + record_size <= size:
+            f.seek(offset)
+            record_type, length = struct.unpack(RECORD_FORMAT,
+                                                f.read(record_size))
+            offset += record_size
+            # a record cut off by a crash ends the log
+            if offset + length > size:
+                break
+
+            if record_type == RECORD_LEVEL:
+                payload = self._payload(offset, length)
+                level_size, = struct.unpack_from('<H', payload)
+                level = np.frombuffer(payload, dtype=np.uint8, offset=2)
+                self.obstacle_array = level.reshape(level_size,
+                                                    level_size).tolist()
+                # with an index, nothing else needs to be scanned
+                if index_start is not None:
+                    break
+            elif record_type == RECORD_CHUNK:
+                # only read the tick range of the chunk
+                payload = self._payload(offset, length)
+                count, first = struct.unpack_from('<II', payload)
+                last, = struct.unpack_from('<I', payload, 4 * count)
+                self.chunks.append((first, last, offset, length))
+            elif record_type == RECORD_KEYFRAME:
+                tick = json.loads(self._payload(offset, length))['tick']
+                self.keyframes.append((tick, offset, length))
+
+            offset += length
+
+        if index_start is not None:
+            self._read_index(index_start + record_size)
+
+    def _read_index(self, offset):
+        f = self._file
+        f.seek(offset - struct.calcsize(RECORD_FORMAT))
+        _, length = struct.unpack(RECORD_FORMAT,
+                                  f.read(struct.calcsize(RECORD_FORMAT)))
+        payload = self._payload(offset, length)
+
+        chunk_count, keyframe_count = struct.unpack_from('<II', payload)
+        chunks = np.frombuffer(payload, dtype=CHUNK_INDEX_DTYPE,
+                               count=chunk_count, offset=8)
+        keyframes = np.frombuffer(payload, dtype=KEYFRAME_INDEX_DTYPE,
+                                  count=keyframe_count,
+                                  offset=8 + chunks.nbytes)
+        self.chunks = [tuple(c) for c in chunks.tolist()]
+        self.keyframes = [tuple(k) for k in keyframes.tolist()]
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def first_tick(self):
+        return self.chunks[0][0] if self.chunks else 0
+
+    @property
+    def last_tick(self):
+        return self.chunks[-1][1] if self.chunks else -1
+
+    def chunk_at(self, tick):
+        """Return the decoded chunk containing tick or None."""
+        cached = self._cached_chunk
+        if cached and cached.first_tick <= tick <= cached.last_tick:
+            return cached
+
+        i = bisect.bisect_right(self._chunk_starts, tick) - 1
+        if i < 0:
+            return None
+
+        first, last, offset, length = self.chunks[i]
+        if tick > last:
+            return None
+
+        self._cached_chunk = ReplayChunk(self._payload(offset, length),
+                                         self.robot_count)
+        return self._cached_chunk
+
+    def keyframe_before(self, tick):
+        """Return the index of the last keyframe at or before tick
+        or None, if there is no such keyframe."""
+        i = bisect.bisect_right(self._keyframe_ticks, tick) - 1
+        if i < 0:
+            return None
+        return i
+
+    def read_keyframe(self, index):
+        """Return the world state stored in the keyframe at index."""
+        _, offset, length = self.keyframes[index]
+        return json.loads(self._payload(offset, length))
+
+    def _payload(self, offset, length):
+        self._file.seek(offset)
+        return zlib.decompress(self._file.read(length))
+
+
+class ReplayPlayer:
+    """Reconstructs board states from a replay log.
+    Robot states are read directly from the log,
+    bullets are moved along their recorded trajectory
+    from spawn until despawn.
+    Playing forward is incremental. Seeking backwards or far ahead
+    starts at the closest preceding keyframe, so at most
+    one keyframe interval of ticks has to be applied.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.obstacle_array = reader.obstacle_array
+
+        self.robots = ()
+        # Bullets alive at current tick: id -> (x, y, step_x, step_y)
+        self._bullets = dict()
+        self.tick = None
+
+    def seek(self, tick):
+        """Set the current board state to the state after given tick.
+        Ticks outside of the log are limited to the recorded ticks."""
+        tick = utils.limit(tick, self.reader.first_tick, self.reader.last_tick)
+
+        keyframe = self.reader.keyframe_before(tick)
+        if keyframe is not None and self.tick is not None:
+            # continue from the current state, if it is closer
+            if self.reader.keyframes[keyframe][0] <= self.tick <= tick:
+                keyframe = None
+
+        if keyframe is not None:
+            state = self.reader.read_keyframe(keyframe)
+            self._load_keyframe(state)
+            start = state['tick'] + 1
+        elif self.tick is None or tick < self.tick:
+            self._bullets = dict()
+            start = self.reader.first_tick
+        else:
+            start = self.tick + 1
+
+        for t in range(start, tick + 1):
+            self._apply_tick(t)
+
+        self.tick = tick
+        chunk = self.reader.chunk_at(tick)
+        if chunk:
+            self.robots = chunk.robot_frames(tick, self.reader.radii,
+                                             self.reader.max_lifes)
+
+    def at_end(self):
+        return self.tick is not None and self.tick >= self.reader.last_tick
+
+    @property
+    def bullets(self):
+        return tuple(BulletFrame(i, (x, y))
+                     for i, (x, y, _, _) in self._bullets.items())
+
+    def _load_keyframe(self, keyframe):
+        self._bullets = dict()
+        for i, x, y, speed, direction in keyframe['bullets']:
+            self._bullets[i] = (x, y) + bullet_step(speed, direction)
+
+    def _apply_tick(self, tick):
+        chunk = self.reader.chunk_at(tick)
+        if chunk is None:
+            return
+
+        bullets = self._bullets
+        # move all living bullets as the simulation does
+        for i, (x, y, sx, sy) in bullets.items():
+            bullets[i] = (x + sx, y + sy, sx, sy)
+
+        # bullets spawn before they are moved in the same tick
+        for spawn in chunk.spawns[chunk.spawns['tick'] == tick].tolist():
+            _, i, x, y, speed, direction = spawn
+            sx, sy = bullet_step(speed, direction)
+            bullets[i] = (x + sx, y + sy, sx, sy)
+
+        for _, i in chunk.despawns[chunk.despawns['tick'] == tick].tolist():
+            bullets.pop(i, None)
+
+
+def bullet_step(speed, direction):
+    """Return the movement vector of an unobstructed bullet for one tick.
+    The simulation tests int(speed) positions per tick, starting at
+    the current position, so the bullet advances int(speed) - 1 units."""
+    distance = max(int(speed) - 1, 0)
+    step_x, step_y = utils.vector_from_angle(direction) * distance
+    return float(step_x), float(step_y)
@@ -1,7 +1,6 @@
-import queue
-import types
-
-import utils
+import math
+import functools
+from collections import namedtuple
 
 
 # ==================================
@@ -14,26 +13,115 @@ import utils
 # It will be accessed by AI control as well as optional player control.
 # At any time, any controller can add a fire command that will be executed
 # at the next possible opportunity.
+# Fire commands are passed through a slot without locks: the controller
+# counts its requests, the server counts the requests it took.
+# Reloading is counted down by the server with every tick, so it lasts
+# the same number of ticks, however fast the simulation runs.
 #
 # CHANGE HERE:
 # - gun access rights
 # - gun status queries
-# - thread safe enqueuement of fire commands
+# - thread safe slot of fire commands
 # - execution of fire commands
 # - gun modificators
+# - weapons, turning fire commands into shots
 #
 # ADD HERE:
 # - you should add support for different gun types here
 
 
+# Typed payloads of the shots a gun fires, see Weapon.
+# The angle is relative to the robot's direction of view.
+# A projectile creates a bullet flying with speed plus the robot's speed.
+Projectile = namedtuple('Projectile', ['speed', 'angle'])
+# A hit-scan shot hits the first robot on its ray in the same tick,
+# unless an obstacle tile stops it before range.
+HitScan = namedtuple('HitScan', ['range', 'angle'])
+
+
+class Weapon:
+    """Turns the fire commands of a gun into shots.
+    The default weapon fires one bullet in the direction of view."""
+
+    def fire(self, gun, data):
+        """Return the shots for a fire command with data."""
+        return (Projectile(gun.bullet_speed, 0),)
+
+    def follow_up(self, gun):
+        """Return the shots fired while the gun reloads,
+        without a fire command."""
+        return ()
+
+
+class HitScanWeapon(Weapon):
+    """Fires rays, resolved in the tick they are fired,
+    instead of bullets moving step by step."""
+    # longer than the diagonal of the board
+    RANGE = 1500
+
+    def fire(self, gun, data):
+        return (HitScan(HitScanWeapon.RANGE, 0),)
+
+
+class SpreadWeapon(Weapon):
+    """Fans every shot of another weapon out into count shots,
+    angle degrees apart."""
+
+    def __init__(self, weapon, count=3, angle=12):
+        self.weapon = weapon
+        self.count = count
+        self.angle = angle
+
+    def spread(self, shots):
+        first = -self.angle * (self.count - 1) / 2
+        return tuple(shot._replace(angle=shot.angle + first + i * self.angle)
+                     for shot in shots for i in range(self.count))
+
+    def fire(self, gun, data):
+        return self.spread(self.weapon.fire(gun, data))
+
+    def follow_up(self, gun):
+        return self.spread(self.weapon.follow_up(gun))
+
+
+class BurstWeapon(Weapon):
+    """Repeats the shots of another weapon in the next ticks,
+    until shots bursts are fired. The gun counts the remaining ones."""
+
+    def __init__(self, weapon, shots=3):
+        self.weapon = weapon
+        self.shots = shots
+
+    def fire(self, gun, data):
+        gun.burst_count = self.shots - 1
+        return self.weapon.fire(gun, data)
+
+    def follow_up(self, gun):
+        if gun.burst_count:
+            gun.burst_count -= 1
+            return self.weapon.fire(gun, None)
+        return self.weapon.follow_up(gun)
+
+
 class RoboGun:
     """Controller object for thread safe yet instantaneous attack commands."""
-    FIRE_QUEUE_SIZE = 20
 
-    def __init__(self, bullet_speed, reload_speed):
+    def __init__(self, bullet_speed, reload_speed, weapon=None):
 
-        # Main relay of thread safe communication.
-        self._fire_queue = queue.Queue(RoboGun.FIRE_QUEUE_SIZE)
+        # Main relay of thread safe communication:
+        # The fire command slot holds the data of the latest request.
+        # Only controllers increase the request counter,
+        # only the server sets the counter of taken requests,
+        # so no lock is needed. Requests until the server takes them
+        # result in one fire command.
+        self._fire_data = None
+        self._fire_requests = 0
+        self._fire_taken = 0
+
+        # Turns fire commands into shots, see gun options.
+        self.weapon = weapon or Weapon()
+        # Remaining shots of the current burst, see BurstWeapon.
+        self.burst_count = 0
 
         # Bullet properties.
         # ADD: You can add addditional bullet information here.
@@ -42,25 +130,56 @@ class RoboGun:
         # Reload properties.
         self.reload_speed = reload_speed
         self.reloading = False
+        # Remaining seconds of the current reload, see update_timers.
+        self.reload_countdown = 0
 
         # Access rights.
         self.gun_access_player = False
         self.gun_access_robot = False
 
-    # Flush enqueued fire commands
-    # ============================
+    # Flush pending fire commands
+    # ===========================
     def clear_input(self):
-        # never use join!
-        self._fire_queue.queue.clear()
+        self._fire_taken = self._fire_requests
 
     # Gun status queries:
     # ===================
     def is_preparing(self):
-        return not self._fire_queue.empty()
+        return self._fire_requests != self._fire_taken
 
     def is_reloading(self):
         return self.reloading
 
+    def reload_remaining(self):
+        """Return the remaining seconds of the current reload."""
+        if not self.reloading:
+            return 0
+        return max(0, self.reload_countdown)
+
+    def reload_remaining_ticks(self, seconds_per_tick):
+        """Return the number of ticks until the gun can fire again.
+        It fires in that tick, if a fire command is pending."""
+        if not self.reloading:
+            return 0
+        # the reload ends in the first tick with less than half a tick left
+        return math.floor(self.reload_countdown / seconds_per_tick - 0.5) + 1
+
+    # Timers:
+    # =======
+    def update_timers(self, seconds_per_tick):
+        """Called by the server each tick, before the guns fire,
+        to advance the reload by the duration of one tick.
+        A reload ends at the tick closest to its set time.
+        Bursts end with the reload."""
+        if not self.reloading:
+            return
+
+        self.reload_countdown -= seconds_per_tick
+        if self.reload_countdown < seconds_per_tick / 2:
+            self.reloading = False
+            self.reload_countdown = 0
+            self.burst_count = 0
+
     # Access right management:
     # ========================
     def set_gun_access_player(self, value):
@@ -88,54 +207,79 @@ class RoboGun:
 
     def _prepare_fire(self, data):
         # ADD: You can add more complex data from different gun types here.
-        try:
-            self._fire_queue.put(data, block=False)
-        except queue.Full:
-            return False
-        else:
-            return True
+        # data first, the server only reads it after the counter changed
+        self._fire_data = data
+        self._fire_requests += 1
 
     # Perform attack:
     # ===============
     def trigger_fire(self):
         """Called by server via data unit at bullet creation phase.
         Check if fire command is enqueued and gun is able to fire!
-        Return False if gun doesn't shoot, else return data.
+        Return the shots as tuple of Projectile and HitScan payloads,
+        empty if the gun doesn't shoot.
         """
 
-        # can't shoot while reloading.
+        # can't take fire commands while reloading.
         if self.reloading:
-            return False
+            return self.weapon.follow_up(self)
 
         task = self._get_fire_task()
         if not task:
-            return False
-        # get data by: _, task_data = task now.
-        # ADD: You can add support for different gun types here!
+            return ()
+        _, task_data = task
 
         self._initiate_reload()
 
-        return self.bullet_speed
+        return self.weapon.fire(self, task_data)
 
     def _get_fire_task(self):
-        # if no item is in the queue, return immediately.
+        # if no request is pending, return immediately.
         # don't wait and block!
-        try:
-            task = self._fire_queue.get(block=False)
-        except queue.Empty:
+        requests = self._fire_requests
+        if requests == self._fire_taken:
             return False
-        else:
-            return True, task
+        task = self._fire_data
+        self._fire_taken = requests
+        return True, task
 
-    def _initiate_reload(self):
+    def _initiate_reload(self, duration=None):
+        if duration is None:
+            duration = self.reload_speed
 
-        def finish_reload():
-            self.reloading = False
-
-        # enter reloading state
+        # enter reloading state,
+        # the server leaves it after the ticks of duration have passed
         self.reloading = True
-        # leave reloading state after certain time has passed
-        utils.execute_after(self.reload_speed, finish_reload)
+        self.reload_countdown = duration
+
+    # State snapshots:
+    # ================
+    def snapshot(self):
+        """Return the current state of the gun as plain data."""
+        # the pending fire command, if any
+        fire_queue = [self._fire_data] if self.is_preparing() else []
+        return dict(reload=self.reload_remaining(),
+                    trigun=self.burst_count,
+                    fire_queue=fire_queue,
+                    access_player=self.gun_access_player,
+                    access_robot=self.gun_access_robot)
+
+    def restore(self, state):
+        """Set the state of the gun to a state returned by snapshot."""
+        self.clear_input()
+        for task in state['fire_queue']:
+            self._prepare_fire(task)
+
+        self.gun_access_player = state['access_player']
+        self.gun_access_robot = state['access_robot']
+
+        self.burst_count = state['trigun']
+
+        if state['reload'] > 0:
+            self._initiate_reload(state['reload'])
+        else:
+            self.reloading = False
+            self.reload_countdown = 0
 
     # Optional functionality decorators:
     # ==================================
@@ -145,7 +289,23 @@ class RoboGun:
     def available_gun_options():
         # ADD HERE: If you added more gun options,
         # enter them here so the parser knows them.
-        return {'trigun': RoboGun.trigun_decorator}
+        # Options are applied in this order: options replacing the weapon
+        # come before options wrapping it.
+        return {'hitscan': RoboGun.hitscan_decorator,
+                'spread': RoboGun.spread_decorator,
+                'trigun': RoboGun.trigun_decorator}
+
+    @staticmethod
+    def hitscan_decorator(gun):
+        """Replaces the bullets of a gun with hit-scan rays."""
+        gun.weapon = HitScanWeapon()
+        return gun
+
+    @staticmethod
+    def spread_decorator(gun):
+        """Fans every shot of a gun out into three shots."""
+        gun.weapon = SpreadWeapon(gun.weapon)
+        return gun
 
     @staticmethod
     def trigun_decorator(gun):
@@ -153,40 +313,17 @@ class RoboGun:
         Amplifies a given gun to duplicate a successful fire task
         into three consecutive shots over the next server ticks.
         """
-        # we need a new variable of the gun
-        gun.trigun_count = 0
-
-        # override the old fire function
-        # this may be improved by just overloading the reload-check
-        def trigger_fire_trigun(self):
-            if self.reloading:
-                if self.trigun_count:
-                    self.trigun_count += -1
-                    return self.bullet_speed
-                else:
-                    return False
-
-            task = self._get_fire_task()
-            if not task:
-                return False
-            # get data by: _, task_data = task now.
-
-            self._initiate_reload()
-
-            self.trigun_count = 2
-
-            return self.bullet_speed
-
-        gun.trigger_fire = types.MethodType(trigger_fire_trigun, gun)
-
+        gun.weapon = BurstWeapon(gun.weapon)
         return gun
 
 
 class GunInterface:
     """Restricted access gun interface."""
 
-    def __init__(self, gun):
+    def __init__(self, gun, seconds_per_tick):
 
         self.is_preparing = gun.is_preparing
         self.is_reloading = gun.is_reloading
+        self.reload_remaining_ticks = functools.partial(
+            gun.reload_remaining_ticks, seconds_per_tick)
         self.prepare_fire = gun.prepare_fire_robot
@@ -2,17 +2,18 @@ import os
 import sys
 import math
 import time
+import argparse
 import threading
-from functools import partial
 from timeit import default_timer
-from collections import defaultdict
 
-from PyQt5.QtCore import Qt, QPointF, QRectF, QTimer
-from PyQt5.QtGui import QPainter, QColor, QBrush, QPen, QPixmap
+import numpy as np
+from PyQt5.QtCore import Qt, QRect, QRectF, QPointF, QTimer
+from PyQt5.QtGui import QPainter, QColor, QBrush, QPen, QPixmap, QRegion
 from PyQt5.QtWidgets import QWidget, QApplication, QMainWindow, QMessageBox
 
-from ai_control import SensorData
-from player_control import ControlScheme
+from simulation import Simulation, Hazard, interpolate_frames
+from replay import ReplayReader, ReplayPlayer
+from spectator import SpectatorConnection, parse_address
 import config_provider
 import utils
 
@@ -23,24 +24,17 @@ import utils
 # In this file, you will find the main game:
 # The Game class will define properties of the window.
 # The board class controls the execution of the game.
-# After the board state is initiated with help of the configparser,
-# start the main loop of the game, performing actions with a certain tick rate.
-# These actions include:
-# - Forwarding / execution of key inputs.
-# - Calculation and selection of data to send to robot units.
-# - Sending and enquiring data to and from robot units.
-# - Physics engine calculations.
+# The board state and the calculations of each tick are found
+# in the Qt-free simulation module.
+# The board starts the main loop of the game,
+# performing ticks of the simulation with a certain tick rate.
 # Also, paint the game with help of Qt.
+# This is the only module, that needs PyQt5.
 #
 # CHANGE HERE:
-# - the main loop
+# - the game loop scheduling
 # - window and paint functions
-# - physics of movement
-# - collision mechanics
-# - bullet movement and collision
-# - Qt key events and key state lists
-# - creation of message data & vision
-# - control over the board's obstacles
+# - Qt key events
 
 
 GAME_TITLE = 'SpaceBaseRobots'
@@ -50,73 +44,160 @@ TILE_SIZE = config_provider.TILE_SIZE
 
 class Game(QMainWindow):
 
-    def __init__(self):
+    def __init__(self, record_path=None,
+                 replay_path=None, replay_speed=1.0, replay_start=0,
+                 spectate=None):
         super().__init__()
 
-        self.initUI()
+        self.initUI(record_path, replay_path, replay_speed, replay_start,
+                    spectate)
 
-    def initUI(self):
-        self.board = Board(self)
+    def initUI(self, record_path, replay_path, replay_speed, replay_start,
+               spectate):
+        self.board = Board(self, record_path,
+                           replay_path, replay_speed, replay_start, spectate)
         self.setCentralWidget(self.board)
 
         # setting up Window
-        y_offset = (1080 - FIELD_SIZE) / 2
+        y_offset = (1080 - FIELD_SIZE) // 2
         self.setGeometry(300, y_offset, FIELD_SIZE, FIELD_SIZE)
         self.setWindowTitle(GAME_TITLE)
         self.show()
 
+    def closeEvent(self, event):
+        self.board.shutdown()
+        super().closeEvent(event)
 
-class Board(QWidget):
-    TILE_COUNT = int(FIELD_SIZE / TILE_SIZE)
-    SECONDS_PER_TICK = config_provider.SECONDS_PER_TICK
 
-    def __init__(self, parent):
-        super().__init__(parent)
-
-        self.time_stamp = -1
+class SpriteCache:
+    """Copies of a texture, scaled to the size of the objects drawn.
+    Optionally, copies are also rotated into angle buckets,
+    so painting an object only copies a small, ready-made pixmap.
+    Copies are created when they are needed first, see warm_up."""
 
-        self.init_textures()
+    def __init__(self, texture, angle_buckets=0):
+        self.texture = texture
+        self.angle_buckets = angle_buckets
+        self._sprites = dict()
 
-        # Read config files and construct robots:
-        # First, create config reader instance
-        config_reader = config_provider.ConfigReader()
+    @staticmethod
+    def sprite_size(radius):
+        return max(1, round(2 * radius))
+
+    def warm_up(self, radius):
+        """Create all copies for objects with radius."""
+        for bucket in range(max(self.angle_buckets, 1)):
+            self._sprite(radius, bucket)
+
+    def sprite(self, radius, alpha=0):
+        """Return the copy for an object with radius,
+        rotated by about alpha degrees if angle buckets are used."""
+        bucket = 0
+        if self.angle_buckets:
+            step = 360 / self.angle_buckets
+            bucket = round(alpha / step) % self.angle_buckets
+
+        key = (radius, bucket)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            sprite = self._sprite(radius, bucket)
+        return sprite
+
+    def _sprite(self, radius, bucket):
+        key = (radius, bucket)
+        if key in self._sprites:
+            return self._sprites[key]
+
+        size = SpriteCache.sprite_size(radius)
+        scaled = self.texture.scaled(size, size, Qt.IgnoreAspectRatio,
+                                     Qt.SmoothTransformation)
+        if not bucket:
+            self._sprites[key] = scaled
+            return scaled
+
+        # The rotated texture needs room for its corners.
+        side = size * 3 // 2 + 1
+        sprite = QPixmap(side, side)
+        sprite.fill(Qt.transparent)
+        qp = QPainter(sprite)
+        qp.setRenderHint(QPainter.SmoothPixmapTransform)
+        qp.translate(side / 2, side / 2)
+        qp.rotate(bucket * 360 / self.angle_buckets)
+        qp.drawPixmap(QPointF(-size / 2, -size / 2), scaled)
+        qp.end()
 
-        # Then read level and construct obstacles
-        config_reader.read_level('level1.txt')
-        self.obstacleArray = config_reader.create_level()
-        self.obstacle_list = utils.generate_obstacle_list(
-            self.obstacleArray, Board.TILE_COUNT)
-        self.rectangles = utils.group_tiles_into_rectangles(
-            self.obstacleArray, Board.TILE_COUNT, TILE_SIZE)
+        self._sprites[key] = sprite
+        return sprite
 
-        # Finally read robot config and create robots
-        config_reader.read_robots()
-        # Store data representations of all involved robot units.
-        self.robots = config_reader.create_robots()
 
-        # Data representations of bullets.
-        self.bullets = set()
+class DirtyRegion:
+    """Collects the areas of the board to repaint on a grid of cells.
+    Marking cells instead of uniting rectangles keeps the region simple
+    and quick to build, even for hundreds of bullets."""
 
-        # Used by example extension.
-        self.collision_scenarios = dict()
+    CELL_SIZE = 25
 
-        # Inititate key listener.
-        self.key_states = dict()
-        self.stateless_keys = dict()
-        self.initiate_key_listening()
-        self.setFocusPolicy(Qt.StrongFocus)
+    def __init__(self, size):
+        self.count = -(-size // DirtyRegion.CELL_SIZE)
+        self.cells = np.zeros((self.count, self.count), dtype=bool)
 
-        # Start the calculation process of the AI.
-        for robot in self.robots:
-            robot.start()
-
-        # Start the game loop.
-        self.game_loop_barrier = threading.Barrier(2)
-        self.init_game_loop()
-
-    # ==================================
-    # Set-Up and initiation
-    # ==================================
+    def add(self, centers, extent):
+        """Mark the squares with half side extent around centers."""
+        if not len(centers):
+            return
+        cell = DirtyRegion.CELL_SIZE
+        limit = self.count - 1
+        centers = np.asarray(centers, dtype=float)
+        first = np.clip((centers - extent) // cell, 0, limit).astype(int)
+        last = np.clip((centers + extent) // cell, 0, limit).astype(int)
+
+        # every square covers at most span + 1 cells per axis
+        span = int((last - first).max())
+        for dx in range(span + 1):
+            xs = np.minimum(first[:, 0] + dx, last[:, 0])
+            for dy in range(span + 1):
+                ys = np.minimum(first[:, 1] + dy, last[:, 1])
+                self.cells[ys, xs] = True
+
+    def region(self):
+        """Return the marked cells as QRegion and clear them."""
+        cell = DirtyRegion.CELL_SIZE
+        # horizontal runs of marked cells, row by row, are the
+        # sorted, non-overlapping bands setRects expects
+        edges = np.diff(self.cells.astype(np.int8), axis=1,
+                        prepend=0, append=0)
+        rects = []
+        for y, row in enumerate(edges):
+            starts = np.flatnonzero(row == 1)
+            ends = np.flatnonzero(row == -1)
+            rects.extend(QRect(int(start) * cell, y * cell,
+                               int(end - start) * cell, cell)
+                         for start, end in zip(starts, ends))
+        self.cells[:] = False
+
+        region = QRegion()
+        if rects:
+            region.setRects(rects)
+        return region
+
+
+class BoardPainter:
+    """Paints the board with its obstacles, robots and bullets.
+    Used by the Board widget as well as by the offscreen frame export,
+    see export module. Requires init_textures and an obstacleArray."""
+    TILE_COUNT = Simulation.TILE_COUNT
+    # Number of pre-rotated copies of the robot texture, 0 to rotate
+    # the scaled texture while painting.
+    ROBOT_ANGLE_BUCKETS = 72
+    BULLET_RADIUS = 10
+    # From this number of bullets on, all bullets are drawn in one call.
+    BULLET_BATCH_MIN = 16
+    # Colors of the robots in the FoV overlay, repeated for more robots,
+    # and the opacity of their FoV cones and of the tiles they see.
+    VISION_COLORS = ((255, 210, 0), (0, 200, 255),
+                     (255, 60, 200), (120, 255, 0))
+    VISION_CONE_ALPHA = 35
+    VISION_TILE_ALPHA = 120
 
     def init_textures(self):
         board_string = "textures/board.png"
@@ -147,496 +228,36 @@ class Board(QWidget):
         self.robot_texture = QPixmap(robot_string)
         self.bullet_texture = QPixmap(bullet_string)
 
-    def initiate_key_listening(self):
-        """Set up key listing by creating lists of keys to map.
-        Also map whether keys are stateless or require state information."""
-
-        collected_keys_states = defaultdict(list)
-        collected_keys_stateless = defaultdict(list)
-
-        # collect all key bindings from the robots
-        for robot in self.robots:
-            # no key bindings for this robot
-            if not robot.player_control:
-                continue
-
-            robot_keys = robot.player_control.control_scheme
-            for key, value in robot_keys.items():
-                if value in ControlScheme.STATELESS_KEYS:
-                    collected_keys_stateless[key].append(robot)
-                if value in ControlScheme.KEYS_WITH_STATE:
-                    collected_keys_states[key].append(robot)
-
-        # create key forwarding maps
-        for key, value in collected_keys_states.items():
-            self.key_states[key] = dict(is_pressed=False,
-                                        was_pressed=False,
-                                        targets=tuple(value))
-
-        for key, value in collected_keys_stateless.items():
-            self.stateless_keys[key] = tuple(value)
-
-    def init_game_loop(self):
-        """Starts the game loop scheduler in another thread.
-        Scheduler leaves the event control in hands of Qt,
-        but will call the game loop in periodic intervalls.
-        """
-
-        def game_loop_scheduler():
-            # get local reference
-            spt = Board.SECONDS_PER_TICK
-
-            previous = default_timer()
-            lag = 0.0
-
-            while 1:
-                current = default_timer()
-                elapsed = current - previous
-                previous = current
-
-                lag += elapsed
-                while lag >= spt:
-                    # blocking
-                    self.trigger_game_loop()
-                    lag -= spt
-
-                # non-blocking
-                QTimer.singleShot(0.0, self.update)
-
-        t = threading.Thread(target=game_loop_scheduler)
-        t.daemon = True
-        t.start()
-
-    def trigger_game_loop(self):
-        QTimer.singleShot(0.0, self.game_loop)
-
-        # restore barrier
-        self.game_loop_barrier.reset()
-
-        self.game_loop_barrier.wait()
-
-    # ==================================
-    # Main Loop
-    # ==================================
-
-    def game_loop(self):
-        """The game's main loop.
-        It enacts key input, performs physics calculations
-        and sends and queries data from and to robot units."""
-
-        # control part
-        # ------------
-        self.time_stamp += 1
-
-        self.handle_keys_with_state()
-
-        # physics part
-        # ------------
-        self.calculate_shoot_action()
-
-        self.calculate_bullets()
-
-        for robot in self.robots:
-            poll = robot.poll_action_data()
-            self.calculate_robot(poll, robot)
-
-        self.check_collision_robots()
-
-        # message part
-        # ------------
-        if self.time_stamp % 10 == 0:
-            m = self.create_alert_message()
-            for robot in self.robots:
-                if robot.alert_flag:
-                    robot.send_sensor_data(m)
-
-        for robot in self.robots:
-            v = self.create_vision_message(robot)
-            robot.send_sensor_data(v)
-            m = self.create_position_message(robot)
-            robot.send_sensor_data(m)
-
-        # signal, that calculations are done
-        self.game_loop_barrier.wait()
-
-    # ==================================
-    # Key input Area
-    # ==================================
-
-    def keyPressEvent(self, event):
-        key = event.key()
-
-        # handle stateless keys
-        if key in self.stateless_keys:
-            for robot in self.stateless_keys[key]:
-                robot.enter_key_action(key)
-
-        # set state variables for keys with state
-        if key in self.key_states:
-            key_dict = self.key_states[key]
-            key_dict['is_pressed'] = True
-            key_dict['was_pressed'] = True
-
-    def keyReleaseEvent(self, event):
-        key = event.key()
-
-        # set state variables for keys with state
-        if key in self.key_states:
-            key_dict = self.key_states[key]
-            key_dict['is_pressed'] = False
-
-    def handle_keys_with_state(self):
-        for key, value in self.key_states.items():
-            # state is acitve
-            if value['is_pressed'] or value['was_pressed']:
-                # Reset for check between this tick and next tick.
-                value['was_pressed'] = False
-                for robot in value['targets']:
-                    robot.enter_key_action(key, state=True)
-            # state is inactive
-            else:
-                for robot in value['targets']:
-                    robot.enter_key_action(key, state=False)
-
-        # perform actions for entwined keys
-        for robot in self.robots:
-            robot.finish_key_actions()
-
-    # ==================================
-    # Message Area
-    # ==================================
-    # ADD: You can add the creation of a new message type here!
-
-    def create_alert_message(self):
-        data = []
-
-        for robot in self.robots:
-            data.append((robot.x, robot.y))
-
-        return SensorData(SensorData.ALERT_STRING, data, self.time_stamp)
-
-    def create_position_message(self, robot):
-
-        data = (robot.x, robot.y, robot.alpha, robot.v, robot.v_alpha)
-        return SensorData(SensorData.POSITION_STRING, data, self.time_stamp)
-
-    def create_vision_message(self, robot):
-        "New message type for FoV-data of a robot."
-
-        # list of wall object tuples:
-        # ((xpos, ypos), type, distance)
-        board_data = self.calculate_vision_board(robot)
-
-        # list of robot object tuples:
-        # ((xpos, ypos), distance)
-        robot_data = self.calculate_vision_robots(robot)
-
-        data = (board_data, robot_data)
-        return SensorData(SensorData.VISION_STRING, data, self.time_stamp)
-
-    # ==================================
-    # Vision Area
-    # ==================================
-
-    def calculate_vision_board(self, robot):
-        """Calculate a list of all obejcts seen by a robot.
-        The objects are reduced to their center points for this calculation.
-        Returns a list of tuple values for obejcts seen:
-        (index in obstacle_Array, obstacle type, distance from robot's center)
-        """
-
-        # get the objects representative points
-        points = self.obstacle_list * 10 + 5
-        point = (robot.x, robot.y)
-
-        # use calculate_angles for the maths
-        diffs, dists = utils.calculate_angles(points, point,
-                                              robot.alpha, robot.fov_angle)
-
-        out = []
-        for obst, dif, dist in zip(self.obstacle_list, diffs, dists):
-            # if angle difference is greater zero, the obejct will not be seen
-            if dif <= 0:
-                x, y = obst
-                data = (obst, self.obstacleArray[x][y], dist)
-                out.append(data)
-
-        return out
-
-    def calculate_vision_robots(self, robot):
-        """Calculate a list of robots seen by a robot.
-        A robot (a) can be seen by robot (x) if:
-        - (a) touches (x)
-        - (a)s center is in the direct FoV-angle of (x)
-        - a point of (a)s radius is in the direct FoV-angle of (x)
-
-        For the last criteria, we check, if (a) intersects one of the rays,
-        marking the outline of the FoV.
-
-        Returns an array with entries for each robot:
-        The array index equals the robot's position in the server's array.
-        Array entries:
-        False, if the robot can not be seen.
-        A tuple, if the robot is seen:
-        (position, distance between the robot's centers)
-        """
-        point = (robot.x, robot.y)
-
-        # no robot is seen per default.
-        result = [False] * len(self.robots)
-        point_list = []
-
-        # robots in this list must undergo the angle-check
-        # since they don't overlap.
-        # this also stops invalid point values
-        # from being inserted in calculate_angle.
-        calc_list = []
-        calc_indices = []
-
-        # distance-check
-        for index, rb in enumerate(self.robots):
-            # for each robot, get its distance to (x) and calculate,
-            # wheather they overlap.
-            pos = (rb.x, rb.y)
-            check, d = utils.overlap_check(pos, point, rb.radius, robot.radius)
-            # create a list of position and distance for EVERY robot.
-            point_list.append((pos, d))
-
-            # the actual overlap-check:
-            if check:
-                result[index] = (pos, d)
-            # add more cases, if you want to propagate the angles as well
-            else:
-                calc_list.append(pos)
-                calc_indices.append(index)
-
-        # angle-check
-        angles = []
-        if calc_list:
-            angles, _ = utils.calculate_angles(calc_list, point,
-                                               robot.alpha, robot.fov_angle)
-
-        for index, dif in zip(calc_indices, angles):
-            # if the difference value is positive, the center is not seen.
-            if dif <= 0:
-                result[index] = point_list[index]
-
-        # ray-check
-        # calculate the two border rays of the fov
-        ray1 = utils.vector_from_angle(robot.alpha - robot.fov_angle/2)
-        ray2 = utils.vector_from_angle(robot.alpha + robot.fov_angle/2)
-
-        for index, val in enumerate(result):
-            # only check robots that are not already seen
-            if not val:
-                rb = self.robots[index]
-                circle = (rb.x, rb.y, rb.radius)
-                # again, python helps us out!
-                if (utils.ray_check(point, ray1, circle) or
-                        utils.ray_check(point, ray2, circle)):
-                    result[index] = point_list[index]
-
-        # now the list is complete
-        return result
-
-    # ==================================
-    # Collision Area
-    # ==================================
-
-    def calculate_robot(self, poll, robot):
-        """Uses current position data of robot robot and acceleration values
-        polled from the robot to calculate new position values.
-        """
-
-        # robot won't move while dead
-        if robot.dead:
-            return
-
-        # unpack robot output
-        a, a_alpha = poll
-
-        # checks if acceleration is valid
-        a = utils.limit(a, -robot.a_max, robot.a_max)
-
-        # checks if angle acceleration is valid
-        a_alpha = utils.limit(a_alpha, -robot.a_alpha_max, robot.a_alpha_max)
-
-        # calculates velocities
-        new_v = utils.limit(robot.v + a, -1 * robot.v_max, robot.v_max)
-        new_v_alpha = utils.limit(robot.v_alpha + a_alpha,
-                                  -1 * robot.v_alpha_max, robot.v_alpha_max)
-
-        # calculate alpha and x and y component of v
-        alpha = robot.alpha + new_v_alpha
-        alpha = alpha % 360
-        radian = ((alpha - 90) / 180 * math.pi)
-
-        dx = new_v * math.cos(radian)
-        dy = new_v * math.sin(radian)
-
-        # calculates the new position - factors in collisions
-        col_data = self.col_robots_walls(robot, dx, dy, new_v, new_v_alpha)
-        dx_col, dy_col, v_col, v_alpha_col = col_data
-        new_position_col = (robot.x + dx_col, robot.y + dy_col,
-                            alpha, v_col, new_v_alpha)
-
-        # finally, re-place the robot on the board
-        Board.place_robot(robot, *new_position_col)
-
-    def col_robots_walls(self, robot, max_dx, max_dy, v, v_alpha):
-        """Task 2: Here the collision with obstacles is calculated."""
-
-        min_dx = max_dx
-        min_dy = max_dy
-        final_tile_type = 0
-        # tests all tiles in the robots reach for collision
-        for obstacle in self.rectangles:
-            tile_type = obstacle[4]
-            dx, dy = self.col_robots_walls_helper(max_dx, max_dy,
-                                                  robot, obstacle)
-
-            if abs(dx) < abs(min_dx):
-                min_dx = dx
-                final_tile_type = tile_type
-            if abs(dy) < abs(min_dy):
-                min_dy = dy
-                final_tile_type = tile_type
-
-        # Check special actions for special tile types:
-        # ADD: If you add a new tile type, add its interaction here.
-        if final_tile_type == Hazard.Hole:
-            robot.deal_damage(1000)
-            
-        # TODO: Insert conditions for addiditial Hazards here
-
-        return min_dx, min_dy, v, v_alpha
-
-    @staticmethod
-    def col_robots_walls_helper(max_dx, max_dy, robot, rect):
-        tile_origin = QPointF(rect[0], rect[1])
-        dx_step = max_dx/10
-        dy_step = max_dy/10
-
-        dx = dy = 0
-        x_collided = False
-        y_collided = False
-        for _ in range(10):
-
-            if not x_collided:
-                dx += dx_step
-                robot_center = QPointF(
-                    dx + robot.x, dy + robot.y - 1 * dy_step)
-                x_collided = utils.check_collision_circle_rect(
-                    robot_center, robot.radius, tile_origin, rect[2], rect[3])
-
-            if not y_collided:
-                dy += dy_step
-                robot_center = QPointF(
-                    dx + robot.x - 1 * dx_step, dy + robot.y)
-                y_collided = utils.check_collision_circle_rect(
-                    robot_center, robot.radius, tile_origin, rect[2], rect[3])
-
-            if x_collided and y_collided:
-                break
-
-        if x_collided:
-            dx += -dx_step
-        if y_collided:
-            dy += -dy_step
-
-        return dx, dy
-
-    def check_collision_robots(self):
-        s = len(self.robots)
-        for i in range(s):
-            for j in range(s):
-                if not i == j:
-                    bot1 = self.robots[i]
-                    bot2 = self.robots[j]
-                    c1 = (bot1.x, bot1.y)
-                    r1 = bot1.radius
-                    c2 = (bot2.x, bot2.y)
-                    r2 = bot2.radius
-                    check, _ = utils.overlap_check(c1, c2, r1, r2)
-                    if check:
-                        self.handle_collision_event((i, j))
-
-    # ==================================
-    # Gun/Bullet Area
-    # ==================================
-
-    def calculate_shoot_action(self):
-        for robot in self.robots:
-            maybe_bullet = robot.perform_shoot_action()
-            if maybe_bullet:
-                self.bullets.add(maybe_bullet)
-
-    def calculate_bullets(self):
-        """
-        Here, the bullet movement happens.
-        Check for collision with walls and despawn the bullet.
-        Check for collision with robots and kill the robot (despawn the bullet)
-        """
-
-        for bullet in self.bullets.copy():
-            # move
-            initial_position = bullet.position
-            for test_speed in range(int(bullet.speed)):
-
-                direction_vec = utils.vector_from_angle(bullet.direction)
-                movement_vec = direction_vec * test_speed
-                new_position = initial_position + movement_vec
-                bullet.position = new_position
-
-                # perform collision with walls and robots
-                if (self.col_bullet_walls(bullet) or
-                        self.col_robots_bullets(bullet)):
-                    break
-
-    def col_robots_bullets(self, bullet):
-        for robot in self.robots:
-            robot_center = (robot.x, robot.y)
-            distance = utils.distance(robot_center, bullet.position)
-            if distance <= robot.radius:
-                robot.deal_damage()
-                # robot.dead = True
-                self.bullets.remove(bullet)
-                return True
-        return False
-
-    def col_bullet_walls(self, bullet):
-        # Set of tiles that are passable by bullets.
-        # TODO: If you want your Hazard to leave Bullets through
-        #       insert Hazard.YourNewHazard
-        can_pass = {Hazard.Empty}
-
-        position = bullet.position
-
-        tile_x = int(position[0] / TILE_SIZE)
-        tile_x = utils.limit(tile_x, 0, Board.TILE_COUNT - 1)
-
-        tile_y = int(position[1] / TILE_SIZE)
-        tile_y = utils.limit(tile_y, 0, Board.TILE_COUNT - 1)
-
-        if self.obstacleArray[tile_x][tile_y] not in can_pass:
-            self.bullets.remove(bullet)
-            return True
-
-        return False
-
-    # ==================================
-    # Painter Area
-    # ==================================
-
-    def paintEvent(self, e):
-        qp = QPainter()
-        qp.begin(self)
-        self.drawBoard(qp)
-        self.drawObstacles(qp)
-        for robot in self.robots:
+        self.robot_sprites = SpriteCache(self.robot_texture,
+                                         BoardPainter.ROBOT_ANGLE_BUCKETS)
+        self.bullet_sprites = SpriteCache(self.bullet_texture)
+        self.bullet_sprites.warm_up(BoardPainter.BULLET_RADIUS)
+        # reused by the batched bullet drawing
+        self.bullet_fragments = []
+        # board and obstacles, painted once, see drawBackground
+        self.background = None
+        # FoV overlay and the visions it shows, see drawVision
+        self.vision_layer = None
+        self.vision_source = None
+
+    def paint_frame(self, qp, robots, bullets, visions=None):
+        self.drawBackground(qp)
+        if visions:
+            self.drawVision(qp, visions)
+        for robot in robots:
             self.drawRobot(qp, robot)
-        self.drawBullets(qp)
-        qp.end()
+        self.drawBullets(qp, bullets)
+
+    def drawBackground(self, qp):
+        """Copy the board and its obstacles from a pixmap,
+        painting them only once, since the level doesn't change."""
+        if self.background is None:
+            self.background = QPixmap(FIELD_SIZE, FIELD_SIZE)
+            background_qp = QPainter(self.background)
+            self.drawBoard(background_qp)
+            self.drawObstacles(background_qp)
+            background_qp.end()
+        qp.drawPixmap(0, 0, self.background)
 
     def drawBoard(self, qp):
         texture = self.board_texture
@@ -649,8 +270,8 @@ class Board(QWidget):
 
     def drawObstacles(self, qp):
 
-        for xpos in range(Board.TILE_COUNT):
-            for ypos in range(Board.TILE_COUNT):
+        for xpos in range(BoardPainter.TILE_COUNT):
+            for ypos in range(BoardPainter.TILE_COUNT):
 
                 tileVal = self.obstacleArray[xpos][ypos]
 
@@ -681,8 +302,48 @@ class Board(QWidget):
                     qp.drawPixmap(target, texture, source)
                     qp.restore()
 
+    def drawVision(self, qp, visions):
+        """Copy the FoV overlay of visions, (tick, VisionFrames) as
+        published by the simulation, from a translucent layer.
+        The layer is only painted again, when the visions change."""
+        if visions is not self.vision_source:
+            self.vision_source = visions
+            self.paintVisionLayer(visions[1])
+        qp.drawPixmap(0, 0, self.vision_layer)
+
+    def paintVisionLayer(self, visions):
+        if self.vision_layer is None:
+            self.vision_layer = QPixmap(FIELD_SIZE, FIELD_SIZE)
+        self.vision_layer.fill(Qt.transparent)
+
+        qp = QPainter(self.vision_layer)
+        # the FoV has no range, so the cone reaches across the board
+        reach = 2 * FIELD_SIZE
+        colors = BoardPainter.VISION_COLORS
+        for index, vision in enumerate(visions):
+            r, g, b = colors[index % len(colors)]
+
+            # Qt's angles go counterclockwise from east,
+            # the robots' clockwise from north
+            qp.setPen(Qt.NoPen)
+            qp.setBrush(QColor(r, g, b, BoardPainter.VISION_CONE_ALPHA))
+            start = 90 - vision.alpha - vision.fov_angle / 2
+            qp.drawPie(QRectF(vision.x - reach, vision.y - reach,
+                              2 * reach, 2 * reach),
+                       int(16 * start), int(16 * vision.fov_angle))
+
+            qp.setBrush(QColor(r, g, b, BoardPainter.VISION_TILE_ALPHA))
+            qp.drawRects([QRect(x * TILE_SIZE, y * TILE_SIZE,
+                                TILE_SIZE, TILE_SIZE)
+                          for x, y in vision.tiles.tolist()])
+
+            # connect the robot to every robot it sees
+            qp.setPen(QPen(QColor(r, g, b), 2))
+            for x, y in vision.robots:
+                qp.drawLine(QPointF(vision.x, vision.y), QPointF(x, y))
+        qp.end()
+
     def drawRobot(self, qp, robot):
-        texture = self.robot_texture
         overlay = QRectF(robot.x - robot.radius, robot.y -
                          robot.radius, 2 * robot.radius, 2 * robot.radius)
         qp.save()
@@ -715,118 +376,356 @@ class Board(QWidget):
             G = 10
             B = 10
             A = 255
-        qp.setBrush(QColor(R, G, B, A))
+        qp.setBrush(QColor(int(R), int(G), int(B), A))
         # drawing overlay
         qp.setOpacity(overlay_op)
         qp.drawEllipse(overlay)
 
         # painting robot:
-        # mapping the texture to the robot
-        qp.translate(robot.x, robot.y)
-        qp.rotate(robot.alpha)
-        source = QRectF(0, 0, 567, 566)
-        target = QRectF(-robot.radius, -robot.radius,
-                        2 * robot.radius, 2 * robot.radius)
-        # drawing the robot
+        # the cached sprite is already scaled and rotated
         qp.setOpacity(robot_op)
-        qp.drawPixmap(target, texture, source)
+        sprites = self.robot_sprites
+        if sprites.angle_buckets:
+            sprite = sprites.sprite(robot.radius, robot.alpha)
+            qp.drawPixmap(QPointF(robot.x - sprite.width() / 2,
+                                  robot.y - sprite.height() / 2), sprite)
+        else:
+            sprite = sprites.sprite(robot.radius)
+            qp.translate(robot.x, robot.y)
+            qp.rotate(robot.alpha)
+            qp.drawPixmap(QPointF(-sprite.width() / 2,
+                                  -sprite.height() / 2), sprite)
 
         qp.restore()
 
-    def drawBullets(self, qp):
-        texture = self.bullet_texture
-        for bullet in self.bullets:
-            bullet_radius = 10
-            qp.save()
-            qp.translate(bullet.position[0], bullet.position[1])
-            source = QRectF(0, 0, 715, 715)
-            target = QRectF(-bullet_radius, -bullet_radius,
-                            2*bullet_radius, 2 * bullet_radius)
-            qp.drawPixmap(target, texture, source)
-            qp.restore()
+    def drawBullets(self, qp, bullets):
+        sprite = self.bullet_sprites.sprite(BoardPainter.BULLET_RADIUS)
+
+        count = len(bullets)
+        if count >= BoardPainter.BULLET_BATCH_MIN:
+            # One fragment of the sprite per bullet, placed by its center.
+            # Fragments are reused, only their positions change.
+            pool = self.bullet_fragments
+            if len(pool) < count:
+                source = QRectF(sprite.rect())
+                create = QPainter.PixmapFragment.create
+                pool.extend(create(QPointF(), source)
+                            for _ in range(count - len(pool)))
+            fragments = pool[:count]
+            for fragment, bullet in zip(fragments, bullets):
+                fragment.x = bullet.position[0]
+                fragment.y = bullet.position[1]
+            qp.drawPixmapFragments(fragments, sprite)
+            return
+
+        offset = sprite.width() / 2
+        for bullet in bullets:
+            qp.drawPixmap(QPointF(bullet.position[0] - offset,
+                                  bullet.position[1] - offset), sprite)
+
+
+class Board(QWidget, BoardPainter):
+    SECONDS_PER_TICK = Simulation.SECONDS_PER_TICK
+    # Interval of the replay timer.
+    REPLAY_FRAME_MS = 16
+    # Interval of repaints of the running game.
+    RENDER_FRAME_MS = 16
+    # Amount of ticks to skip per key press when seeking in a replay.
+    REPLAY_SEEK_TICKS = 200
+    # Toggles the FoV overlay of all robots, see toggle_vision.
+    VISION_KEY = Qt.Key_F1
+
+    def __init__(self, parent, record_path=None,
+                 replay_path=None, replay_speed=1.0, replay_start=0,
+                 spectate=None):
+        super().__init__(parent)
+
+        self.init_textures()
+        # Only the areas of robots and bullets that changed since
+        # the last frame are repainted, see update_frame.
+        self.dirty_region = DirtyRegion(FIELD_SIZE)
+        self.frame = None
+        # Visions of the FoV overlay, None while it is hidden.
+        self.visions = None
+
+        self.simulation = None
+        self.replay_player = None
+        self.spectator = None
+
+        # In replay mode, the board only renders the recorded match.
+        if replay_path:
+            self.init_replay(replay_path, replay_speed, replay_start)
+            return
+
+        # In spectator mode, the board renders a match streamed
+        # by a headless server.
+        if spectate:
+            self.init_spectator(spectate)
+            return
+
+        # The simulation reads the config files and constructs
+        # the board state, including the robots.
+        self.simulation = Simulation()
+        self.obstacleArray = self.simulation.obstacleArray
+        # Paint the published frames instead of the live robots,
+        # interpolated between the last two ticks.
+        self.simulation.publish_frames = True
+        self.frame_clock = default_timer()
+        for robot in self.simulation.robots:
+            self.robot_sprites.warm_up(robot.radius)
+
+        if record_path:
+            self.simulation.start_recording(record_path)
+
+        # Inititate key listener.
+        self.setFocusPolicy(Qt.StrongFocus)
+
+        # Start the calculation process of the AI.
+        self.simulation.start()
+
+        # Start the game loop.
+        self.game_loop_barrier = threading.Barrier(2)
+        self.init_game_loop()
+
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.update_frame)
+        self.render_timer.start(Board.RENDER_FRAME_MS)
 
     # ==================================
-    # Extensibility examples
+    # Set-Up and initiation
     # ==================================
-    # Here, we created a small abstract event handler for robot collision.
-    # This example is a showcase for quick yet abstract extensibility.
 
-    def add_catch_recipe(self, fugitive, hunters):
-        """Adds a new recipe type for collision events.
-        If fugitive is caught by any hunter, perform recipe action.
+    def init_game_loop(self):
+        """Starts the game loop scheduler in another thread.
+        Scheduler leaves the event control in hands of Qt,
+        but will call the game loop in periodic intervalls.
+        Repaints are triggered by the render timer.
         """
 
-        def recipe_action(hunter, board):
-            fugitive_bot = board.robots[fugitive]
-            fugitive_pos = (fugitive_bot.x, fugitive_bot.y)
-            hunter_bot = board.robots[hunter]
-            Board.teleport_furthest_corner(fugitive_pos, hunter_bot)
+        def game_loop_scheduler():
+            # get local reference
+            spt = Board.SECONDS_PER_TICK
 
-        for h in hunters:
-            f = partial(recipe_action, h)
-            self.collision_scenarios[(fugitive, h)] = f
+            previous = default_timer()
+            lag = 0.0
 
-    def handle_collision_event(self, col_tuple):
-        """Collision event handler.
-        Perform all given recipes for current collision event.
+            while 1:
+                current = default_timer()
+                elapsed = current - previous
+                previous = current
+
+                lag += elapsed
+                while lag >= spt:
+                    # blocking
+                    self.trigger_game_loop()
+                    lag -= spt
+
+                # sleep until the next tick is due
+                time.sleep(max(spt - lag - (default_timer() - current), 0))
+
+        t = threading.Thread(target=game_loop_scheduler)
+        t.daemon = True
+        t.start()
+
+    def trigger_game_loop(self):
+        QTimer.singleShot(0, self.game_loop)
+
+        # restore barrier
+        self.game_loop_barrier.reset()
+
+        self.game_loop_barrier.wait()
+
+    def init_replay(self, path, speed, start_tick):
+        """Render a recorded match instead of running the simulation.
+        The replay is played with speed times the speed of the game,
+        starting at start_tick.
+        No AI is running in replay mode.
+        Keys: left/right: seek, up/down: change speed, space: pause.
         """
-        if col_tuple in self.collision_scenarios:
-            self.collision_scenarios[col_tuple](self)
+        self.replay_player = ReplayPlayer(ReplayReader(path))
+        self.obstacleArray = self.replay_player.obstacle_array
+        self.replay_speed = speed
+        self.replay_paused = False
+
+        # Current position in the replay in (fractions of) ticks.
+        first_tick = self.replay_player.reader.first_tick
+        self.replay_position = max(start_tick, first_tick)
+        self.replay_clock = default_timer()
+
+        self.setFocusPolicy(Qt.StrongFocus)
+
+        self.replay_timer = QTimer(self)
+        self.replay_timer.timeout.connect(self.replay_loop)
+        self.replay_timer.start(Board.REPLAY_FRAME_MS)
+
+    def init_spectator(self, address):
+        """Render the match streamed by a headless server
+        at address ('host:port' or 'port'), see spectator module."""
+        self.spectator = SpectatorConnection(*parse_address(address))
+        self.spectator.connect()
+        self.spectator.start()
+        self.obstacleArray = self.spectator.decoder.obstacle_array
+
+        self.spectator_timer = QTimer(self)
+        self.spectator_timer.timeout.connect(self.update_frame)
+        self.spectator_timer.start(Board.REPLAY_FRAME_MS)
+
+    def shutdown(self):
+        """Finish running recordings and close the connections
+        of remote AIs before the window is closed."""
+        if self.simulation:
+            self.simulation.close()
+        if self.spectator:
+            self.spectator.close()
 
     # ==================================
-    # Static positioning methods
+    # Main Loop
     # ==================================
 
-    @staticmethod
-    def place_robot(robot, x, y, alpha, v, v_alpha):
-        """Re-places a robot with given position values.
-        No sensor data sent.
-        """
-        robot.x = x
-        robot.y = y
-        robot.alpha = alpha
-        robot.v = v
-        robot.v_alpha = v_alpha
+    def game_loop(self):
+        """The game's main loop.
+        Performs one tick of the simulation."""
 
-    @staticmethod
-    def teleport_furthest_corner(point, robot):
-        """Teleports the robot to a position in the corner
-        with the largest distance from point.
-        """
+        self.simulation.step()
+        self.frame_clock = default_timer()
 
-        lower_limit = TILE_SIZE + robot.radius + 1
-        upper_limit = FIELD_SIZE - TILE_SIZE - robot.radius - 2
+        # signal, that calculations are done
+        self.game_loop_barrier.wait()
 
-        top_left_corner = (lower_limit, lower_limit, 135, 0, 0)
-        bot_left_corner = (lower_limit, upper_limit, 45, 0, 0)
-        top_right_corner = (upper_limit, lower_limit, 225, 0, 0)
-        bot_right_corner = (upper_limit, upper_limit, 315, 0, 0)
+    def replay_loop(self):
+        """Show the recorded tick belonging to the passed replay time."""
+        player = self.replay_player
+
+        current = default_timer()
+        elapsed = current - self.replay_clock
+        self.replay_clock = current
+
+        if not (self.replay_paused or player.at_end()):
+            passed_ticks = elapsed * self.replay_speed / Board.SECONDS_PER_TICK
+            self.replay_position += passed_ticks
+
+        player.seek(int(self.replay_position))
+
+        self.update_frame()
+
+    def replay_key(self, key):
+        """Seek, change speed or pause the replay."""
+        reader = self.replay_player.reader
+
+        if key == Qt.Key_Right:
+            self.replay_position += Board.REPLAY_SEEK_TICKS
+        elif key == Qt.Key_Left:
+            self.replay_position -= Board.REPLAY_SEEK_TICKS
+        elif key == Qt.Key_Up:
+            self.replay_speed *= 2
+        elif key == Qt.Key_Down:
+            self.replay_speed /= 2
+        elif key == Qt.Key_Space:
+            self.replay_paused = not self.replay_paused
+
+        self.replay_position = utils.limit(self.replay_position,
+                                           reader.first_tick,
+                                           reader.last_tick)
+
+    def current_frame(self):
+        """Return the robots and bullets to paint."""
+        if self.replay_player:
+            return self.replay_player.robots, self.replay_player.bullets
+        if self.spectator:
+            return self.spectator.decoder.frame
+
+        frames = self.simulation.frames
+        if not frames:
+            # no tick calculated yet
+            frame = self.simulation.create_frame()
+            return frame.robots, frame.bullets
+
+        passed = (default_timer() - self.frame_clock) / Board.SECONDS_PER_TICK
+        return interpolate_frames(*frames, utils.limit(passed, 0, 1))
 
-        if point[0] > (FIELD_SIZE / 2):
-            if point[1] > (FIELD_SIZE / 2):
-                position = top_left_corner
-            else:
-                position = bot_left_corner
-        else:
-            if point[1] > (FIELD_SIZE / 2):
-                position = top_right_corner
-            else:
-                position = bot_right_corner
+    # ==================================
+    # Key input Area
+    # ==================================
+
+    def toggle_vision(self):
+        """Show or hide what the robots see. Only while the overlay
+        is shown, the simulation publishes the robots' visions."""
+        simulation = self.simulation
+        simulation.publish_vision = not simulation.publish_vision
+        simulation.visions = None
+
+    def keyPressEvent(self, event):
+        if self.simulation and event.key() == Board.VISION_KEY:
+            if not event.isAutoRepeat():
+                self.toggle_vision()
+        elif self.simulation:
+            self.simulation.press_key(event.key())
+        elif self.replay_player:
+            self.replay_key(event.key())
+
+    def keyReleaseEvent(self, event):
+        if self.simulation and event.key() != Board.VISION_KEY:
+            self.simulation.release_key(event.key())
+
+    # ==================================
+    # Painter Area
+    # ==================================
+
+    def update_frame(self):
+        """Schedule a repaint of the areas, where robots or bullets
+        were shown or will be shown, instead of the whole board."""
+        frame = self.current_frame()
+
+        visions = self.simulation.visions if self.simulation else None
+        if visions is not self.visions:
+            # the overlay changes all over the board
+            self.visions = visions
+            self.frame = frame
+            self.update()
+            return
+
+        if frame == self.frame:
+            return
+
+        for robots, bullets in (self.frame or ((), ()), frame):
+            for robot in robots:
+                # rotated sprites need room for their corners
+                extent = math.ceil(1.5 * robot.radius) + 2
+                self.dirty_region.add(((robot.x, robot.y),), extent)
+            self.dirty_region.add([b.position for b in bullets],
+                                  BoardPainter.BULLET_RADIUS + 2)
+
+        self.frame = frame
+        self.update(self.dirty_region.region())
+
+    def paintEvent(self, e):
+        # Qt clips the painter to the scheduled region.
+        qp = QPainter()
+        qp.begin(self)
+        robots, bullets = self.frame or self.current_frame()
+        self.paint_frame(qp, robots, bullets, self.visions)
+        qp.end()
 
-        robot.place_robot(*position)
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=GAME_TITLE)
+    parser.add_argument('--record', metavar='PATH',
+                        help='record the match into a replay log')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='watch a recorded match instead of playing')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='playback speed of the replay')
+    parser.add_argument('--start', type=int, default=0, metavar='TICK',
+                        help='tick to start the replay at')
+    parser.add_argument('--spectate', metavar='[HOST:]PORT',
+                        help='watch a match streamed by '
+                             'python -m headless --asyncio --spectate')
+    return parser.parse_args(argv)
 
-class Hazard:
-    """ A namespace for the different types of tiles on the board.
-    Might contain additional functionality later.
-    """
-    Empty = 0
-    Wall = 1
-    Border = 2
-    Hole = 3
-    # TODO: Insert addiditial Hazards here
 
 if __name__ == '__main__':
+    args = parse_args()
     app = QApplication(sys.argv)
-    game = Game()
+    game = Game(args.record, args.replay, args.speed, args.start,
+                args.spectate)
     sys.exit(app.exec_())
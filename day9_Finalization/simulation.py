@@ -0,0 +1,997 @@
+import math
+import pickle
+import random
+import zlib
+from functools import partial
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from ai_control import SensorData
+from delta_protocol import VISION, POSITION
+from model import Bullet, Ray
+from player_control import ControlScheme
+from remote_control import RemoteControl, RemoteServer, SOCKET_PATH
+from replay import ReplayRecorder, RobotFrame, BulletFrame
+from vision_encoder import VisionEncoder
+import config_provider
+import utils
+
+# ==================================
+# Simulation
+# ==================================
+#
+# In this file, you will find the core of the game, free of any Qt code:
+# The Simulation class holds the board state and calculates server ticks.
+# After the board state is initiated with help of the configparser,
+# each call of step() performs one tick of the game.
+# These actions include:
+# - Forwarding / execution of key inputs.
+# - Calculation and selection of data to send to robot units.
+# - Sending and enquiring data to and from robot units.
+# - Physics engine calculations.
+# The Qt window in the server module as well as headless tools
+# drive the simulation.
+#
+# CHANGE HERE:
+# - the main loop
+# - physics of movement
+# - collision mechanics
+# - bullet movement and collision
+# - key state lists
+# - creation of message data & vision
+# - control over the board's obstacles
+# - content of world snapshots
+# - published frames and their interpolation
+
+
+FIELD_SIZE = config_provider.FIELD_SIZE
+TILE_SIZE = config_provider.TILE_SIZE
+
+# Immutable snapshot of everything a renderer paints after a tick.
+Frame = namedtuple('Frame', ['tick', 'robots', 'bullets'])
+# What a robot saw in a tick, taken from its vision message:
+# its position and view, the obstacle tiles (n×2 array of indices)
+# and the centers of the robots in its FoV.
+VisionFrame = namedtuple('VisionFrame', ['x', 'y', 'alpha', 'fov_angle',
+                                         'tiles', 'robots'])
+
+
+class Simulation:
+    TILE_COUNT = int(FIELD_SIZE / TILE_SIZE)
+    SECONDS_PER_TICK = config_provider.SECONDS_PER_TICK
+    # Cell size of the spatial index used for alert messages.
+    ALERT_GRID_CELL_SIZE = 100
+    # Robots moving further in a tick are not interpolated, see frames.
+    INTERPOLATION_MAX_DISTANCE = 50
+
+    def __init__(self, level_name='level1.txt', robot_config=None):
+
+        self.time_stamp = -1
+
+        # Read config files and construct robots:
+        # First, create config reader instance
+        config_reader = config_provider.ConfigReader()
+        # The validated level and robot options are cached on disk,
+        # they are only parsed again when the config files change.
+        compiled = config_reader.compile(level_name, robot_config)
+
+        # Then construct obstacles
+        self.obstacleArray = compiled['level']
+        self.obstacle_list = utils.generate_obstacle_list(
+            self.obstacleArray, Simulation.TILE_COUNT)
+        # center points of the obstacle tiles, used for vision
+        self.obstacle_points = self.obstacle_list * 10 + 5
+        self.rectangles = utils.group_tiles_into_rectangles(
+            self.obstacleArray, Simulation.TILE_COUNT, TILE_SIZE)
+        # Array representation of the rectangles for the physics engine.
+        self.rect_array = np.array([r[:4] for r in self.rectangles],
+                                   dtype=float).reshape(-1, 4)
+        self.rect_types = [r[4] for r in self.rectangles]
+
+        # Finally create robots
+        # By default, the robots.ini in the configs folder is used.
+        # Store data representations of all involved robot units.
+        self.robots = config_reader.build_robots(compiled['robots'])
+        # Names of the robots' config sections.
+        self.robot_names = [spec['name'] for spec in compiled['robots']]
+
+        # Encoder for the optional encoded vision messages.
+        obstacle_types = [self.obstacleArray[x][y]
+                          for x, y in self.obstacle_list]
+        self.vision_encoder = VisionEncoder(self.obstacle_list,
+                                            obstacle_types, TILE_SIZE,
+                                            FIELD_SIZE, len(self.robots))
+
+        # Data representations of bullets.
+        self.bullets = set()
+
+        # Used by example extension.
+        self.collision_scenarios = dict()
+        # The recipes' arguments, needed to rebuild them from snapshots.
+        self.catch_recipes = []
+
+        # Inititate key listener.
+        self.key_states = dict()
+        self.stateless_keys = dict()
+        self.initiate_key_listening()
+
+        # Optional recording of the match.
+        self.recorder = None
+
+        # Optional frames of the last two ticks for renderers:
+        # (previous frame, current frame), replaced as a whole every tick.
+        self.publish_frames = False
+        self.frames = None
+        # Optional vision of all robots in the last tick for renderers:
+        # (tick, VisionFrame per robot), replaced as a whole every tick.
+        self.publish_vision = False
+        self.visions = None
+
+        # Accepts the AI processes of robots with remote AI.
+        self.remote_server = None
+
+    # ==================================
+    # Set-Up and initiation
+    # ==================================
+
+    def start(self, threaded=True, remote_socket=SOCKET_PATH):
+        """Start the calculation process of the AI.
+        Without threading, the AIs calculate their responses
+        immediately when the messages are sent during step().
+        If robots have remote AIs, their processes can connect
+        to the Unix domain socket at remote_socket.
+        With remote_socket None, the caller serves remote AIs itself,
+        see async_server module."""
+        for robot in self.robots:
+            robot.start(threaded)
+
+        controls = [robot.robot_control for robot in self.robots]
+        remote = any(isinstance(c, RemoteControl) for c in controls)
+        if remote and remote_socket:
+            self.remote_server = RemoteServer(remote_socket,
+                                              self.robot_names, controls)
+            self.remote_server.start()
+
+    def close(self):
+        """Finish the recording and close the connections
+        of remote AIs."""
+        self.stop_recording()
+        if self.remote_server:
+            self.remote_server.close()
+            self.remote_server = None
+
+    def start_recording(self, path):
+        """Record all following ticks into a replay log at path."""
+        self.stop_recording()
+        self.recorder = ReplayRecorder(path, self.robots, self.obstacleArray)
+
+    def stop_recording(self):
+        """Finish the replay log, if the match is being recorded."""
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def initiate_key_listening(self):
+        """Set up key listing by creating lists of keys to map.
+        Also map whether keys are stateless or require state information."""
+
+        collected_keys_states = defaultdict(list)
+        collected_keys_stateless = defaultdict(list)
+
+        # collect all key bindings from the robots
+        for robot in self.robots:
+            # no key bindings for this robot
+            if not robot.player_control:
+                continue
+
+            robot_keys = robot.player_control.control_scheme
+            for key, value in robot_keys.items():
+                if value in ControlScheme.STATELESS_KEYS:
+                    collected_keys_stateless[key].append(robot)
+                if value in ControlScheme.KEYS_WITH_STATE:
+                    collected_keys_states[key].append(robot)
+
+        # create key forwarding maps
+        for key, value in collected_keys_states.items():
+            self.key_states[key] = dict(is_pressed=False,
+                                        was_pressed=False,
+                                        targets=tuple(value))
+
+        for key, value in collected_keys_stateless.items():
+            self.stateless_keys[key] = tuple(value)
+
+    # ==================================
+    # State Area
+    # ==================================
+
+    def world_state(self):
+        """Return the current state of the board as plain data:
+        the robots including their timers and guns as well as the bullets.
+        """
+        robots = []
+        for robot in self.robots:
+            gun = robot.gun
+            robots.append(dict(x=robot.x, y=robot.y, alpha=robot.alpha,
+                               v=robot.v, v_alpha=robot.v_alpha,
+                               life=robot.life,
+                               dead=robot.dead, immune=robot.immune,
+                               respawn=robot.respawn_countdown,
+                               immunity=robot.immunity_countdown,
+                               reload=gun.reload_remaining() if gun else 0,
+                               trigun=gun.burst_count if gun else 0))
+
+        bullets = [(b.id, float(b.position[0]), float(b.position[1]),
+                    b.speed, b.direction) for b in self.bullets]
+
+        return dict(tick=self.time_stamp, robots=robots, bullets=bullets)
+
+    def create_frame(self):
+        """Return an immutable snapshot of the robots and bullets,
+        which stays valid while the simulation goes on."""
+        robots = tuple(RobotFrame(r.x, r.y, r.alpha, r.v, r.v_alpha, r.life,
+                                  r.dead, r.immune, r.radius, r.max_life)
+                       for r in self.robots)
+        bullets = tuple(BulletFrame(b.id, (float(b.position[0]),
+                                           float(b.position[1])))
+                        for b in self.bullets)
+        return Frame(self.time_stamp, robots, bullets)
+
+    def snapshot(self):
+        """Return a copy of the complete state of the simulation.
+        Unlike world_state, it contains everything needed to continue
+        the match from this tick: the state of every robot unit
+        including AI, player control and gun, the bullets, the key states,
+        the collision recipes and the state of the random number generator.
+        Use restore to rewind the simulation or to fork it in a new one.
+
+        Runs only continue exactly like the original, if the AIs
+        calculate their responses in place, see start.
+        """
+        key_states = {key: (state['is_pressed'], state['was_pressed'])
+                      for key, state in self.key_states.items()}
+
+        owners = {robot: index for index, robot in enumerate(self.robots)}
+        bullets = [(b.id, np.array(b.position, dtype=float),
+                    b.speed, b.direction, owners.get(b.owner))
+                   for b in self.bullets]
+
+        return dict(tick=self.time_stamp,
+                    robots=[robot.snapshot() for robot in self.robots],
+                    bullets=bullets,
+                    key_states=key_states,
+                    catch_recipes=list(self.catch_recipes),
+                    random_state=random.getstate())
+
+    def restore(self, state):
+        """Set the simulation to a state returned by snapshot.
+        The simulation must use the same level and robot configuration
+        as the one the snapshot was taken from.
+        Replay logs can't follow jumps in time, so stop recording first."""
+        if len(state['robots']) != len(self.robots):
+            raise ValueError('Snapshot does not match the robot count.')
+
+        self.time_stamp = state['tick']
+
+        for robot, robot_state in zip(self.robots, state['robots']):
+            robot.restore(robot_state)
+
+        self.bullets = set()
+        for bullet_id, position, speed, direction, owner in state['bullets']:
+            if owner is not None:
+                owner = self.robots[owner]
+            bullet = Bullet(np.array(position), speed, direction, owner)
+            bullet.id = bullet_id
+            self.bullets.add(bullet)
+
+        for key, (is_pressed, was_pressed) in state['key_states'].items():
+            if key in self.key_states:
+                self.key_states[key]['is_pressed'] = is_pressed
+                self.key_states[key]['was_pressed'] = was_pressed
+
+        self.collision_scenarios = dict()
+        self.catch_recipes = []
+        for fugitive, hunters in state['catch_recipes']:
+            self.add_catch_recipe(fugitive, hunters)
+
+        random.setstate(state['random_state'])
+
+    # ==================================
+    # Main Loop
+    # ==================================
+
+    def step(self):
+        """Perform one tick of the game's main loop.
+        It enacts key input, performs physics calculations
+        and sends and queries data from and to robot units."""
+
+        # control part
+        # ------------
+        self.time_stamp += 1
+
+        for robot in self.robots:
+            robot.update_timers(Simulation.SECONDS_PER_TICK)
+
+        self.handle_keys_with_state()
+
+        # physics part
+        # ------------
+        self.calculate_shoot_action()
+
+        self.calculate_bullets()
+
+        for robot in self.robots:
+            poll = robot.poll_action_data()
+            self.calculate_robot(poll, robot)
+
+        self.check_collision_robots()
+
+        # message part
+        # ------------
+        self.send_alert_messages()
+
+        visions = []
+        for robot in self.robots:
+            if robot.delta_encoder:
+                robot_data = self.calculate_vision_robots(robot)
+                v = robot.delta_encoder.encode_vision(
+                    self, robot, robot_data, robot.delta_ack(VISION))
+            else:
+                v = self.create_vision_message(robot)
+                robot_data = v.data[1]
+            robot.send_sensor_data(v)
+            if self.publish_vision:
+                visions.append(self.create_vision_frame(robot, v,
+                                                        robot_data))
+
+            if robot.encoded_vision_flag:
+                e = self.create_encoded_vision_message(robot, robot_data)
+                robot.send_sensor_data(e)
+
+            if robot.delta_encoder:
+                m = robot.delta_encoder.encode_position(
+                    self, robot, robot.delta_ack(POSITION))
+            else:
+                m = self.create_position_message(robot)
+            robot.send_sensor_data(m)
+
+        # record part
+        # -----------
+        if self.recorder:
+            self.recorder.record_tick(self.time_stamp, self.robots)
+            if self.recorder.keyframe_due(self.time_stamp):
+                self.recorder.record_keyframe(self.time_stamp,
+                                              self.world_state())
+
+        if self.publish_frames:
+            current = self.create_frame()
+            previous = self.frames[1] if self.frames else current
+            self.frames = (previous, current)
+
+        if self.publish_vision:
+            self.visions = (self.time_stamp, tuple(visions))
+
+    # ==================================
+    # Key input Area
+    # ==================================
+
+    def press_key(self, key):
+        """Enter a key press event given by its Qt key code."""
+        if self.recorder:
+            self.recorder.record_key_event(self.time_stamp, key, True)
+
+        # handle stateless keys
+        if key in self.stateless_keys:
+            for robot in self.stateless_keys[key]:
+                robot.enter_key_action(key)
+
+        # set state variables for keys with state
+        if key in self.key_states:
+            key_dict = self.key_states[key]
+            key_dict['is_pressed'] = True
+            key_dict['was_pressed'] = True
+
+    def release_key(self, key):
+        """Enter a key release event given by its Qt key code."""
+        if self.recorder:
+            self.recorder.record_key_event(self.time_stamp, key, False)
+
+        # set state variables for keys with state
+        if key in self.key_states:
+            key_dict = self.key_states[key]
+            key_dict['is_pressed'] = False
+
+    def handle_keys_with_state(self):
+        for key, value in self.key_states.items():
+            # state is acitve
+            if value['is_pressed'] or value['was_pressed']:
+                # Reset for check between this tick and next tick.
+                value['was_pressed'] = False
+                for robot in value['targets']:
+                    robot.enter_key_action(key, state=True)
+            # state is inactive
+            else:
+                for robot in value['targets']:
+                    robot.enter_key_action(key, state=False)
+
+        # perform actions for entwined keys
+        for robot in self.robots:
+            robot.finish_key_actions()
+
+    # ==================================
+    # Message Area
+    # ==================================
+    # ADD: You can add the creation of a new message type here!
+
+    def send_alert_messages(self):
+        """Send alert messages to all robots with alert flag,
+        whose alert period is over.
+        Robots interested in all robots share the same message."""
+        receivers = [robot for robot in self.robots if robot.alert_flag and
+                     self.time_stamp % robot.alert_period == 0]
+        if not receivers:
+            return
+
+        shared_message = None
+        grid = None
+
+        for robot in receivers:
+            if not robot.alert_k_nearest:
+                if shared_message is None:
+                    shared_message = self.create_alert_message()
+                robot.send_sensor_data(shared_message)
+                continue
+
+            if grid is None:
+                grid = utils.SpatialGrid(
+                    [(r.x, r.y) for r in self.robots],
+                    Simulation.ALERT_GRID_CELL_SIZE)
+            robot.send_sensor_data(
+                self.create_interest_alert_message(robot, grid))
+
+    def create_alert_message(self):
+        data = []
+
+        for robot in self.robots:
+            data.append((robot.x, robot.y))
+
+        return SensorData(SensorData.ALERT_STRING, data, self.time_stamp)
+
+    def create_interest_alert_message(self, robot, grid):
+        """Alert message with only the robots of interest for robot:
+        The robot itself, its targets and its k nearest robots.
+        The data maps robot indices to positions, the robot itself first.
+        grid is a SpatialGrid of the positions of all robots."""
+        index = self.robots.index(robot)
+
+        interest = [index]
+        for target in robot.alert_targets:
+            if target not in interest:
+                interest.append(target)
+        interest += grid.nearest((robot.x, robot.y), robot.alert_k_nearest,
+                                 exclude=set(interest))
+
+        data = {i: (self.robots[i].x, self.robots[i].y) for i in interest}
+        return SensorData(SensorData.ALERT_STRING, data, self.time_stamp)
+
+    def create_position_message(self, robot):
+
+        data = (robot.x, robot.y, robot.alpha, robot.v, robot.v_alpha)
+        return SensorData(SensorData.POSITION_STRING, data, self.time_stamp)
+
+    def create_vision_message(self, robot):
+        "New message type for FoV-data of a robot."
+
+        # list of wall object tuples:
+        # ((xpos, ypos), type, distance)
+        board_data = self.calculate_vision_board(robot)
+
+        # list of robot object tuples:
+        # ((xpos, ypos), distance)
+        robot_data = self.calculate_vision_robots(robot)
+
+        data = (board_data, robot_data)
+        return SensorData(SensorData.VISION_STRING, data, self.time_stamp)
+
+    def create_encoded_vision_message(self, robot, robot_data=None):
+        """Optional message type: FoV-data of a robot
+        as float32 array of fixed size, see vision_encoder module.
+        robot_data may be the result of calculate_vision_robots,
+        if it is already known."""
+        if robot_data is None:
+            robot_data = self.calculate_vision_robots(robot)
+
+        data = self.vision_encoder.encode(robot, self.robots, robot_data)
+        return SensorData(SensorData.ENCODED_VISION_STRING, data,
+                          self.time_stamp)
+
+    def create_vision_frame(self, robot, vision_message, robot_data):
+        """Return what robot saw in this tick, reusing the results of
+        its vision message instead of calculating them again."""
+        if robot.delta_encoder:
+            # delta messages only contain the changes,
+            # but the encoder keeps the complete visibility
+            history = robot.delta_encoder.history[VISION]
+            visible = history[self.time_stamp][0]
+            tiles = self.obstacle_list[visible]
+        else:
+            board_data = vision_message.data[0]
+            tiles = np.array([entry[0] for entry in board_data],
+                             dtype=int).reshape(-1, 2)
+        # every robot touches itself
+        seen = tuple(entry[0] for other, entry in zip(self.robots,
+                                                      robot_data)
+                     if entry and other is not robot)
+        return VisionFrame(robot.x, robot.y, robot.alpha, robot.fov_angle,
+                           tiles, seen)
+
+    # ==================================
+    # Vision Area
+    # ==================================
+
+    def calculate_vision_board(self, robot):
+        """Calculate a list of all obejcts seen by a robot.
+        The objects are reduced to their center points for this calculation.
+        Returns a list of tuple values for obejcts seen:
+        (index in obstacle_Array, obstacle type, distance from robot's center)
+        """
+
+        # get the objects representative points
+        points = self.obstacle_points
+        point = (robot.x, robot.y)
+
+        # use calculate_angles for the maths
+        diffs, dists = utils.calculate_angles(points, point,
+                                              robot.alpha, robot.fov_angle)
+
+        out = []
+        for obst, dif, dist in zip(self.obstacle_list, diffs, dists):
+            # if angle difference is greater zero, the obejct will not be seen
+            if dif <= 0:
+                x, y = obst
+                data = (obst, self.obstacleArray[x][y], dist)
+                out.append(data)
+
+        return out
+
+    def calculate_vision_robots(self, robot):
+        """Calculate a list of robots seen by a robot.
+        A robot (a) can be seen by robot (x) if:
+        - (a) touches (x)
+        - (a)s center is in the direct FoV-angle of (x)
+        - a point of (a)s radius is in the direct FoV-angle of (x)
+
+        For the last criteria, we check, if (a) intersects one of the rays,
+        marking the outline of the FoV.
+
+        Returns an array with entries for each robot:
+        The array index equals the robot's position in the server's array.
+        Array entries:
+        False, if the robot can not be seen.
+        A tuple, if the robot is seen:
+        (position, distance between the robot's centers)
+        """
+        point = (robot.x, robot.y)
+
+        # no robot is seen per default.
+        result = [False] * len(self.robots)
+        point_list = []
+
+        # robots in this list must undergo the angle-check
+        # since they don't overlap.
+        # this also stops invalid point values
+        # from being inserted in calculate_angle.
+        calc_list = []
+        calc_indices = []
+
+        # distance-check
+        for index, rb in enumerate(self.robots):
+            # for each robot, get its distance to (x) and calculate,
+            # wheather they overlap.
+            pos = (rb.x, rb.y)
+            check, d = utils.overlap_check(pos, point, rb.radius, robot.radius)
+            # create a list of position and distance for EVERY robot.
+            point_list.append((pos, d))
+
+            # the actual overlap-check:
+            if check:
+                result[index] = (pos, d)
+            # add more cases, if you want to propagate the angles as well
+            else:
+                calc_list.append(pos)
+                calc_indices.append(index)
+
+        # angle-check
+        angles = []
+        if calc_list:
+            angles, _ = utils.calculate_angles(calc_list, point,
+                                               robot.alpha, robot.fov_angle)
+
+        for index, dif in zip(calc_indices, angles):
+            # if the difference value is positive, the center is not seen.
+            if dif <= 0:
+                result[index] = point_list[index]
+
+        # ray-check
+        # calculate the two border rays of the fov
+        ray1 = utils.vector_from_angle(robot.alpha - robot.fov_angle/2)
+        ray2 = utils.vector_from_angle(robot.alpha + robot.fov_angle/2)
+
+        for index, val in enumerate(result):
+            # only check robots that are not already seen
+            if not val:
+                rb = self.robots[index]
+                circle = (rb.x, rb.y, rb.radius)
+                # again, python helps us out!
+                if (utils.ray_check(point, ray1, circle) or
+                        utils.ray_check(point, ray2, circle)):
+                    result[index] = point_list[index]
+
+        # now the list is complete
+        return result
+
+    # ==================================
+    # Collision Area
+    # ==================================
+
+    def calculate_robot(self, poll, robot):
+        """Uses current position data of robot robot and acceleration values
+        polled from the robot to calculate new position values.
+        """
+
+        # robot won't move while dead
+        if robot.dead:
+            return
+
+        # unpack robot output
+        a, a_alpha = poll
+
+        # checks if acceleration is valid
+        a = utils.limit(a, -robot.a_max, robot.a_max)
+
+        # checks if angle acceleration is valid
+        a_alpha = utils.limit(a_alpha, -robot.a_alpha_max, robot.a_alpha_max)
+
+        # calculates velocities
+        new_v = utils.limit(robot.v + a, -1 * robot.v_max, robot.v_max)
+        new_v_alpha = utils.limit(robot.v_alpha + a_alpha,
+                                  -1 * robot.v_alpha_max, robot.v_alpha_max)
+
+        # calculate alpha and x and y component of v
+        alpha = robot.alpha + new_v_alpha
+        alpha = alpha % 360
+        radian = ((alpha - 90) / 180 * math.pi)
+
+        dx = new_v * math.cos(radian)
+        dy = new_v * math.sin(radian)
+
+        # calculates the new position - factors in collisions
+        col_data = self.col_robots_walls(robot, dx, dy, new_v, new_v_alpha)
+        dx_col, dy_col, v_col, v_alpha_col = col_data
+        new_position_col = (robot.x + dx_col, robot.y + dy_col,
+                            alpha, v_col, new_v_alpha)
+
+        # finally, re-place the robot on the board
+        Simulation.place_robot(robot, *new_position_col)
+
+    def col_robots_walls(self, robot, max_dx, max_dy, v, v_alpha):
+        """Task 2: Here the collision with obstacles is calculated."""
+
+        min_dx = max_dx
+        min_dy = max_dy
+        final_tile_type = 0
+        # tests all tiles in the robots reach for collision
+        dxs, dys = self.col_robots_walls_batch(max_dx, max_dy,
+                                               robot, self.rect_array)
+
+        for dx, dy, tile_type in zip(dxs.tolist(), dys.tolist(),
+                                     self.rect_types):
+            if abs(dx) < abs(min_dx):
+                min_dx = dx
+                final_tile_type = tile_type
+            if abs(dy) < abs(min_dy):
+                min_dy = dy
+                final_tile_type = tile_type
+
+        # Check special actions for special tile types:
+        # ADD: If you add a new tile type, add its interaction here.
+        if final_tile_type == Hazard.Hole:
+            robot.deal_damage(1000)
+            
+        # TODO: Insert conditions for addiditial Hazards here
+
+        return min_dx, min_dy, v, v_alpha
+
+    @staticmethod
+    def col_robots_walls_batch(max_dx, max_dy, robot, rects):
+        """Calculate how far the robot can move towards (max_dx, max_dy)
+        until it collides with each rectangle of the (n, 4)-array rects.
+        The move is checked in ten steps, all rectangles at once.
+        Returns the arrays (dx, dy) with one entry per rectangle.
+        """
+        count = len(rects)
+        dx_step = max_dx/10
+        dy_step = max_dy/10
+
+        dx = np.zeros(count)
+        dy = np.zeros(count)
+        x_collided = np.zeros(count, dtype=bool)
+        y_collided = np.zeros(count, dtype=bool)
+        for _ in range(10):
+
+            # only move on in directions without collision
+            x_moving = ~x_collided
+            dx[x_moving] += dx_step
+            x_collided = x_collided | (x_moving & (
+                utils.check_collision_circle_rects(
+                    dx + robot.x, dy + robot.y - 1 * dy_step,
+                    robot.radius, rects)))
+
+            y_moving = ~y_collided
+            dy[y_moving] += dy_step
+            y_collided = y_collided | (y_moving & (
+                utils.check_collision_circle_rects(
+                    dx + robot.x - 1 * dx_step, dy + robot.y,
+                    robot.radius, rects)))
+
+            if x_collided.all() and y_collided.all():
+                break
+
+        dx[x_collided] += -dx_step
+        dy[y_collided] += -dy_step
+
+        return dx, dy
+
+    def check_collision_robots(self):
+        s = len(self.robots)
+        for i in range(s):
+            for j in range(s):
+                if not i == j:
+                    bot1 = self.robots[i]
+                    bot2 = self.robots[j]
+                    c1 = (bot1.x, bot1.y)
+                    r1 = bot1.radius
+                    c2 = (bot2.x, bot2.y)
+                    r2 = bot2.radius
+                    check, _ = utils.overlap_check(c1, c2, r1, r2)
+                    if check:
+                        self.handle_collision_event((i, j))
+
+    # ==================================
+    # Gun/Bullet Area
+    # ==================================
+
+    def calculate_shoot_action(self):
+        for robot in self.robots:
+            for shot in robot.perform_shoot_action():
+                if isinstance(shot, Ray):
+                    self.resolve_ray(shot)
+                    continue
+
+                self.bullets.add(shot)
+                if self.recorder:
+                    self.recorder.record_bullet_spawn(self.time_stamp, shot)
+
+    def resolve_ray(self, ray):
+        """Hit the first robot on the way of a hit-scan ray,
+        unless an obstacle tile stops the ray before.
+        Instead of moving a bullet step by step, only the tiles
+        the ray crosses are checked, see utils.traverse_tiles."""
+        # same tiles as for bullets, see col_bullet_walls
+        can_pass = {Hazard.Empty}
+
+        ray_vector = utils.vector_from_angle(ray.direction)
+        reach = ray.range
+        for tile_x, tile_y, distance in utils.traverse_tiles(
+                ray.position, ray_vector, ray.range, TILE_SIZE,
+                Simulation.TILE_COUNT):
+            if self.obstacleArray[tile_x][tile_y] not in can_pass:
+                reach = distance
+                break
+
+        target = None
+        for robot in self.robots:
+            distance = utils.ray_circle_distance(
+                ray.position, ray_vector, (robot.x, robot.y, robot.radius))
+            if distance is not None and distance <= reach:
+                target, reach = robot, distance
+
+        if target:
+            destroyed = target.deal_damage()
+            if destroyed and ray.owner not in (None, target):
+                ray.owner.kills += 1
+
+    def calculate_bullets(self):
+        """
+        Here, the bullet movement happens.
+        Check for collision with walls and despawn the bullet.
+        Check for collision with robots and kill the robot (despawn the bullet)
+        """
+
+        for bullet in self.bullets.copy():
+            # move
+            initial_position = bullet.position
+            for test_speed in range(int(bullet.speed)):
+
+                direction_vec = utils.vector_from_angle(bullet.direction)
+                movement_vec = direction_vec * test_speed
+                new_position = initial_position + movement_vec
+                bullet.position = new_position
+
+                # perform collision with walls and robots
+                if (self.col_bullet_walls(bullet) or
+                        self.col_robots_bullets(bullet)):
+                    break
+
+    def col_robots_bullets(self, bullet):
+        for robot in self.robots:
+            robot_center = (robot.x, robot.y)
+            distance = utils.distance(robot_center, bullet.position)
+            if distance <= robot.radius:
+                destroyed = robot.deal_damage()
+                if destroyed and bullet.owner not in (None, robot):
+                    bullet.owner.kills += 1
+                # robot.dead = True
+                self.despawn_bullet(bullet)
+                return True
+        return False
+
+    def col_bullet_walls(self, bullet):
+        # Set of tiles that are passable by bullets.
+        # TODO: If you want your Hazard to leave Bullets through
+        #       insert Hazard.YourNewHazard
+        can_pass = {Hazard.Empty}
+
+        position = bullet.position
+
+        tile_x = int(position[0] / TILE_SIZE)
+        tile_x = utils.limit(tile_x, 0, Simulation.TILE_COUNT - 1)
+
+        tile_y = int(position[1] / TILE_SIZE)
+        tile_y = utils.limit(tile_y, 0, Simulation.TILE_COUNT - 1)
+
+        if self.obstacleArray[tile_x][tile_y] not in can_pass:
+            self.despawn_bullet(bullet)
+            return True
+
+        return False
+
+    def despawn_bullet(self, bullet):
+        self.bullets.remove(bullet)
+        if self.recorder:
+            self.recorder.record_bullet_despawn(self.time_stamp, bullet)
+
+    # ==================================
+    # Extensibility examples
+    # ==================================
+    # Here, we created a small abstract event handler for robot collision.
+    # This example is a showcase for quick yet abstract extensibility.
+
+    def add_catch_recipe(self, fugitive, hunters):
+        """Adds a new recipe type for collision events.
+        If fugitive is caught by any hunter, perform recipe action.
+        """
+        self.catch_recipes.append((fugitive, tuple(hunters)))
+
+        def recipe_action(hunter, simulation):
+            fugitive_bot = simulation.robots[fugitive]
+            fugitive_pos = (fugitive_bot.x, fugitive_bot.y)
+            hunter_bot = simulation.robots[hunter]
+            Simulation.teleport_furthest_corner(fugitive_pos, hunter_bot)
+
+        for h in hunters:
+            f = partial(recipe_action, h)
+            self.collision_scenarios[(fugitive, h)] = f
+
+    def handle_collision_event(self, col_tuple):
+        """Collision event handler.
+        Perform all given recipes for current collision event.
+        """
+        if col_tuple in self.collision_scenarios:
+            self.collision_scenarios[col_tuple](self)
+
+    # ==================================
+    # Static positioning methods
+    # ==================================
+
+    @staticmethod
+    def place_robot(robot, x, y, alpha, v, v_alpha):
+        """Re-places a robot with given position values.
+        No sensor data sent.
+        """
+        robot.x = x
+        robot.y = y
+        robot.alpha = alpha
+        robot.v = v
+        robot.v_alpha = v_alpha
+
+    @staticmethod
+    def teleport_furthest_corner(point, robot):
+        """Teleports the robot to a position in the corner
+        with the largest distance from point.
+        """
+
+        lower_limit = TILE_SIZE + robot.radius + 1
+        upper_limit = FIELD_SIZE - TILE_SIZE - robot.radius - 2
+
+        top_left_corner = (lower_limit, lower_limit, 135, 0, 0)
+        bot_left_corner = (lower_limit, upper_limit, 45, 0, 0)
+        top_right_corner = (upper_limit, lower_limit, 225, 0, 0)
+        bot_right_corner = (upper_limit, upper_limit, 315, 0, 0)
+
+        if point[0] > (FIELD_SIZE / 2):
+            if point[1] > (FIELD_SIZE / 2):
+                position = top_left_corner
+            else:
+                position = bot_left_corner
+        else:
+            if point[1] > (FIELD_SIZE / 2):
+                position = top_right_corner
+            else:
+                position = bot_right_corner
+
+        robot.place_robot(*position)
+
+
+class Hazard:
+    """ A namespace for the different types of tiles on the board.
+    Might contain additional functionality later.
+    """
+    Empty = 0
+    Wall = 1
+    Border = 2
+    Hole = 3
+    # TODO: Insert addiditial Hazards here
+
+
+# ==================================
+# Frames
+# ==================================
+# Renderers with a higher frame rate than the server tick rate
+# show the frames in between two ticks.
+
+def interpolate_frames(previous, current, t,
+                       max_distance=Simulation.INTERPOLATION_MAX_DISTANCE):
+    """Return the robots and bullets between two frames,
+    t = 0 at the previous, t = 1 at the current frame.
+    Robots that died, respawned or moved further than max_distance
+    as well as new bullets are shown as in the current frame."""
+    robots = []
+    for old, new in zip(previous.robots, current.robots):
+        dx = new.x - old.x
+        dy = new.y - old.y
+        if old.dead != new.dead or math.hypot(dx, dy) > max_distance:
+            robots.append(new)
+            continue
+        turn = (new.alpha - old.alpha + 180) % 360 - 180
+        robots.append(new._replace(x=old.x + dx * t, y=old.y + dy * t,
+                                   alpha=(old.alpha + turn * t) % 360))
+
+    positions = {b.id: b.position for b in previous.bullets}
+    bullets = []
+    for bullet in current.bullets:
+        old = positions.get(bullet.id)
+        if old is None:
+            bullets.append(bullet)
+            continue
+        (x0, y0), (x1, y1) = old, bullet.position
+        bullets.append(BulletFrame(bullet.id, (x0 + (x1 - x0) * t,
+                                               y0 + (y1 - y0) * t)))
+
+    return robots, bullets
+
+
+# ==================================
+# Snapshot files
+# ==================================
+# Snapshots are stored as compressed pickles.
+# Only load snapshot files from trusted sources!
+
+def dump_snapshot(snapshot):
+    """Serialize a snapshot of the simulation into compressed bytes."""
+    return zlib.compress(pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL))
+
+
+def load_snapshot(data):
+    """Load a snapshot serialized with dump_snapshot."""
+    return pickle.loads(zlib.decompress(data))
@@ -0,0 +1,369 @@
+import zlib
+import socket
+import struct
+import asyncio
+import threading
+
+import numpy as np
+
+from async_server import write_frame
+from remote_control import HEADER, read_frame
+from replay import (RobotFrame, BulletFrame, FLAG_DEAD, FLAG_IMMUNE,
+                    bullet_step)
+
+# ==================================
+# Spectator
+# ==================================
+#
+# In this file, you will find the spectator stream of the async server:
+# Spectators connect over TCP and receive the world state of every tick,
+# so matches can be watched without running Qt on the server host,
+# see the --spectate option of the server module.
+# Every KEYFRAME_INTERVAL ticks, the server sends a keyframe of the world.
+# The frames in between only contain the changes since the last keyframe,
+# so a spectator can skip any of them.
+# Each frame is encoded once and the same bytes are written to all
+# spectators. If a spectator can't keep up, it only gets every n-th
+# frame, n doubling while its connection is congested.
+#
+# Frames use the header of the remote_control module.
+#   INIT    '<HH' (robot count, level size), robots as STATIC_DTYPE,
+#           zlib compressed obstacle array (uint8)
+#   KEY     '<iHH' (tick, robot count, bullet count),
+#           robots as ROBOT_DTYPE, bullets as BULLET_DTYPE
+#   DELTA   '<iiHHH' (tick, keyframe tick, changed robot count,
+#           new bullet count, removed bullet count),
+#           changed robots as CHANGED_DTYPE, bullets not in the keyframe
+#           as BULLET_DTYPE, ids of keyframe bullets removed ('<u4')
+# Bullets of the keyframe move on by their step vector (sx, sy) per tick.
+#
+# CHANGE HERE:
+# - content of the frames
+# - keyframe interval
+# - downsampling policy
+
+HOST = '127.0.0.1'
+PORT = 50507
+
+INIT_FRAME = 1
+KEY_FRAME = 2
+DELTA_FRAME = 3
+
+INIT = struct.Struct('<HH')
+KEY = struct.Struct('<iHH')
+DELTA = struct.Struct('<iiHHH')
+
+STATIC_DTYPE = np.dtype([('radius', '<f4'), ('max_life', '<i2')])
+ROBOT_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('alpha', '<f4'),
+                        ('life', '<i2'), ('flags', 'u1')])
+CHANGED_DTYPE = np.dtype([('index', '<u2'), ('robot', ROBOT_DTYPE)])
+BULLET_DTYPE = np.dtype([('id', '<u4'), ('x', '<f4'), ('y', '<f4'),
+                         ('sx', '<f4'), ('sy', '<f4')])
+
+
+def parse_address(address):
+    """Split 'host:port' or 'port' into (host, port)."""
+    host, _, port = address.rpartition(':')
+    return host or HOST, int(port)
+
+
+# Server side:
+# ============
+
+class StreamEncoder:
+    """Encodes the world state of a simulation into frames."""
+
+    KEYFRAME_INTERVAL = 20
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.key_tick = None
+        self.key_robots = None
+        self.key_bullet_ids = set()
+
+    def init_frame(self):
+        robots = self.simulation.robots
+        static = np.array([(r.radius, r.max_life) for r in robots],
+                          dtype=STATIC_DTYPE)
+        level = np.asarray(self.simulation.obstacleArray, dtype=np.uint8)
+        return (INIT.pack(len(robots), len(level)) + static.tobytes() +
+                zlib.compress(level.tobytes()))
+
+    def keyframe_due(self, tick):
+        return (self.key_tick is None or
+                tick - self.key_tick >= StreamEncoder.KEYFRAME_INTERVAL)
+
+    def encode(self):
+        """Return the frame type and payload for the current tick."""
+        simulation = self.simulation
+        tick = simulation.time_stamp
+
+        robots = np.array([(r.x, r.y, r.alpha, r.life,
+                            FLAG_DEAD * r.dead + FLAG_IMMUNE * r.immune)
+                           for r in simulation.robots], dtype=ROBOT_DTYPE)
+
+        if self.keyframe_due(tick):
+            bullets = StreamEncoder.bullet_array(simulation.bullets)
+            self.key_tick = tick
+            self.key_robots = robots
+            self.key_bullet_ids = set(bullets['id'].tolist())
+            payload = (KEY.pack(tick, len(robots), len(bullets)) +
+                       robots.tobytes() + bullets.tobytes())
+            return KEY_FRAME, payload
+
+        indices = np.flatnonzero(robots != self.key_robots)
+        changed = np.zeros(len(indices), dtype=CHANGED_DTYPE)
+        changed['index'] = indices
+        changed['robot'] = robots[indices]
+
+        key_ids = self.key_bullet_ids
+        new = StreamEncoder.bullet_array(
+            [b for b in simulation.bullets if b.id not in key_ids])
+        alive = {b.id for b in simulation.bullets}
+        removed = np.array(sorted(key_ids - alive), dtype='<u4')
+
+        payload = (DELTA.pack(tick, self.key_tick, len(changed), len(new),
+                              len(removed)) +
+                   changed.tobytes() + new.tobytes() + removed.tobytes())
+        return DELTA_FRAME, payload
+
+    @staticmethod
+    def bullet_array(bullets):
+        rows = [(b.id, b.position[0], b.position[1],
+                 *bullet_step(b.speed, b.direction)) for b in bullets]
+        return np.array(rows, dtype=BULLET_DTYPE)
+
+
+class Spectator:
+    """Connection of one spectator on the server."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        # only every interval-th delta frame is sent
+        self.interval = 1
+        self.skipped = 0
+
+    def offer(self, frame, key, tick):
+        """Write the frame, unless the spectator has to skip it."""
+        transport = self.writer.transport
+        buffered = transport.get_write_buffer_size()
+
+        if buffered > SpectatorServer.BUFFER_LIMIT:
+            # hopelessly behind
+            transport.abort()
+            return
+
+        congested = buffered > SpectatorServer.HIGH_WATER
+        if key:
+            if congested:
+                self.interval = min(2 * self.interval,
+                                    SpectatorServer.MAX_INTERVAL)
+            elif not buffered:
+                self.interval = max(self.interval // 2, 1)
+        elif congested or tick % self.interval:
+            self.skipped += 1
+            return
+
+        self.writer.write(frame)
+
+
+class SpectatorServer:
+    """Streams the world state of a simulation to spectators.
+    Runs as service of an AsyncServer, see add_service."""
+
+    # buffered bytes per spectator to double its interval,
+    # and to disconnect it
+    HIGH_WATER = 16 * 1024
+    BUFFER_LIMIT = 1024 * 1024
+    MAX_INTERVAL = 16
+
+    def __init__(self, simulation, host=HOST, port=PORT):
+        self.host = host
+        self.port = port
+        self.encoder = StreamEncoder(simulation)
+        self.spectators = set()
+
+        self._server = None
+        self._tasks = set()
+        self._init_frame = None
+        self._last_keyframe = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_spectator,
+                                                  self.host, self.port)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+        for spectator in self.spectators:
+            # don't wait for slow spectators to read their buffers
+            spectator.writer.transport.abort()
+        # let the connections notice the closed streams
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=1)
+
+    def on_tick(self, simulation):
+        tick = simulation.time_stamp
+        key = self.encoder.keyframe_due(tick)
+        # deltas are only needed by connected spectators
+        if not (key or self.spectators):
+            return
+
+        frame_type, payload = self.encoder.encode()
+        frame = HEADER.pack(len(payload), frame_type) + payload
+        if key:
+            self._last_keyframe = frame
+
+        for spectator in list(self.spectators):
+            spectator.offer(frame, key, tick)
+
+    async def _serve_spectator(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._stream(reader, writer)
+        finally:
+            self._tasks.discard(task)
+
+    async def _stream(self, reader, writer):
+        if self._init_frame is None:
+            self._init_frame = self.encoder.init_frame()
+        write_frame(writer, INIT_FRAME, self._init_frame)
+        if self._last_keyframe:
+            writer.write(self._last_keyframe)
+
+        spectator = Spectator(writer)
+        self.spectators.add(spectator)
+        try:
+            # spectators don't send anything, wait for the end
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.spectators.discard(spectator)
+            writer.close()
+
+
+# Spectator side:
+# ===============
+
+class StreamDecoder:
+    """Reconstructs robots and bullets to paint from the frames."""
+
+    def __init__(self):
+        self.obstacle_array = None
+        self.radii = ()
+        self.max_lifes = ()
+        self.tick = None
+        # robots and bullets, replaced as a whole on every frame
+        self.frame = ((), ())
+
+        self._key_tick = None
+        self._key_robots = None
+        self._key_bullets = None
+
+    def apply(self, frame_type, payload):
+        if frame_type == INIT_FRAME:
+            self._apply_init(payload)
+        elif frame_type == KEY_FRAME:
+            self._apply_key(payload)
+        elif frame_type == DELTA_FRAME:
+            self._apply_delta(payload)
+
+    def _apply_init(self, payload):
+        robot_count, level_size = INIT.unpack_from(payload)
+        static = np.frombuffer(payload, STATIC_DTYPE, robot_count,
+                               INIT.size)
+        self.radii = static['radius'].tolist()
+        self.max_lifes = static['max_life'].tolist()
+
+        level = zlib.decompress(payload[INIT.size + static.nbytes:])
+        level = np.frombuffer(level, dtype=np.uint8)
+        self.obstacle_array = level.reshape(level_size, level_size).tolist()
+
+    def _apply_key(self, payload):
+        tick, robot_count, bullet_count = KEY.unpack_from(payload)
+        robots = np.frombuffer(payload, ROBOT_DTYPE, robot_count, KEY.size)
+        bullets = np.frombuffer(payload, BULLET_DTYPE, bullet_count,
+                                KEY.size + robots.nbytes)
+
+        self._key_tick = tick
+        self._key_robots = robots
+        self._key_bullets = bullets
+        self._show(tick, robots, bullets)
+
+    def _apply_delta(self, payload):
+        (tick, key_tick, changed_count, new_count,
+         removed_count) = DELTA.unpack_from(payload)
+        if key_tick != self._key_tick:
+            # keyframe missing
+            return
+
+        offset = DELTA.size
+        changed = np.frombuffer(payload, CHANGED_DTYPE, changed_count, offset)
+        offset += changed.nbytes
+        new = np.frombuffer(payload, BULLET_DTYPE, new_count, offset)
+        offset += new.nbytes
+        removed = np.frombuffer(payload, '<u4', removed_count, offset)
+
+        robots = self._key_robots.copy()
+        robots[changed['index']] = changed['robot']
+
+        bullets = self._key_bullets
+        bullets = bullets[~np.isin(bullets['id'], removed)].copy()
+        passed = tick - key_tick
+        bullets['x'] += bullets['sx'] * passed
+        bullets['y'] += bullets['sy'] * passed
+
+        self._show(tick, robots, np.concatenate((bullets, new)))
+
+    def _show(self, tick, robots, bullets):
+        robot_frames = tuple(
+            RobotFrame(x, y, alpha, 0, 0, life,
+                       bool(flags & FLAG_DEAD), bool(flags & FLAG_IMMUNE),
+                       radius, max_life)
+            for (x, y, alpha, life, flags), radius, max_life
+            in zip(robots.tolist(), self.radii, self.max_lifes))
+        bullet_frames = tuple(BulletFrame(i, (x, y)) for i, x, y, _, _
+                              in bullets.tolist())
+
+        self.tick = tick
+        self.frame = (robot_frames, bullet_frames)
+
+
+class SpectatorConnection:
+    """Blocking connection of a spectator, for example a viewer window.
+    connect reads the level, start receives the frames in a thread."""
+
+    def __init__(self, host=HOST, port=PORT):
+        self.address = (host, port)
+        self.decoder = StreamDecoder()
+        self.connection = None
+
+    def connect(self):
+        self.connection = socket.create_connection(self.address)
+        frame = read_frame(self.connection)
+        if frame is None or frame[0] != INIT_FRAME:
+            raise ConnectionError('no spectator stream')
+        self.decoder.apply(*frame)
+
+    def start(self):
+        t = threading.Thread(target=self._receive_loop)
+        t.daemon = True
+        t.start()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+
+    def _receive_loop(self):
+        while True:
+            try:
+                frame = read_frame(self.connection)
+            except OSError:
+                return
+            if frame is None:
+                return
+            self.decoder.apply(*frame)
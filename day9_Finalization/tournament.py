@@ -0,0 +1,178 @@
+import os
+import sys
+import csv
+import random
+import argparse
+from timeit import default_timer
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from simulation import Simulation
+
+# ==================================
+# Tournament
+# ==================================
+#
+# In this file, you will find the command line entry for tournaments:
+# Every combination of robot configs and levels is played headlessly
+# several times. The matches are distributed over a pool of processes,
+# so each core of the machine calculates one simulation at a time.
+# The results of all matches are aggregated per robot into a CSV report.
+#
+# Usage (from the game folder):
+#   python -m tournament --robots a.ini b.ini --levels level1.txt --runs 20
+#
+# CHANGE HERE:
+# - command line options
+# - collected statistics
+# - columns of the report
+
+REPORT_COLUMNS = ('robots', 'level', 'robot', 'name', 'runs',
+                  'kills', 'deaths', 'survival_time', 'first_death',
+                  'ticks_per_second')
+
+RUN_COLUMNS = ('robots', 'level', 'run', 'robot', 'name',
+               'kills', 'deaths', 'survival_time', 'first_death',
+               'ticks_per_second')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m tournament',
+        description='Play every combination of robot configs and levels '
+                    'several times without a window and report the results.')
+    parser.add_argument('--robots', nargs='+', metavar='INI',
+                        default=[os.path.join('configs', 'robots.ini')],
+                        help='robot config files to compare')
+    parser.add_argument('--levels', nargs='+', metavar='LEVEL',
+                        default=['level1.txt'],
+                        help='level files in the configs folder')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='number of matches per combination')
+    parser.add_argument('--ticks', type=int, default=2000,
+                        help='number of server ticks per match')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='base seed of the random number generator')
+    parser.add_argument('--output', default='tournament.csv',
+                        help='path of the aggregated report')
+    parser.add_argument('--runs-output', metavar='PATH',
+                        help='additionally write the results of every match')
+    return parser.parse_args(argv)
+
+
+def play_match(robot_config, level, run, ticks, seed):
+    """Play one match without window and threads.
+    Return one result row per robot unit.
+    Executed in the worker processes."""
+    random.seed(seed)
+
+    simulation = Simulation(level, robot_config)
+    simulation.start(threaded=False)
+
+    robots = simulation.robots
+    alive_ticks = [0] * len(robots)
+    first_death = [None] * len(robots)
+
+    start = default_timer()
+    for tick in range(ticks):
+        simulation.step()
+
+        for index, robot in enumerate(robots):
+            if not robot.dead:
+                alive_ticks[index] += 1
+            elif first_death[index] is None:
+                first_death[index] = tick
+    elapsed = default_timer() - start
+
+    tps = ticks / elapsed if elapsed else float('inf')
+    spt = Simulation.SECONDS_PER_TICK
+
+    rows = []
+    for index, robot in enumerate(robots):
+        death = first_death[index]
+        rows.append(dict(robots=robot_config, level=level, run=run,
+                         robot=index, name=simulation.robot_names[index],
+                         kills=robot.kills, deaths=robot.deaths,
+                         survival_time=alive_ticks[index] * spt,
+                         first_death='' if death is None else death * spt,
+                         ticks_per_second=tps))
+    return rows
+
+
+def aggregate(run_rows):
+    """Average the results of all matches per config, level and robot.
+    The first death is averaged over the matches the robot died in."""
+    groups = defaultdict(list)
+    for row in run_rows:
+        groups[(row['robots'], row['level'], row['robot'])].append(row)
+
+    report = []
+    for (robots, level, robot), rows in sorted(groups.items()):
+        runs = len(rows)
+        deaths = [r['first_death'] for r in rows if r['first_death'] != '']
+
+        report.append(dict(
+            robots=robots, level=level, robot=robot, name=rows[0]['name'],
+            runs=runs,
+            kills=sum(r['kills'] for r in rows) / runs,
+            deaths=sum(r['deaths'] for r in rows) / runs,
+            survival_time=sum(r['survival_time'] for r in rows) / runs,
+            first_death=sum(deaths) / len(deaths) if deaths else '',
+            ticks_per_second=sum(r['ticks_per_second'] for r in rows) / runs))
+    return report
+
+
+def write_csv(path, columns, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # fail early instead of in every worker
+    for path in args.robots:
+        if not os.path.exists(path):
+            print(f'robot config not found: {path}', file=sys.stderr)
+            return 1
+    for level in args.levels:
+        if not os.path.exists(os.path.join('configs', level)):
+            print(f'level not found: {level}', file=sys.stderr)
+            return 1
+
+    jobs = [(robots, level, run, args.ticks, args.seed + run)
+            for robots in args.robots
+            for level in args.levels
+            for run in range(args.runs)]
+
+    run_rows = []
+    start = default_timer()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(play_match, *job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            run_rows.extend(future.result())
+            print(f'\r{done}/{len(jobs)} matches', end='', flush=True)
+    print(f' in {default_timer() - start:.1f}s')
+
+    run_rows.sort(key=lambda r: (r['robots'], r['level'], r['run'],
+                                 r['robot']))
+    report = aggregate(run_rows)
+
+    write_csv(args.output, REPORT_COLUMNS, report)
+    if args.runs_output:
+        write_csv(args.runs_output, RUN_COLUMNS, run_rows)
+
+    for row in report:
+        print(f"{row['robots']} {row['level']} {row['name']}: "
+              f"kills={row['kills']:.2f} deaths={row['deaths']:.2f} "
+              f"survival={row['survival_time']:.1f}s")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
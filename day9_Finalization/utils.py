@@ -2,8 +2,7 @@ import numpy as np
 import math
 import time
 import threading
-
-from PyQt5.QtCore import QPointF
+from collections import defaultdict
 
 # ==================================
 # Utils
@@ -21,13 +20,8 @@ def generate_obstacle_list(matrix, size):
     Take a matrix of a given size
     and return the index pairs of all non-zero entries in a numpy array.
     """
-    out = []
-    for i in range(size):
-        for j in range(size):
-            if matrix[i][j]:
-                out.append((i, j))
-
-    return np.array(out)
+    matrix = np.asarray(matrix)[:size, :size]
+    return np.argwhere(matrix)
 
 
 def group_tiles_into_rectangles(tile_array, tile_count, tile_size):
@@ -203,11 +197,14 @@ def ray_check(point, ray_vector, circle):
 
 # geometric helper functions:
 # ===========================
+#
+# Note: These helpers work on plain floats and numpy arrays only,
+# so the physics can run without Qt (for example in worker processes).
+# Qt types are used for rendering only.
 def distance(a, b):
     """Simple function to calculate the euclidian distance between to points.
     """
-    val = np.array(a) - b
-    return np.linalg.norm(val)
+    return math.hypot(a[0] - b[0], a[1] - b[1])
 
 
 def overlap_check(center1, center2, rad1, rad2):
@@ -226,23 +223,167 @@ def overlap_check(center1, center2, rad1, rad2):
     return res, d
 
 
-def check_collision_circle_rect(circle_center, circle_radius,
-                                rect_origin, rect_width, rect_height):
+def check_collision_circle_rect(circle_x, circle_y, circle_radius,
+                                rect_x, rect_y, rect_width, rect_height):
+    """Check if a circle collides with an axis aligned rectangle.
+    The rectangle is described by its origin and its size."""
 
     # calc the closest point in the rectangle to the robot
-    closest_point = QPointF(limit(circle_center.x(), rect_origin.x(),
-                                  rect_origin.x() + rect_width - 1),
-                            limit(circle_center.y(), rect_origin.y(),
-                                  rect_origin.y() + rect_height - 1))
+    closest_x = limit(circle_x, rect_x, rect_x + rect_width - 1)
+    closest_y = limit(circle_y, rect_y, rect_y + rect_height - 1)
 
     # get distances on x-axis and y-axis
-    dx = abs(closest_point.x() - circle_center.x())
-    dy = abs(closest_point.y() - circle_center.y())
+    dx = closest_x - circle_x
+    dy = closest_y - circle_y
+
+    # the actual distance is smaller than the radius
+    # if its square is smaller than the squared radius
+    return dx * dx + dy * dy < circle_radius * circle_radius
+
+
+def check_collision_circle_rects(circle_x, circle_y, circle_radius, rects):
+    """
+    Numpy version of check_collision_circle_rect.
+    Check a circle against all rectangles of a (n, 4)-array
+    with rows (rect_x, rect_y, rect_width, rect_height).
+    The circle center may be given as scalars or as arrays of length n,
+    to test different centers for each rectangle.
+    Returns a boolean array; the entry at index i belongs to rects[i].
+    """
+    rect_x = rects[:, 0]
+    rect_y = rects[:, 1]
+
+    # calc the closest points in the rectangles to the circle
+    closest_x = np.clip(circle_x, rect_x, rect_x + rects[:, 2] - 1)
+    closest_y = np.clip(circle_y, rect_y, rect_y + rects[:, 3] - 1)
+
+    dx = closest_x - circle_x
+    dy = closest_y - circle_y
+
+    return dx * dx + dy * dy < circle_radius * circle_radius
+
+
+def ray_circle_distance(point, ray_vector, circle):
+    """Return the distance along a ray (point and unit direction vector)
+    at which it enters a circle (tuple of (xpos, ypos, radius)),
+    0 if the ray starts inside of it, None if it misses the circle."""
+    px, py = point
+    dx, dy = ray_vector
+    cx, cy, cr = circle
+
+    # |point + t * ray_vector - center| = radius with |ray_vector| = 1
+    fx = px - cx
+    fy = py - cy
+    b = fx * dx + fy * dy
+    c = fx * fx + fy * fy - cr * cr
+    if c <= 0:
+        return 0.0
 
-    # calc the actual distance
-    dist = math.sqrt(dx ** 2 + dy ** 2)
+    discriminant = b * b - c
+    if discriminant < 0:
+        return None
+    t = -b - math.sqrt(discriminant)
+    return t if t >= 0 else None
+
+
+def traverse_tiles(point, ray_vector, max_distance, tile_size, tile_count):
+    """Yield the tiles a ray (point and unit direction vector) crosses
+    up to max_distance in order as tuples
+    (tile x, tile y, distance at which the ray enters the tile).
+    Stops at the border of the grid.
+    Each step only moves to the next tile border the ray crosses,
+    see Amanatides and Woo, A Fast Voxel Traversal Algorithm."""
+    x, y = point
+    dx, dy = ray_vector
+    tile_x = int(x // tile_size)
+    tile_y = int(y // tile_size)
+
+    # distance to the next vertical and horizontal tile border,
+    # and between two of them
+    step_x = 1 if dx > 0 else -1
+    if dx:
+        next_x = ((tile_x + (dx > 0)) * tile_size - x) / dx
+        delta_x = tile_size / abs(dx)
+    else:
+        next_x = delta_x = math.inf
+    step_y = 1 if dy > 0 else -1
+    if dy:
+        next_y = ((tile_y + (dy > 0)) * tile_size - y) / dy
+        delta_y = tile_size / abs(dy)
+    else:
+        next_y = delta_y = math.inf
+
+    distance = 0.0
+    while (0 <= tile_x < tile_count and 0 <= tile_y < tile_count and
+           distance <= max_distance):
+        yield tile_x, tile_y, distance
+        if next_x < next_y:
+            distance = next_x
+            next_x += delta_x
+            tile_x += step_x
+        else:
+            distance = next_y
+            next_y += delta_y
+            tile_y += step_y
+
+
+class SpatialGrid:
+    """
+    Simple spatial index: a uniform grid of square cells over points.
+    Queries for the nearest points only visit the cells around
+    the query point instead of all points.
+    """
 
-    return dist < circle_radius
+    def __init__(self, points, cell_size):
+        self.cell_size = cell_size
+        self.points = [tuple(p) for p in points]
+
+        self.cells = defaultdict(list)
+        for index, (x, y) in enumerate(self.points):
+            self.cells[self.cell_of(x, y)].append(index)
+
+        # bounds of the occupied cells to stop the search
+        if self.cells:
+            cell_xs, cell_ys = zip(*self.cells)
+            self.bounds = (min(cell_xs), min(cell_ys),
+                           max(cell_xs), max(cell_ys))
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def nearest(self, point, k, exclude=()):
+        """Return the indices of the k points nearest to point,
+        nearest first. Indices in exclude are skipped."""
+        if k <= 0 or not self.cells:
+            return []
+
+        px, py = point
+        cx, cy = self.cell_of(px, py)
+        min_x, min_y, max_x, max_y = self.bounds
+        max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+
+        found = []
+        for ring in range(max_ring + 1):
+            # visit all cells with chebyshev distance ring from the center
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in range(cy - ring, cy + ring + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != ring:
+                        continue
+                    for index in self.cells.get((gx, gy), ()):
+                        if index in exclude:
+                            continue
+                        x, y = self.points[index]
+                        found.append((math.hypot(x - px, y - py), index))
+
+            # points in cells outside the ring are at least
+            # ring * cell_size away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * self.cell_size:
+                    break
+
+        found.sort()
+        return [index for _, index in found[:k]]
 
 
 def vector_from_angle(angle):
@@ -271,8 +412,26 @@ def limit(value, min_limit, max_limit):
 
 # event management helper functions:
 # ==================================
+
+# Optional asyncio event loop for timers, see set_timer_loop.
+_timer_loop = None
+
+
+def set_timer_loop(loop):
+    """Let execute_after schedule its calls on an asyncio event loop
+    instead of starting a thread per call. None restores threads."""
+    global _timer_loop
+    _timer_loop = loop
+
+
 def execute_after(secs: float, func):
-    """Execute func after given amount of seconds in another thread."""
+    """Execute func after given amount of seconds in another thread,
+    or on the timer loop, if one is set."""
+    loop = _timer_loop
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.call_later, secs, func)
+        return
+
     def wait_and_call(secs, func):
         time.sleep(secs)
         func()
@@ -0,0 +1,247 @@
+import random
+
+import numpy as np
+
+import movement
+from ai_control import RobotControl, SensorData
+from model import BaseRobot
+from simulation import Simulation
+
+# ==================================
+# Vector Environment
+# ==================================
+#
+# In this file, you will find an environment for AI training and
+# parameter search: K independent simulations of the same level and
+# robot config are stepped in lockstep.
+# Robot units selected as controlled don't use their movement AI.
+# Their acceleration values are given as one batched numpy array
+# for all worlds instead. In return, the messages sent to these robots
+# are collected into batched numpy observations.
+# All other robot units keep their movement AI.
+# The worlds run without AI threads, see Simulation.start.
+#
+# Example:
+#   env = VectorEnv(16, controlled=[0])
+#   obs = env.reset()
+#   for _ in range(1000):
+#       obs = env.step(np.random.uniform(-10, 10, env.action_shape))
+#
+# A scripted policy for comparison: drive to the center of the board.
+#   obs = env.step(env.destination_actions((500, 500)))
+#
+# CHANGE HERE:
+# - content of the observations
+# - reset behaviour
+
+
+class EnvControl(RobotControl):
+    """AI control for robots controlled by the VectorEnv.
+    Instead of calling a movement AI, messages are written into
+    the environment's observation arrays.
+    The acceleration values are set by the environment."""
+
+    def __init__(self, base_robot, env, world, slot):
+        super().__init__(base_robot)
+
+        self.env = env
+        self.world = world
+        self.slot = slot
+
+    def process_data(self, signal):
+        obs = self.env.observations
+        k, r = self.world, self.slot
+        t = signal.message_type
+
+        if t == SensorData.POSITION_STRING:
+            obs['position'][k, r] = signal.data
+
+        elif t == SensorData.VISION_STRING:
+            board_data, robot_data = signal.data
+
+            # nearest obstacle seen: distance and type
+            if board_data:
+                _, obst_type, dist = min(board_data, key=lambda o: o[2])
+                obs['obstacle'][k, r] = dist, obst_type
+            else:
+                obs['obstacle'][k, r] = -1, -1
+
+            # every robot: seen, x, y, distance
+            robots = obs['robots'][k, r]
+            robots[:] = 0
+            for index, seen in enumerate(robot_data):
+                if seen:
+                    (x, y), dist = seen
+                    robots[index] = 1, x, y, dist
+
+        elif t == SensorData.ALERT_STRING:
+            if isinstance(signal.data, dict):
+                # only the robots of interest, see alert_k_nearest
+                alert = obs['alert'][k, r]
+                alert[:] = 0
+                for index, position in signal.data.items():
+                    alert[index] = position
+            else:
+                obs['alert'][k, r] = signal.data
+
+        elif t == SensorData.ENCODED_VISION_STRING:
+            obs['encoded_vision'][k, r] = signal.data
+
+
+class VectorEnv:
+    """Steps num_envs simulations at once.
+    controlled is a list of robot indices whose acceleration values are
+    set by step. By default, all robots are controlled.
+
+    Observations are a dict of float32 arrays with shape
+    (num_envs, len(controlled), ...):
+    - position: x, y, alpha, v, v_alpha from the last position message
+    - obstacle: distance and type of the nearest obstacle seen,
+      -1 if there is none
+    - robots: for every robot: seen (0/1), x, y, distance
+      from the last vision message
+    - alert: for every robot: x, y from the last alert message,
+      only updated if the robot's alert flag is set,
+      0 for robots not part of the message
+    - status: life, dead, kills, deaths of the robot
+    - encoded_vision: only if encode_vision is True,
+      the encoded vision message, see vision_encoder module
+
+    The state of all robots is available as arrays with shape
+    (num_envs, robot_count) in the attribute state.
+    """
+
+    STATE_KEYS = ('x', 'y', 'alpha', 'v', 'v_alpha', 'life', 'dead')
+
+    def __init__(self, num_envs, level_name='level1.txt', robot_config=None,
+                 controlled=None, encode_vision=False):
+        self.num_envs = num_envs
+        self.worlds = [Simulation(level_name, robot_config)
+                       for _ in range(num_envs)]
+
+        self.robot_count = len(self.worlds[0].robots)
+        if controlled is None:
+            controlled = range(self.robot_count)
+        self.controlled = list(controlled)
+
+        k, c, n = num_envs, len(self.controlled), self.robot_count
+        self.observations = dict(
+            position=np.zeros((k, c, 5), dtype=np.float32),
+            obstacle=np.full((k, c, 2), -1, dtype=np.float32),
+            robots=np.zeros((k, c, n, 4), dtype=np.float32),
+            alert=np.zeros((k, c, n, 2), dtype=np.float32),
+            status=np.zeros((k, c, 4), dtype=np.float32))
+        if encode_vision:
+            size = self.worlds[0].vision_encoder.size
+            self.observations['encoded_vision'] = np.zeros((k, c, size),
+                                                           dtype=np.float32)
+
+        self.state = {key: np.zeros((k, n), dtype=np.float32)
+                      for key in VectorEnv.STATE_KEYS}
+
+        # turn limits of the controlled robots, the same in every world
+        self.a_alpha_max = np.array([self.worlds[0].robots[i].a_alpha_max
+                                     for i in self.controlled])
+
+        self.controls = []
+        for world_index, world in enumerate(self.worlds):
+            controls = []
+            for slot, robot_index in enumerate(self.controlled):
+                robot = world.robots[robot_index]
+                controls.append(self._take_control(robot, world_index, slot))
+                robot.set_encoded_vision_flag(encode_vision)
+            self.controls.append(controls)
+
+            world.start(threaded=False)
+
+        # Every reset returns to the state before the first tick.
+        self._initial = [world.snapshot() for world in self.worlds]
+
+    @property
+    def action_shape(self):
+        """Shape of the action array accepted by step."""
+        return self.num_envs, len(self.controlled), 2
+
+    def _take_control(self, robot, world_index, slot):
+        """Replace the AI control of the robot unit with an EnvControl."""
+        base_robot = BaseRobot(robot.radius, robot.a_max, robot.a_alpha_max,
+                               robot.v_max, robot.v_alpha_max,
+                               robot.fov_angle, robot.max_life,
+                               robot.respawn_timer, robot.immunity_timer)
+        control = EnvControl(base_robot, self, world_index, slot)
+        control.setup_gun_interface(robot.robot_control.gun_interface)
+
+        robot.robot_control = control
+        # EnvControl has no delta decoder: send full messages
+        robot.delta_encoder = None
+        # keyboard controls would take priority
+        if robot.player_control:
+            robot.hand_control_to_robot()
+
+        return control
+
+    def reset(self, indices=None):
+        """Reset the worlds with given indices (default: all)
+        to their initial state. Return the observations."""
+        if indices is None:
+            indices = range(self.num_envs)
+
+        # the random number generator is shared by all worlds
+        random_state = random.getstate()
+        for index in indices:
+            self.worlds[index].restore(self._initial[index])
+            for key in self.observations:
+                self.observations[key][index] = 0
+            self.observations['obstacle'][index] = -1
+        random.setstate(random_state)
+
+        self._update_state()
+        return self.observations
+
+    def step(self, actions):
+        """Perform one tick in every world.
+        actions is an array of shape action_shape,
+        holding a and a_alpha for every controlled robot.
+        Return the observations."""
+        actions = np.asarray(actions, dtype=float)
+        if actions.shape != self.action_shape:
+            raise ValueError(f'Expected actions of shape {self.action_shape}, '
+                             f'got {actions.shape}.')
+
+        for controls, world_actions, world in zip(self.controls,
+                                                  actions.tolist(),
+                                                  self.worlds):
+            for control, (a, a_alpha) in zip(controls, world_actions):
+                control.a = a
+                control.a_alpha = a_alpha
+            world.step()
+
+        self._update_state()
+        return self.observations
+
+    def destination_actions(self, destinations):
+        """Scripted policy: actions that move every controlled robot
+        towards its destination, like position_destination_robot.
+        destinations are x, y broadcastable to shape
+        (num_envs, len(controlled), 2)."""
+        state = {key: self.state[key][:, self.controlled]
+                 for key in ('x', 'y', 'alpha', 'v', 'v_alpha')}
+        destinations = np.broadcast_to(destinations,
+                                       self.action_shape).astype(float)
+        a, a_alpha = movement.destination_actions(
+            state['x'], state['y'], state['alpha'], state['v'],
+            state['v_alpha'], destinations, self.a_alpha_max)
+        return np.stack((a, a_alpha), axis=-1)
+
+    def _update_state(self):
+        rows = [[(r.x, r.y, r.alpha, r.v, r.v_alpha, r.life, r.dead)
+                 for r in world.robots] for world in self.worlds]
+        table = np.array(rows, dtype=np.float32)
+        for index, key in enumerate(VectorEnv.STATE_KEYS):
+            self.state[key] = table[:, :, index]
+
+        status = self.observations['status']
+        status[:, :, 0:2] = table[:, self.controlled, 5:7]
+        status[:, :, 2:4] = [[(world.robots[i].kills, world.robots[i].deaths)
+                              for i in self.controlled]
+                             for world in self.worlds]
@@ -0,0 +1,127 @@
+import numpy as np
+
+# ==================================
+# Vision Encoder
+# ==================================
+#
+# In this file, you will find the encoder for the optional
+# encoded vision message: Instead of lists of tuples, the robot's
+# vision is described by a float32 array of fixed size.
+# The field of view is split into angle bins of the same width.
+# For each bin, the distance and the type of the nearest obstacle
+# in the bin are stored.
+# For each robot, the array contains whether it is seen,
+# its bearing and distance.
+# All obstacles are handled at once with numpy.
+#
+# Layout of the array (BINS bins, N robots):
+#   [0, BINS)               distance of the nearest obstacle in the bin
+#                           divided by FIELD_SIZE, -1 if the bin is empty
+#   [BINS, 2 BINS)          type of the nearest obstacle, 0 if the bin is empty
+#   [2 BINS + 3 i + 0]      1 if robot i is seen, else 0
+#   [2 BINS + 3 i + 1]      bearing of robot i relative to the
+#                           viewing direction in deg divided by 180,
+#                           positive values are clockwise
+#   [2 BINS + 3 i + 2]      distance of robot i divided by FIELD_SIZE
+# The entries of robots not seen are 0.
+#
+# CHANGE HERE:
+# - number of bins
+# - channels of the encoded vision
+
+
+class VisionEncoder:
+    """Encodes the vision of robot units into fixed-size float32 arrays."""
+
+    BINS = 16
+
+    def __init__(self, obstacle_list, obstacle_types, tile_size, field_size,
+                 robot_count, bins=BINS):
+        self.bins = bins
+        self.robot_count = robot_count
+        self.field_size = field_size
+
+        # center points and types of all obstacles
+        self.points = np.asarray(obstacle_list, dtype=float).reshape(-1, 2)
+        self.points = self.points * tile_size + tile_size / 2
+        self.types = np.asarray(obstacle_types, dtype=np.float32)
+
+    @property
+    def size(self):
+        """Length of the encoded arrays."""
+        return 2 * self.bins + 3 * self.robot_count
+
+    @staticmethod
+    def bearings(points, x, y, alpha):
+        """Angles in deg between the viewing direction alpha
+        and the directions from (x, y) to the points, in [-180, 180).
+        Note: The function works with permanently inverted y-direction.
+        """
+        dx = points[..., 0] - x
+        dy = points[..., 1] - y
+        angles = np.degrees(np.arctan2(dy, dx)) + 90
+        return (angles - alpha + 180) % 360 - 180
+
+    def encode(self, robot, robots, robots_seen):
+        """Encode the vision of robot.
+        robots_seen contains an entry for every robot in robots,
+        which is False if the robot is not seen,
+        like the result of Simulation.calculate_vision_robots.
+        """
+        out = np.zeros(self.size, dtype=np.float32)
+        bins = self.bins
+        half_fov = robot.fov_angle / 2
+
+        # obstacles
+        # ---------
+        out[:bins] = -1
+
+        bearings = VisionEncoder.bearings(self.points, robot.x, robot.y,
+                                          robot.alpha)
+        seen = np.abs(bearings) <= half_fov
+        if seen.any():
+            bearings = bearings[seen]
+            distances = np.hypot(self.points[seen, 0] - robot.x,
+                                 self.points[seen, 1] - robot.y)
+            types = self.types[seen]
+
+            bin_width = robot.fov_angle / bins
+            indices = ((bearings + half_fov) // bin_width).astype(int)
+            indices = np.clip(indices, 0, bins - 1)
+
+            # sort by bin, then by distance: the first entry of a bin
+            # is the nearest obstacle
+            order = np.lexsort((distances, indices))
+            used, first = np.unique(indices[order], return_index=True)
+            nearest = order[first]
+
+            out[used] = distances[nearest] / self.field_size
+            out[bins + used] = types[nearest]
+
+        # robots
+        # ------
+        for index, val in enumerate(robots_seen):
+            if not val:
+                continue
+            (x, y), dist = val
+            other = robots[index]
+            if other is robot:
+                bearing = 0
+            else:
+                bearing = VisionEncoder.bearings(np.array((x, y)), robot.x,
+                                                 robot.y, robot.alpha)
+            offset = 2 * bins + 3 * index
+            out[offset:offset + 3] = 1, bearing / 180, dist / self.field_size
+
+        return out
+
+
+def decode_robots(encoded, bins=VisionEncoder.BINS):
+    """Return the robot channels of an encoded vision array
+    as array of shape (robot_count, 3): seen, bearing, distance."""
+    return np.asarray(encoded)[2 * bins:].reshape(-1, 3)
+
+
+def bin_center(index, fov_angle, bins=VisionEncoder.BINS):
+    """Bearing in deg of the center of an angle bin."""
+    return -fov_angle / 2 + (index + 0.5) * fov_angle / bins